@@ -1,15 +1,26 @@
 import os
 import httpx
 import asyncio
-from google import genai
-from google.genai import types as gemini_types
 from httpx import HTTPStatusError, ConnectError
 
+from app.deadline import DeadlineExceeded, budget, with_deadline
+from app.log import get_logger
+from app.metrics import provider_call
+from app.providers import lazy_import, provider_enabled
+
+log = get_logger(__name__)
+
 # --- Configuration ---
 OPENAI_CHAT_MODEL = 'gpt-3.5-turbo'
 GEMINI_CHAT_MODEL = 'gemini-2.5-flash'
 OPENAI_EMBEDDING_MODEL = 'text-embedding-3-small'
 GEMINI_EMBEDDING_MODEL = 'text-embedding-004' 
+# upper bound for one provider attempt; the request / job deadline (app.deadline) may leave less
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "30"))
+
+# Override to point at a proxy, a compatible gateway or a local stand-in (app.scripts.bench_stubs)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 
 # --- Core API Calls (Individual Provider Functions) ---
 
@@ -26,15 +37,23 @@ async def _generate_text_openai(api_key: str, prompt: str, model: str = OPENAI_C
         "temperature": 0.7,
     }
     
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post('https://api.openai.com/v1/chat/completions', json=payload, headers=headers)
-        r.raise_for_status() 
+    timeout = budget(AI_REQUEST_TIMEOUT)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        with provider_call("openai", "chat"):
+            r = await with_deadline(client.post(f'{OPENAI_BASE_URL}/chat/completions', json=payload, headers=headers), timeout)
+            r.raise_for_status() 
         data = r.json()
         return data['choices'][0]['message']['content']
 
 
-from google.genai import types as gemini_types # Ensure this is imported
-from google.genai.types import HarmCategory, HarmBlockThreshold # Import these specific enums
+def _gemini_client(api_key: str):
+    # google.genai adds ~0.2s of imports, so it is loaded on the first Gemini call (app.providers)
+    genai = lazy_import("google.genai")
+    # runs in a worker thread, where the caller's deadline is still visible; the SDK takes milliseconds
+    timeout = budget(AI_REQUEST_TIMEOUT)
+    options = genai.types.HttpOptions(base_url=GEMINI_BASE_URL, timeout=int(timeout * 1000) if timeout else None)
+    return genai.Client(api_key=api_key, http_options=options)
+
 
 def _generate_text_gemini(api_key: str, prompt: str, model: str = GEMINI_CHAT_MODEL) -> str:
     """Internal synchronous function to call the Gemini API using the SDK with relaxed safety settings."""
@@ -42,7 +61,9 @@ def _generate_text_gemini(api_key: str, prompt: str, model: str = GEMINI_CHAT_MO
         raise ValueError("Gemini API key is missing or invalid.") 
 
     try:
-        client = genai.Client(api_key=api_key)
+        client = _gemini_client(api_key)
+        gemini_types = lazy_import("google.genai.types")
+        HarmCategory, HarmBlockThreshold = gemini_types.HarmCategory, gemini_types.HarmBlockThreshold
         
         # --- START OF MODIFICATION: RELAX SAFETY SETTINGS ---
         safety_settings = [
@@ -71,26 +92,29 @@ def _generate_text_gemini(api_key: str, prompt: str, model: str = GEMINI_CHAT_MO
 )
         # --- END OF MODIFICATION ---
         
-        response = client.models.generate_content(
-            model=model,
-            contents=[prompt],
-            config=config,
-        )
+        with provider_call("gemini", "chat"):
+            response = client.models.generate_content(
+                model=model,
+                contents=[prompt],
+                config=config,
+            )
         
         if not response.text:
             # Check the actual finish reason if it's still blocked
             finish_reason = response.candidates[0].finish_reason.name if response.candidates else "N/A"
             safety_ratings = response.candidates[0].safety_ratings if response.candidates else "N/A"
             
-            print(f"DEBUG: Gemini blocked content. Finish Reason: {finish_reason}, Safety: {safety_ratings}")
+            log.warning("gemini returned no text", extra={"finish_reason": finish_reason, "safety": str(safety_ratings)})
             raise RuntimeError("Gemini API returned no text (Content Blocked).")
 
         return response.text
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         error_type = e.__class__.__name__
         error_details = str(e)
-        print(f"ADAPTER DEBUG CONSOLE: Real Gemini SDK Error: {error_type}: {error_details}")
+        log.debug("gemini sdk error", extra={"error_type": error_type, "error": error_details})
         raise RuntimeError(f"Gemini SDK failed: {error_type} - {error_details}")
 
 async def _get_embeddings_openai(api_key: str, text: str, model: str = OPENAI_EMBEDDING_MODEL) -> list[float]:
@@ -99,13 +123,15 @@ async def _get_embeddings_openai(api_key: str, text: str, model: str = OPENAI_EM
         raise ValueError("OpenAI API key is missing or invalid.")
         
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(
-            'https://api.openai.com/v1/embeddings', 
-            json={"model": model, "input": text}, 
-            headers=headers
-        )
-        r.raise_for_status()
+    timeout = budget(AI_REQUEST_TIMEOUT)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        with provider_call("openai", "embeddings"):
+            r = await with_deadline(client.post(
+                f'{OPENAI_BASE_URL}/embeddings', 
+                json={"model": model, "input": text}, 
+                headers=headers
+            ), timeout)
+            r.raise_for_status()
         data = r.json()
         return data['data'][0]['embedding']
 
@@ -116,13 +142,16 @@ def _get_embeddings_gemini(api_key: str, text: str, model: str = GEMINI_EMBEDDIN
         raise ValueError("Gemini API key is missing or invalid.")
 
     try:
-        client = genai.Client(api_key=api_key)
-        result = client.models.embed_content(
-            model=model,
-            content=text,
-            task_type="RETRIEVAL_DOCUMENT"
-        )
+        client = _gemini_client(api_key)
+        with provider_call("gemini", "embeddings"):
+            result = client.models.embed_content(
+                model=model,
+                content=text,
+                task_type="RETRIEVAL_DOCUMENT"
+            )
         return result.embedding
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise RuntimeError(f"Gemini Embeddings SDK failed: {e.__class__.__name__} - {str(e)}")
 
@@ -132,14 +161,18 @@ async def generate_text(openai_key: str, gemini_key: str, prompt: str, model: st
     """
     Primary AI generation function with failover.
     Attempts to use OpenAI first. If it fails, falls back to Gemini.
+    Each attempt only gets what is left of the caller's deadline; once it has passed,
+    DeadlineExceeded is raised instead of trying the next provider.
     """
     last_error = None
 
     # 1. Primary Attempt: OpenAI
-    if openai_key:
+    if openai_key and provider_enabled("openai"):
         try:
-            print("Adapter: Attempting OpenAI (Primary)...")
+            log.debug("ai attempt", extra={"provider": "openai", "operation": "chat", "role": "primary"})
             return await _generate_text_openai(openai_key, prompt, model)
+        except DeadlineExceeded:
+            raise
         except (HTTPStatusError, ConnectError, ValueError) as e:
             # **DEBUGGING LINE 3:** Log specific OpenAI network/status error
             error_details = str(e)
@@ -147,25 +180,27 @@ async def generate_text(openai_key: str, gemini_key: str, prompt: str, model: st
                 error_details = f"{e.response.status_code} {e.response.reason_phrase}"
             
             last_error = f"OpenAI failed: {e.__class__.__name__} ({error_details})"
-            print(f"Adapter: ❌ {last_error}. Falling back to Gemini.")
+            log.warning("ai provider failed, falling back", extra={"provider": "openai", "operation": "chat", "error": last_error})
         except Exception as e:
             last_error = f"OpenAI failed: {e.__class__.__name__}"
-            print(f"Adapter: ❌ {last_error}. Falling back to Gemini.")
+            log.warning("ai provider failed, falling back", extra={"provider": "openai", "operation": "chat", "error": last_error})
     else:
-        print("Adapter: OpenAI key missing. Skipping primary attempt.")
+        log.debug("ai provider skipped", extra={"provider": "openai", "operation": "chat", "reason": "no key or disabled"})
 
     # 2. Backup Attempt: Gemini
-    if gemini_key:
+    if gemini_key and provider_enabled("gemini"):
         try:
-            print("Adapter: Attempting Gemini (Backup)...")
+            log.debug("ai attempt", extra={"provider": "gemini", "operation": "chat", "role": "backup"})
             # Run the synchronous Gemini call in a thread pool
-            return await asyncio.to_thread(_generate_text_gemini, gemini_key, prompt, GEMINI_CHAT_MODEL)
+            return await with_deadline(asyncio.to_thread(_generate_text_gemini, gemini_key, prompt, GEMINI_CHAT_MODEL), AI_REQUEST_TIMEOUT)
+        except DeadlineExceeded:
+            raise
         except Exception as e_backup:
             # The error raised from _generate_text_gemini (which includes the specific reason) is caught here.
             last_error = f"Gemini also failed: {e_backup}" 
-            print(f"Adapter: ❌ {last_error}.")
+            log.warning("ai provider failed", extra={"provider": "gemini", "operation": "chat", "error": last_error})
     else:
-        print("Adapter: Gemini key also missing. No backup possible.")
+        log.debug("ai provider skipped", extra={"provider": "gemini", "operation": "chat", "reason": "no key or disabled"})
 
     # 3. Final Failure
     raise RuntimeError(f"All providers failed to generate text. Last error: {last_error or 'No keys provided.'}")
@@ -175,37 +210,42 @@ async def get_embeddings(openai_key: str, gemini_key: str, text: str) -> list[fl
     """
     Primary embedding function with failover.
     Attempts to use OpenAI first. If it fails, falls back to Gemini.
+    Bounded by the caller's deadline like generate_text.
     """
     last_error = None
     
     # 1. Primary Attempt: OpenAI
-    if openai_key:
+    if openai_key and provider_enabled("openai"):
         try:
-            print("Adapter: Attempting OpenAI Embeddings (Primary)...")
+            log.debug("ai attempt", extra={"provider": "openai", "operation": "embeddings", "role": "primary"})
             return await _get_embeddings_openai(openai_key, text)
+        except DeadlineExceeded:
+            raise
         except (HTTPStatusError, ConnectError, ValueError) as e:
             error_details = str(e)
             if isinstance(e, HTTPStatusError):
                 error_details = f"{e.response.status_code} {e.response.reason_phrase}"
             
             last_error = f"OpenAI Embeddings failed: {e.__class__.__name__} ({error_details})"
-            print(f"Adapter: ❌ {last_error}. Falling back to Gemini.")
+            log.warning("ai provider failed, falling back", extra={"provider": "openai", "operation": "embeddings", "error": last_error})
         except Exception as e:
             last_error = f"OpenAI Embeddings failed: {e.__class__.__name__}"
-            print(f"Adapter: ❌ {last_error}. Falling back to Gemini.")
+            log.warning("ai provider failed, falling back", extra={"provider": "openai", "operation": "embeddings", "error": last_error})
     else:
-        print("Adapter: OpenAI key missing for embeddings. Skipping primary attempt.")
+        log.debug("ai provider skipped", extra={"provider": "openai", "operation": "embeddings", "reason": "no key or disabled"})
 
     # 2. Backup Attempt: Gemini
-    if gemini_key:
+    if gemini_key and provider_enabled("gemini"):
         try:
-            print("Adapter: Attempting Gemini Embeddings (Backup)...")
-            return await asyncio.to_thread(_get_embeddings_gemini, gemini_key, text)
+            log.debug("ai attempt", extra={"provider": "gemini", "operation": "embeddings", "role": "backup"})
+            return await with_deadline(asyncio.to_thread(_get_embeddings_gemini, gemini_key, text), AI_REQUEST_TIMEOUT)
+        except DeadlineExceeded:
+            raise
         except Exception as e_backup:
             last_error = f"Gemini Embeddings also failed: {e_backup}" 
-            print(f"Adapter: ❌ {last_error}.")
+            log.warning("ai provider failed", extra={"provider": "gemini", "operation": "embeddings", "error": last_error})
     else:
-        print("Adapter: Gemini key also missing. No backup possible for embeddings.")
+        log.debug("ai provider skipped", extra={"provider": "gemini", "operation": "embeddings", "reason": "no key or disabled"})
 
     # 3. Final Failure
     raise RuntimeError(f"All providers failed to generate embeddings. Last error: {last_error or 'No keys provided.'}")
\ No newline at end of file
@@ -0,0 +1,135 @@
+# app/analytics.py
+"""
+Provider analytics fetch helpers used by /analytics/overview.
+
+- All accounts are fetched concurrently through the shared httpx client (app.utils.http)
+- Each provider has its own concurrency limit so a user with many accounts can't flood one API
+- Every provider call gets a deadline; accounts that time out are reported under
+  "<provider>_errors" and the rest of the overview is still returned (partial result)
+- `analytics_cache` coalesces identical concurrent requests (per user + endpoint) and keeps
+  results for a short TTL with stale-while-revalidate
+"""
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.metrics import provider_call
+from app.providers import provider_enabled
+from app.utils.crypto import fernet
+from app.utils.http import get_http_client
+from app.utils.singleflight import SingleFlightCache
+
+YOUTUBE_CHANNELS_URL = os.getenv("YOUTUBE_CHANNELS_URL", "https://www.googleapis.com/youtube/v3/channels")
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v18.0")
+
+# Seconds allowed for a single provider call (including time spent waiting for a slot)
+ANALYTICS_CALL_TIMEOUT = float(os.getenv("ANALYTICS_CALL_TIMEOUT", "8"))
+
+# Max in-flight calls per provider, per process
+PROVIDER_CONCURRENCY = {
+    "youtube": int(os.getenv("ANALYTICS_CONCURRENCY_YOUTUBE", "10")),
+    "instagram": int(os.getenv("ANALYTICS_CONCURRENCY_INSTAGRAM", "5")),
+}
+
+# Fresh for ANALYTICS_CACHE_TTL seconds, then served stale (while one refresh runs) for ANALYTICS_CACHE_STALE_TTL more
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+ANALYTICS_CACHE_STALE_TTL = float(os.getenv("ANALYTICS_CACHE_STALE_TTL", "90"))
+
+# Shared by /analytics/overview and /youtube/analytics; keys are (endpoint, user_id)
+analytics_cache = SingleFlightCache(ttl=ANALYTICS_CACHE_TTL, stale_ttl=ANALYTICS_CACHE_STALE_TTL)
+
+
+_semaphores: Dict[str, asyncio.Semaphore] = {
+    prov: asyncio.Semaphore(limit) for prov, limit in PROVIDER_CONCURRENCY.items()
+}
+
+
+def invalidate_user_analytics(user_id: str):
+    """Call whenever the user's social_accounts rows change: both cached views list their accounts."""
+    for endpoint in ("analytics_overview", "youtube_analytics"):
+        analytics_cache.invalidate((endpoint, user_id))
+
+
+def decrypt_access_token(row) -> Optional[str]:
+    """Decrypts social_accounts.access_token; returns None if missing or undecryptable."""
+    enc = row["access_token"]
+    if not enc:
+        return None
+    try:
+        return fernet.decrypt(enc.encode()).decode()
+    except Exception:
+        return None
+
+
+async def fetch_provider_stats(
+    client: httpx.AsyncClient,
+    provider: str,
+    provider_user_id: str,
+    access_token: str,
+    youtube_parts: str = "statistics,snippet",
+    timeout: float = ANALYTICS_CALL_TIMEOUT,
+    etag: Optional[str] = None,
+) -> httpx.Response:
+    """
+    Fetch channel/profile statistics for one account.
+    With `etag` set the request is conditional (If-None-Match); callers must handle 304.
+    Raises asyncio.TimeoutError if the provider slot + request don't finish within `timeout`.
+    """
+    if provider == "youtube":
+        url = YOUTUBE_CHANNELS_URL
+        params = {"part": youtube_parts, "id": provider_user_id, "access_token": access_token}
+    elif provider == "instagram":
+        url = f"{GRAPH_API_URL}/{provider_user_id}"
+        params = {"fields": "username,followers_count,media_count", "access_token": access_token}
+    else:
+        raise ValueError(f"unsupported provider: {provider}")
+
+    headers = {"If-None-Match": etag} if etag else None
+
+    async def _call():
+        async with _semaphores[provider]:
+            return await client.get(url, params=params, headers=headers, timeout=timeout)
+
+    with provider_call(provider, "stats"):
+        return await asyncio.wait_for(_call(), timeout=timeout)
+
+
+async def _overview_for_account(client: httpx.AsyncClient, row) -> Dict[str, Any]:
+    prov = row["provider"]
+    access_blob = decrypt_access_token(row)
+    if prov not in PROVIDER_CONCURRENCY or not provider_enabled(prov) or not access_blob:
+        return {"provider": prov, "kind": "other"}
+    try:
+        resp = await fetch_provider_stats(client, prov, row["provider_user_id"], access_blob)
+    except asyncio.TimeoutError:
+        return {"provider": prov, "kind": "error", "error": f"timeout after {ANALYTICS_CALL_TIMEOUT}s", "timeout": True}
+    except Exception as e:
+        return {"provider": prov, "kind": "error", "error": str(e)}
+    if resp.status_code == 200:
+        return {"provider": prov, "kind": "ok", "data": resp.json()}
+    return {"provider": prov, "kind": "skipped"}
+
+
+async def build_overview(rows: List[Any]) -> Dict[str, Any]:
+    """
+    Fan out over all of a user's accounts at once and merge the results.
+    Output keeps the original shape: {"youtube": [...], "instagram": [...], "other": [...], "<prov>_errors": [...]},
+    plus "partial": true when at least one provider call timed out.
+    """
+    client = get_http_client()
+    outcomes = await asyncio.gather(*(_overview_for_account(client, r) for r in rows))
+
+    result: Dict[str, Any] = {}
+    for o in outcomes:
+        prov = o["provider"]
+        if o["kind"] == "ok":
+            result.setdefault(prov, []).append(o["data"])
+        elif o["kind"] == "other":
+            result.setdefault("other", []).append(prov)
+        elif o["kind"] == "error":
+            result.setdefault(f"{prov}_errors", []).append(o["error"])
+            if o.get("timeout"):
+                result["partial"] = True
+    return result
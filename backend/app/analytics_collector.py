@@ -0,0 +1,291 @@
+# app/analytics_collector.py
+"""
+Pipelined analytics collector used by run_analytics_worker (main.py).
+
+    accounts (keyset pages) -> fetch workers (bounded, shared client) -> writer (multi-row INSERT)
+
+- social_accounts is streamed in keyset pages (`id > :after ORDER BY id`) instead of fetch_all
+- COLLECT_CONCURRENCY fetch workers share the pooled httpx client; per-provider limits and
+  per-call deadlines come from app.analytics.fetch_provider_stats
+- the writer batches snapshots into one multi-row INSERT per SNAPSHOT_BATCH_SIZE rows
+  (or every SNAPSHOT_FLUSH_SECONDS, whichever comes first)
+- change-aware: requests are conditional (If-None-Match with the stored ETag), payloads are
+  normalized and hashed, and an unchanged payload only bumps last_seen_at instead of storing
+  another identical snapshot (state per account in analytics_fetch_state)
+- follower / view / media counts are extracted into typed columns and every observation
+  updates the hourly/daily/weekly rollups (app.analytics_rollups)
+- returns run stats, including accounts per second
+- optional `on_checkpoint(last_id)` is called once every account of a page has been fetched
+  and its snapshots written, so shard workers (app.analytics_shards) can resume after a crash
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.db import db
+from app.analytics import PROVIDER_CONCURRENCY, decrypt_access_token, fetch_provider_stats
+from app.analytics_rollups import extract_metrics, update_rollups
+from app.log import get_logger
+from app.metrics import record_analytics_run, track_analytics_queues
+from app.utils.http import get_http_client
+
+ACCOUNT_PAGE_SIZE = int(os.getenv("COLLECT_ACCOUNT_PAGE_SIZE", "500"))
+COLLECT_CONCURRENCY = int(os.getenv("COLLECT_CONCURRENCY", "32"))
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "200"))
+SNAPSHOT_FLUSH_SECONDS = float(os.getenv("SNAPSHOT_FLUSH_SECONDS", "1.0"))
+
+_DONE = object()
+log = get_logger(__name__)
+
+
+async def iter_account_pages(page_size: int = ACCOUNT_PAGE_SIZE, after_id: Optional[str] = None, shard: Optional[int] = None, shard_count: int = 1) -> AsyncIterator[List[Any]]:
+    """
+    Yields pages of social_accounts ordered by id, using the last id of each page as the cursor.
+    Each row carries the account's last ETag / payload hash (NULL if never collected).
+    With `shard` set, only accounts whose id hashes to that shard (out of `shard_count`) are returned.
+    """
+    clauses = []
+    values: Dict[str, Any] = {"lim": page_size}
+    if shard is not None:
+        # hashtext() is int4; mask the sign bit so the modulo is never negative
+        clauses.append("(hashtext(a.id::text) & 2147483647) % :shard_count = :shard")
+        values.update({"shard": shard, "shard_count": shard_count})
+    while True:
+        where = list(clauses)
+        page_values = dict(values)
+        if after_id is not None:
+            where.append("a.id > :after")
+            page_values["after"] = after_id
+        rows = await db.fetch_all(
+            "SELECT a.id, a.user_id, a.provider, a.provider_user_id, a.access_token, f.etag, f.payload_hash"
+            " FROM social_accounts a LEFT JOIN analytics_fetch_state f ON f.social_account_id = a.id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY a.id LIMIT :lim",
+            values=page_values,
+        )
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1]["id"]
+
+
+def normalize_payload(provider: str, text: str) -> Tuple[Any, str, str]:
+    """
+    Parsed payload, its canonical JSON (sorted keys, volatile fields dropped) and that JSON's sha256.
+    Two responses with the same numbers hash the same even if key order or etags differ.
+    """
+    data = json.loads(text)
+    if provider == "youtube" and isinstance(data, dict):
+        data.pop("etag", None)
+        for item in data.get("items") or []:
+            if isinstance(item, dict):
+                item.pop("etag", None)
+    normalized = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return data, normalized, hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _values_clause(rows: List[Dict[str, Any]], columns: List[str], template: str) -> Tuple[str, Dict[str, Any]]:
+    """Builds "(...), (...)" for a multi-row statement; `template` uses {i} for the row index."""
+    placeholders = []
+    values: Dict[str, Any] = {}
+    for i, r in enumerate(rows):
+        placeholders.append(template.format(i=i))
+        for c in columns:
+            values[f"{c}{i}"] = r[c]
+    return ", ".join(placeholders), values
+
+
+async def write_observations(batch: List[Dict[str, Any]]) -> int:
+    """
+    Persists one batch of fetch results in a single transaction:
+    - "changed": new snapshot rows (multi-row INSERT) + fetch state pointing at them
+    - "unchanged" (same hash) / "not_modified" (HTTP 304): no new snapshot, only last_seen_at is bumped
+    Returns the number of snapshots stored.
+    """
+    # one observation per account per batch (a resumed shard can see an account twice)
+    latest = {str(o["account_id"]): o for o in batch}
+    changed = [o for o in latest.values() if o["kind"] == "changed"]
+    stateful = [o for o in latest.values() if o["kind"] in ("changed", "unchanged")]
+    seen_ids = [o["account_id"] for o in latest.values() if o["kind"] in ("unchanged", "not_modified")]
+    observed_ids = [o["account_id"] for o in latest.values()]
+
+    async with db.transaction():
+        if changed:
+            clause, values = _values_clause(
+                changed, ["sid", "user_id", "account_id", "provider", "payload", "hash", "followers", "views", "media_count"],
+                "(:sid{i}, :user_id{i}, :account_id{i}, :provider{i}, :payload{i}, :hash{i}, :followers{i}, :views{i}, :media_count{i}, NOW(), NOW())",
+            )
+            await db.execute(
+                "INSERT INTO analytics_snapshots (id, user_id, social_account_id, provider, payload, payload_hash, followers, views, media_count, created_at, last_seen_at) VALUES " + clause,
+                values=values,
+            )
+        if stateful:
+            clause, values = _values_clause(
+                stateful, ["account_id", "etag", "hash", "sid", "followers", "views", "media_count"],
+                "(:account_id{i}, :etag{i}, :hash{i}, :sid{i}, :followers{i}, :views{i}, :media_count{i}, NOW())",
+            )
+            await db.execute(
+                "INSERT INTO analytics_fetch_state (social_account_id, etag, payload_hash, last_snapshot_id, followers, views, media_count, last_seen_at) VALUES " + clause + """
+                ON CONFLICT (social_account_id) DO UPDATE SET
+                    etag = EXCLUDED.etag,
+                    payload_hash = EXCLUDED.payload_hash,
+                    followers = EXCLUDED.followers,
+                    views = EXCLUDED.views,
+                    media_count = EXCLUDED.media_count,
+                    last_snapshot_id = COALESCE(EXCLUDED.last_snapshot_id, analytics_fetch_state.last_snapshot_id),
+                    last_seen_at = NOW()""",
+                values=values,
+            )
+        if seen_ids:
+            in_clause = ", ".join(f":a{i}" for i in range(len(seen_ids)))
+            seen_values = {f"a{i}": aid for i, aid in enumerate(seen_ids)}
+            await db.execute(f"UPDATE analytics_fetch_state SET last_seen_at = NOW() WHERE social_account_id IN ({in_clause})", values=seen_values)
+            await db.execute(
+                f"UPDATE analytics_snapshots SET last_seen_at = NOW() WHERE id IN (SELECT last_snapshot_id FROM analytics_fetch_state WHERE social_account_id IN ({in_clause}))",
+                values=seen_values,
+            )
+        await update_rollups(observed_ids)
+    return len(changed)
+
+
+class SnapshotWriteFailed(RuntimeError):
+    """A snapshot batch of the current page could not be written; its checkpoint must not be taken."""
+
+
+async def collect_analytics(
+    concurrency: int = COLLECT_CONCURRENCY,
+    batch_size: int = SNAPSHOT_BATCH_SIZE,
+    pages: Optional[AsyncIterator[List[Any]]] = None,
+    on_checkpoint: Optional[Callable[[Any], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    stats = {"accounts": 0, "fetched": 0, "snapshots": 0, "unchanged": 0, "not_modified": 0, "errors": 0, "skipped": 0}
+    started = time.monotonic()
+    client = get_http_client()
+    account_q: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    snapshot_q: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 2)
+    track_analytics_queues(account_q, snapshot_q)
+
+    async def produce():
+        async for page in (pages if pages is not None else iter_account_pages()):
+            for r in page:
+                stats["accounts"] += 1
+                await account_q.put(r)
+            if on_checkpoint is not None:
+                # drain: every account of this page fetched, every snapshot flushed. Raises
+                # SnapshotWriteFailed if any of them wasn't, so the shard resumes from the previous page
+                await account_q.join()
+                flushed = asyncio.get_running_loop().create_future()
+                await snapshot_q.put(flushed)
+                await flushed
+                await on_checkpoint(page[-1]["id"])
+        for _ in range(concurrency):
+            await account_q.put(_DONE)
+
+    async def fetch_worker():
+        while True:
+            r = await account_q.get()
+            try:
+                if r is _DONE:
+                    return
+                await _fetch_one(r)
+            finally:
+                account_q.task_done()
+
+    async def _fetch_one(r):
+        prov = r["provider"]
+        access_blob = decrypt_access_token(r)
+        if prov not in PROVIDER_CONCURRENCY or not access_blob:
+            stats["skipped"] += 1
+            return
+        try:
+            resp = await fetch_provider_stats(client, prov, r["provider_user_id"], access_blob, youtube_parts="statistics", etag=r["etag"])
+            obs = {"account_id": r["id"], "user_id": r["user_id"], "provider": prov}
+            if resp.status_code == 304:
+                stats["not_modified"] += 1
+                obs["kind"] = "not_modified"
+            elif resp.status_code == 200:
+                stats["fetched"] += 1
+                data, payload, digest = normalize_payload(prov, resp.text)
+                obs.update({"payload": payload, "hash": digest, "etag": resp.headers.get("etag")})
+                obs.update(extract_metrics(prov, data))
+                if digest == r["payload_hash"]:
+                    stats["unchanged"] += 1
+                    obs.update({"kind": "unchanged", "sid": None})
+                else:
+                    obs.update({"kind": "changed", "sid": str(uuid.uuid4())})
+            else:
+                stats["skipped"] += 1
+                return
+        except Exception as e:
+            stats["errors"] += 1
+            log.warning("analytics account failed", extra={"account_id": str(r["id"]), "provider": r["provider"], "error": repr(e)})
+            return
+        await snapshot_q.put(obs)
+
+    # set when a flush since the last checkpoint failed; that page must not be checkpointed
+    write_failed = False
+
+    async def write():
+        nonlocal write_failed
+        batch: List[Dict[str, Any]] = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SNAPSHOT_FLUSH_SECONDS
+        while True:
+            try:
+                item = await asyncio.wait_for(snapshot_q.get(), timeout=max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                item = None
+            if item is _DONE:
+                break
+            if isinstance(item, asyncio.Future):
+                # checkpoint marker: flush whatever is buffered, then release the producer
+                await _flush(batch)
+                batch = []
+                if write_failed:
+                    item.set_exception(SnapshotWriteFailed("snapshot insert failed; not checkpointing this page"))
+                else:
+                    item.set_result(None)
+                write_failed = False
+                continue
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= batch_size or (batch and loop.time() >= deadline):
+                await _flush(batch)
+                batch = []
+            if loop.time() >= deadline:
+                deadline = loop.time() + SNAPSHOT_FLUSH_SECONDS
+        await _flush(batch)
+
+    async def _flush(batch):
+        nonlocal write_failed
+        if not batch:
+            return
+        try:
+            stats["snapshots"] += await write_observations(batch)
+        except Exception as e:
+            write_failed = True
+            stats["errors"] += len(batch)
+            log.exception("analytics snapshot insert failed", extra={"batch": len(batch)})
+
+    writer = asyncio.create_task(write())
+    workers = [asyncio.create_task(fetch_worker()) for _ in range(concurrency)]
+    try:
+        await produce()
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+        await snapshot_q.put(_DONE)
+        await writer
+
+    elapsed = time.monotonic() - started
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["accounts_per_sec"] = round(stats["accounts"] / elapsed, 1) if elapsed > 0 else None
+    record_analytics_run(stats)
+    return stats
@@ -0,0 +1,148 @@
+# app/analytics_rollups.py
+"""
+Typed metrics, time-series rollups and range queries over analytics snapshots.
+
+- extract_metrics() pulls follower / view / media counts out of provider payloads; the collector
+  stores them in typed columns (analytics_snapshots, analytics_fetch_state)
+- update_rollups() maintains hourly, daily and weekly buckets in analytics_rollups incrementally:
+  every collected observation (changed or not) upserts its three buckets from the fetch state
+- query_series() reads rollups for a time range at the coarsest granularity that still gives the
+  requested resolution, then downsamples to at most `points` per account with NumPy
+"""
+import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.db import db, db_ro
+
+GRANULARITIES = ("hour", "day", "week")
+_GRANULARITY_SECONDS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+METRICS = ("followers", "views", "media_count")
+
+
+def _as_int(v) -> Optional[int]:
+    try:
+        return int(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_metrics(provider: str, data: Any) -> Dict[str, Optional[int]]:
+    """Follower / view / media counts from a YouTube channels.list or Graph API user payload."""
+    if not isinstance(data, dict):
+        return {"followers": None, "views": None, "media_count": None}
+    if provider == "youtube":
+        items = data.get("items") or [{}]
+        st = items[0].get("statistics") or {}
+        return {
+            "followers": _as_int(st.get("subscriberCount")),
+            "views": _as_int(st.get("viewCount")),
+            "media_count": _as_int(st.get("videoCount")),
+        }
+    return {
+        "followers": _as_int(data.get("followers_count")),
+        "views": None,
+        "media_count": _as_int(data.get("media_count")),
+    }
+
+
+async def update_rollups(account_ids: List[Any]):
+    """Upserts the current hour/day/week bucket of every account in `account_ids` from its fetch state."""
+    if not account_ids:
+        return
+    in_clause = ", ".join(f":a{i}" for i in range(len(account_ids)))
+    values = {f"a{i}": aid for i, aid in enumerate(account_ids)}
+    await db.execute(
+        f"""
+        INSERT INTO analytics_rollups (social_account_id, granularity, bucket_start, user_id, provider, samples,
+                                       followers_min, followers_max, followers_sum, followers_last, views_last, media_last, last_at)
+        SELECT f.social_account_id, g.granularity, date_trunc(g.granularity, NOW()), a.user_id, a.provider, 1,
+               f.followers, f.followers, COALESCE(f.followers, 0), f.followers, f.views, f.media_count, NOW()
+        FROM analytics_fetch_state f
+        JOIN social_accounts a ON a.id = f.social_account_id
+        CROSS JOIN (VALUES ('hour'), ('day'), ('week')) AS g(granularity)
+        WHERE f.social_account_id IN ({in_clause})
+        ON CONFLICT (social_account_id, granularity, bucket_start) DO UPDATE SET
+            samples = analytics_rollups.samples + 1,
+            followers_min = LEAST(analytics_rollups.followers_min, EXCLUDED.followers_min),
+            followers_max = GREATEST(analytics_rollups.followers_max, EXCLUDED.followers_max),
+            followers_sum = analytics_rollups.followers_sum + EXCLUDED.followers_sum,
+            followers_last = EXCLUDED.followers_last,
+            views_last = EXCLUDED.views_last,
+            media_last = EXCLUDED.media_last,
+            last_at = EXCLUDED.last_at
+        """,
+        values=values,
+    )
+
+
+def pick_granularity(start: datetime.datetime, end: datetime.datetime, points: int) -> str:
+    """Coarsest rollup whose bucket is no wider than one output point."""
+    step = max((end - start).total_seconds() / max(points, 1), 1)
+    for g in reversed(GRANULARITIES):
+        if _GRANULARITY_SECONDS[g] <= step:
+            return g
+    return GRANULARITIES[0]
+
+
+def downsample(ts: np.ndarray, values: np.ndarray, start: float, end: float, points: int) -> List[List[float]]:
+    """
+    Equal-width bins over [start, end); each non-empty bin yields [bin_start_epoch, mean_value].
+    `ts` are epoch seconds; NaN values (metric not reported) are ignored.
+    """
+    mask = ~np.isnan(values) & (ts >= start) & (ts < end)
+    ts, values = ts[mask], values[mask]
+    if ts.size == 0:
+        return []
+    width = (end - start) / points
+    idx = np.minimum(((ts - start) // width).astype(np.int64), points - 1)
+    sums = np.bincount(idx, weights=values, minlength=points)
+    counts = np.bincount(idx, minlength=points)
+    filled = np.nonzero(counts)[0]
+    bin_starts = start + filled * width
+    means = sums[filled] / counts[filled]
+    return np.column_stack((bin_starts, means)).tolist()
+
+
+async def query_series(
+    user_id: str,
+    metric: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    points: int = 200,
+    account_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    granularity = pick_granularity(start, end, points)
+    column = {"followers": "followers_last", "views": "views_last", "media_count": "media_last"}[metric]
+    query = f"""
+        SELECT social_account_id, provider, EXTRACT(EPOCH FROM bucket_start) AS ts, {column} AS value
+        FROM analytics_rollups
+        WHERE user_id = :uid AND granularity = :g AND bucket_start >= :start AND bucket_start < :end
+    """
+    values = {"uid": user_id, "g": granularity, "start": start, "end": end}
+    if account_id:
+        query += " AND social_account_id = :aid"
+        values["aid"] = account_id
+    query += " ORDER BY social_account_id, bucket_start"
+    rows = await db_ro.fetch_all(query, values=values)
+
+    series = []
+    if rows:
+        accounts = np.array([str(r["social_account_id"]) for r in rows])
+        ts = np.array([float(r["ts"]) for r in rows])
+        vals = np.array([np.nan if r["value"] is None else float(r["value"]) for r in rows])
+        providers = {str(r["social_account_id"]): r["provider"] for r in rows}
+        # rows are sorted by account, so each account is one contiguous slice
+        _, first = np.unique(accounts, return_index=True)
+        bounds = np.append(np.sort(first), len(accounts))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            acc = str(accounts[lo])
+            series.append({
+                "account_id": acc,
+                "provider": providers[acc],
+                "points": downsample(ts[lo:hi], vals[lo:hi], start.timestamp(), end.timestamp(), points),
+            })
+    return {"metric": metric, "granularity": granularity, "start": start.isoformat(), "end": end.isoformat(), "series": series}
@@ -0,0 +1,157 @@
+# app/analytics_shards.py
+"""
+Sharded analytics collection across processes / nodes.
+
+A collection run is split into N shards by a hash of social_accounts.id
+(see app.analytics_collector.iter_account_pages). Shard state lives in
+analytics_collection_shards (migrations/sql_migrations_v2.sql):
+
+- any worker (every app instance polls via the scheduler, or app/scripts/collect_analytics.py)
+  claims one shard at a time with FOR UPDATE SKIP LOCKED and holds it with a lease
+- after each page of accounts is fully written the worker checkpoints the last account id
+  and extends its lease
+- if a worker dies, its lease expires and the next worker resumes from the checkpoint
+  (accounts after the checkpoint may be collected twice; never skipped)
+- a page whose snapshots could not be written is not checkpointed: the worker gives the shard
+  up and the next claim after the lease expires retries it from the last written page
+
+Total collection time therefore scales down with the number of workers.
+"""
+import os
+import uuid
+import socket
+import datetime
+from typing import Any, Dict, List, Optional
+
+from app.db import db
+from app.analytics_collector import SnapshotWriteFailed, collect_analytics, iter_account_pages
+from app.log import get_logger, logged_job
+
+COLLECT_SHARDS = int(os.getenv("COLLECT_SHARDS", "16"))
+# must comfortably exceed the time needed to collect one page of accounts
+SHARD_LEASE_SECONDS = int(os.getenv("COLLECT_SHARD_LEASE_SECONDS", "300"))
+
+log = get_logger(__name__)
+
+
+class ShardLeaseLost(RuntimeError):
+    pass
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def create_collection_run(shard_count: int = COLLECT_SHARDS) -> str:
+    """Creates a run with `shard_count` pending shards, unless an unfinished run already exists."""
+    existing = await db.fetch_one("SELECT run_id FROM analytics_collection_shards WHERE status <> 'done' ORDER BY created_at LIMIT 1")
+    if existing:
+        return existing["run_id"]
+    run_id = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    await db.execute(
+        "INSERT INTO analytics_collection_shards (run_id, shard, shard_count, status, created_at) "
+        "SELECT :run, g, :n, 'pending', NOW() FROM generate_series(0, :n - 1) AS g",
+        values={"run": run_id, "n": shard_count},
+    )
+    return run_id
+
+
+async def claim_shard(owner: str) -> Optional[Any]:
+    """Claims the oldest pending shard, or a running one whose lease expired. Returns None if nothing is claimable."""
+    return await db.fetch_one(
+        """
+        UPDATE analytics_collection_shards s
+        SET status = 'running', owner = :owner, lease_until = NOW() + CAST(:lease AS integer) * INTERVAL '1 second',
+            started_at = COALESCE(s.started_at, NOW())
+        FROM (
+            SELECT run_id, shard FROM analytics_collection_shards
+            WHERE status = 'pending' OR (status = 'running' AND lease_until < NOW())
+            ORDER BY created_at, shard
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ) c
+        WHERE s.run_id = c.run_id AND s.shard = c.shard
+        RETURNING s.run_id, s.shard, s.shard_count, s.checkpoint_id, s.accounts_done
+        """,
+        values={"owner": owner, "lease": SHARD_LEASE_SECONDS},
+    )
+
+
+async def _checkpoint(claim, owner: str, last_id, accounts_done: int, finish: bool = False):
+    row = await db.fetch_one(
+        """
+        UPDATE analytics_collection_shards
+        SET checkpoint_id = COALESCE(:cp, checkpoint_id), accounts_done = :done,
+            lease_until = NOW() + CAST(:lease AS integer) * INTERVAL '1 second',
+            status = CASE WHEN :finish THEN 'done' ELSE status END,
+            finished_at = CASE WHEN :finish THEN NOW() ELSE finished_at END
+        WHERE run_id = :run AND shard = :shard AND owner = :owner AND status = 'running'
+        RETURNING shard
+        """,
+        values={"cp": last_id, "done": accounts_done, "lease": SHARD_LEASE_SECONDS, "finish": finish,
+                "run": claim["run_id"], "shard": claim["shard"], "owner": owner},
+    )
+    if not row:
+        raise ShardLeaseLost(f"shard {claim['run_id']}/{claim['shard']} was taken over by another worker")
+
+
+async def collect_shard(claim, owner: str) -> Dict[str, Any]:
+    """Collects one claimed shard from its checkpoint onwards, checkpointing after every page."""
+    accounts_done = claim["accounts_done"] or 0
+    seen = 0
+
+    async def _pages():
+        nonlocal seen
+        async for page in iter_account_pages(after_id=claim["checkpoint_id"], shard=claim["shard"], shard_count=claim["shard_count"]):
+            seen += len(page)
+            yield page
+
+    async def _on_checkpoint(last_id):
+        await _checkpoint(claim, owner, last_id, accounts_done + seen)
+
+    stats = await collect_analytics(pages=_pages(), on_checkpoint=_on_checkpoint)
+    await _checkpoint(claim, owner, None, accounts_done + seen, finish=True)
+    stats.update({"run_id": claim["run_id"], "shard": claim["shard"], "resumed_from": claim["checkpoint_id"]})
+    return stats
+
+
+@logged_job("analytics_shard_worker")
+async def run_shard_worker(owner: Optional[str] = None, max_shards: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Claims and collects shards until none are left (or `max_shards` were processed)."""
+    owner = owner or default_worker_id()
+    results = []
+    while max_shards is None or len(results) < max_shards:
+        claim = await claim_shard(owner)
+        if not claim:
+            break
+        try:
+            stats = await collect_shard(claim, owner)
+        except ShardLeaseLost as e:
+            log.warning("analytics shard lease lost", extra={"error": str(e)})
+            continue
+        except SnapshotWriteFailed as e:
+            # the lease runs out and the shard resumes from its last checkpoint
+            log.warning("analytics shard stopped", extra={"run_id": str(claim["run_id"]), "shard": claim["shard"], "error": str(e)})
+            continue
+        log.info("analytics shard done", extra={"stats": stats})
+        results.append(stats)
+    return results
+
+
+async def collection_progress(run_id: Optional[str] = None) -> Dict[str, Any]:
+    if run_id is None:
+        row = await db.fetch_one("SELECT run_id FROM analytics_collection_shards ORDER BY created_at DESC LIMIT 1")
+        if not row:
+            return {"run_id": None, "shards": []}
+        run_id = row["run_id"]
+    rows = await db.fetch_all(
+        "SELECT shard, status, owner, lease_until, accounts_done, started_at, finished_at FROM analytics_collection_shards WHERE run_id = :run ORDER BY shard",
+        values={"run": run_id},
+    )
+    return {
+        "run_id": run_id,
+        "done": sum(1 for r in rows if r["status"] == "done"),
+        "total": len(rows),
+        "accounts_done": sum(r["accounts_done"] or 0 for r in rows),
+        "shards": [dict(r) for r in rows],
+    }
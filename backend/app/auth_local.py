@@ -1,7 +1,9 @@
 """
 Local authentication module (Option A) for AI Social Manager.
 - Provides /auth/register and /auth/login endpoints
-- Uses bcrypt for password hashing
+- Uses bcrypt for password hashing, run in a bounded thread pool so logins don't block the event loop
+  (BCRYPT_WORKERS threads, at most BCRYPT_MAX_PENDING hashes queued or running; beyond that 503)
+- BCRYPT_ROUNDS sets the cost of new hashes; a login with a hash of another cost rehashes it
 - Issues JWTs signed with JWT_SECRET (env)
 - Provides dependency `get_current_user` to protect routes
 
@@ -10,12 +12,17 @@ Security notes:
 - Tokens are short-lived (configurable). Use refresh tokens for long sessions if desired.
 """
 import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel, EmailStr
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from .db import db
+from .log import get_logger
+from .metrics import password_hash_seconds, password_hash_rejected, password_hash_pending
 
 router = APIRouter(prefix='/auth')
 
@@ -25,6 +32,20 @@ if not JWT_SECRET:
 JWT_ALGORITHM = 'HS256'
 JWT_EXP_MINUTES = int(os.getenv('JWT_EXP_MINUTES', '1440'))  # default 24 hours
 
+# bcrypt cost factor for new hashes (each +1 doubles the work; 12 is bcrypt's default)
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+# bcrypt releases the GIL, so these threads hash in parallel (0 = hash on the event loop)
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 2)))
+# hashes queued or running before new logins are turned away with 503
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', str(max(BCRYPT_WORKERS, 1) * 4)))
+
+log = get_logger(__name__)
+
+_pool = None
+_pending = 0
+_rehash_tasks = set()
+password_hash_pending.set_function(lambda: _pending)
+
 
 class RegisterIn(BaseModel):
     email: EmailStr
@@ -36,14 +57,68 @@ class LoginIn(BaseModel):
     password: str
 
 
-def hash_password(plain: str) -> str:
-    return bcrypt.hashpw(plain.encode(), bcrypt.gensalt()).decode()
+def _hashpw(plain: str, rounds: int) -> str:
+    return bcrypt.hashpw(plain.encode(), bcrypt.gensalt(rounds)).decode()
 
 
-def verify_password(plain: str, hashed: str) -> bool:
+def _checkpw(plain: str, hashed: str) -> bool:
     return bcrypt.checkpw(plain.encode(), hashed.encode())
 
 
+def _check_capacity(op: str):
+    if BCRYPT_WORKERS > 0 and _pending >= BCRYPT_MAX_PENDING:
+        password_hash_rejected.labels(op).inc()
+        raise HTTPException(status_code=503, detail='Too many logins in progress, retry shortly', headers={'Retry-After': '1'})
+
+
+async def _run_bcrypt(op: str, func, *args):
+    global _pool, _pending
+    started = time.perf_counter()
+    if BCRYPT_WORKERS <= 0:
+        try:
+            return func(*args)
+        finally:
+            password_hash_seconds.labels(op).observe(time.perf_counter() - started)
+    _check_capacity(op)
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+    finally:
+        _pending -= 1
+        password_hash_seconds.labels(op).observe(time.perf_counter() - started)
+
+
+async def hash_password(plain: str) -> str:
+    return await _run_bcrypt('hash', _hashpw, plain, BCRYPT_ROUNDS)
+
+
+async def verify_password(plain: str, hashed: str) -> bool:
+    return await _run_bcrypt('verify', _checkpw, plain, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True if `hashed` ($2b$<cost>$...) was made with a cost other than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+async def _rehash(user_id, plain: str, old_hash: str):
+    try:
+        new_hash = await hash_password(plain)
+        # only replace the hash we verified, in case the password changed meanwhile
+        await db.execute(
+            'UPDATE users SET password_hash = :new WHERE id = :id AND password_hash = :old',
+            values={'new': new_hash, 'id': user_id, 'old': old_hash},
+        )
+    except Exception as e:
+        # pool busy or DB error: the next login tries again
+        log.warning('password rehash skipped', extra={'user_id': str(user_id), 'error': str(e)})
+
+
 def create_jwt(user_id: str):
     expire_minutes = int(JWT_EXP_MINUTES)
     expire = datetime.utcnow() + timedelta(minutes=expire_minutes)
@@ -77,12 +152,13 @@ async def get_current_user(authorization: str = Depends(lambda: None)):
 
 @router.post('/register')
 async def register(payload: RegisterIn):
+    _check_capacity('hash')
     # Check if user exists
     q = 'SELECT id, email FROM users WHERE email = :email'
     existing = await db.fetch_one(q, values={'email': payload.email})
     if existing:
         raise HTTPException(status_code=400, detail='Email already registered')
-    hashed = hash_password(payload.password)
+    hashed = await hash_password(payload.password)
     q = 'INSERT INTO users (email, password_hash) VALUES (:email, :ph) RETURNING id'
     row = await db.fetch_one(q, values={'email': payload.email, 'ph': hashed})
     user_id = row['id']
@@ -92,11 +168,18 @@ async def register(payload: RegisterIn):
 
 @router.post('/login')
 async def login(payload: LoginIn):
+    # shed load before touching the DB when the hashing pool is already full
+    _check_capacity('verify')
     q = 'SELECT id, email, password_hash FROM users WHERE email = :email'
     row = await db.fetch_one(q, values={'email': payload.email})
     if not row:
         raise HTTPException(status_code=401, detail='Invalid credentials')
-    if not verify_password(payload.password, row['password_hash']):
+    if not await verify_password(payload.password, row['password_hash']):
         raise HTTPException(status_code=401, detail='Invalid credentials')
+    if needs_rehash(row['password_hash']):
+        # cost changed: upgrade the stored hash without making this login wait for it
+        task = asyncio.create_task(_rehash(row['id'], payload.password, row['password_hash']))
+        _rehash_tasks.add(task)
+        task.add_done_callback(_rehash_tasks.discard)
     token = create_jwt(row['id'])
     return {'access_token': token, 'token_type': 'bearer', 'user_id': row['id']}
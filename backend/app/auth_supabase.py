@@ -30,3 +30,18 @@ def verify_supabase_jwt(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+
+
+# Comma-separated Supabase user ids (JWT "sub") allowed to use admin-only tooling such as profiling
+ADMIN_USER_IDS = {u.strip() for u in os.getenv("ADMIN_USER_IDS", "").split(",") if u.strip()}
+
+
+def is_admin(payload) -> bool:
+    return bool(payload) and payload.get("sub") in ADMIN_USER_IDS
+
+
+def verify_admin(authorization: str = Header(None)):
+    payload = verify_supabase_jwt(authorization)
+    if not is_admin(payload):
+        raise HTTPException(status_code=403, detail="Admin only")
+    return payload
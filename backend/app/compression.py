@@ -0,0 +1,159 @@
+# app/compression.py
+"""
+Negotiated response compression (brotli or gzip).
+
+- CompressionMiddleware compresses JSON / NDJSON / text responses of at least COMPRESS_MIN_BYTES
+  (0 disables the middleware) for clients that send a matching Accept-Encoding
+- brotli is preferred when the `brotli` package is installed, otherwise gzip; q-values of 0 are
+  honoured. Quality / level are kept low (COMPRESS_BROTLI_QUALITY, COMPRESS_GZIP_LEVEL): for
+  dynamic responses the CPU spent per request matters more than the last few percent of size.
+- complete bodies of COMPRESS_THREAD_MIN_BYTES or more are compressed in a worker thread, so a
+  multi-megabyte listing doesn't stall the event loop
+- streaming responses (NDJSON exports) are compressed chunk by chunk with a sync flush after
+  each chunk, so every row still reaches the client as soon as it is written
+- media (images, video) and responses that already carry a Content-Encoding are left alone
+
+Measure sizes and compression time with `python -m app.scripts.bench_json`.
+"""
+import os
+import zlib
+import asyncio
+import importlib.util
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# brotli itself is only imported when the first response is compressed with it
+_HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))  # 0 disables
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESS_THREAD_MIN_BYTES = int(os.getenv("COMPRESS_THREAD_MIN_BYTES", str(256 * 1024)))
+
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "application/javascript", "image/svg+xml", "text/")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """"br", "gzip" or None for an Accept-Encoding header value."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    if _HAS_BROTLI and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    c = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    return c.compress(body) + c.flush()
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            import brotli
+
+            self._br = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self._br is not None:
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._br is not None:
+            return self._br.finish()
+        return self._gz.flush()
+
+
+def _compressible(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 304) or "content-encoding" in headers:
+        return False
+    return headers.get("content-type", "").lower().startswith(_COMPRESSIBLE)
+
+
+class CompressionMiddleware:
+    """Compresses large text responses with the best encoding the client accepts."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or COMPRESS_MIN_BYTES <= 0:
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        decided = False
+        stream: Optional[_StreamCompressor] = None
+
+        async def _send(message):
+            nonlocal start, decided, stream
+            if message["type"] == "http.response.start":
+                # held back until the first body chunk shows how large the response is
+                start = message
+                return
+            if message["type"] != "http.response.body" or decided:
+                if not decided:
+                    # e.g. http.response.pathsend: nothing to compress
+                    decided = True
+                    await send(start)
+                elif stream is not None and message["type"] == "http.response.body":
+                    more = message.get("more_body", False)
+                    data = stream.chunk(message.get("body", b""))
+                    if not more:
+                        data += stream.finish()
+                    message = {"type": "http.response.body", "body": data, "more_body": more}
+                await send(message)
+                return
+
+            decided = True
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            headers = MutableHeaders(raw=list(start.get("headers") or []))
+            if not _compressible(start["status"], headers):
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if not more and len(body) < COMPRESS_MIN_BYTES:
+                await send({**start, "headers": headers.raw})
+                await send(message)
+                return
+            headers["Content-Encoding"] = encoding
+            if more:
+                stream = _StreamCompressor(encoding)
+                del headers["Content-Length"]
+                body = stream.chunk(body)
+            elif len(body) >= COMPRESS_THREAD_MIN_BYTES:
+                body = await asyncio.to_thread(compress, encoding, body)
+            else:
+                body = compress(encoding, body)
+            if not more:
+                headers["Content-Length"] = str(len(body))
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        await self.app(scope, receive, _send)
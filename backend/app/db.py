@@ -1,24 +1,155 @@
 """
 Database helpers using databases + SQLAlchemy engine.
 Adjust DATABASE_URL in env (from Supabase) before running.
+
+Pool settings (env):
+- DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE: asyncpg pool size (default 1 / 2)
+- DB_POOL_ACQUIRE_TIMEOUT: seconds to wait for a free connection before failing (0 = wait forever)
+- DB_PGBOUNCER=1: PgBouncer transaction-pooling mode; disables asyncpg's prepared statement cache,
+  which breaks when consecutive statements land on different server connections
+- DB_STATEMENT_CACHE_SIZE: explicit statement cache size (ignored when DB_PGBOUNCER=1)
+- DATABASE_URL_RO: optional read replica; `db_ro` points at it (or at `db` when unset) and is used
+  by read-only endpoints (history, listings, analytics reads). DB_RO_POOL_MAX_SIZE sizes its pool.
+
+Every pool records how long callers waited for a connection (pool_stats(), /admin/db/pool), and every
+fetch/execute call is timed per query into app.metrics (db_query_duration_seconds).
 """
 import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+
 from databases import Database
 from sqlalchemy import create_engine, MetaData
 
+from app.utils.metrics import Histogram
+from app.metrics import db_query_seconds, query_label
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL_RO = os.getenv("DATABASE_URL_RO")
 
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+if DATABASE_URL_RO and DATABASE_URL_RO.startswith("postgres://"):
+    DATABASE_URL_RO = DATABASE_URL_RO.replace("postgres://", "postgresql://", 1)
+
+# Render Postgres session mode supports very few concurrent DB connections, hence the small defaults.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "2"))
+DB_RO_POOL_MAX_SIZE = int(os.getenv("DB_RO_POOL_MAX_SIZE", str(DB_POOL_MAX_SIZE)))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "0"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0").lower() in ("1", "true", "yes")
+DB_STATEMENT_CACHE_SIZE = os.getenv("DB_STATEMENT_CACHE_SIZE")
+
+
+def _pool_options(max_size: int) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"min_size": min(DB_POOL_MIN_SIZE, max_size), "max_size": max_size}
+    if DB_PGBOUNCER:
+        options["statement_cache_size"] = 0
+    elif DB_STATEMENT_CACHE_SIZE is not None:
+        options["statement_cache_size"] = int(DB_STATEMENT_CACHE_SIZE)
+    return options
+
+
+class _TimedPool:
+    """Wraps an asyncpg pool (which can't be patched: it uses __slots__) to time acquire()."""
+
+    def __init__(self, pool, owner: "InstrumentedDatabase"):
+        self._pool = pool
+        self._owner = owner
+
+    async def acquire(self, *args, **kwargs):
+        owner = self._owner
+        if DB_POOL_ACQUIRE_TIMEOUT > 0:
+            kwargs.setdefault("timeout", DB_POOL_ACQUIRE_TIMEOUT)
+        owner.waiting += 1
+        started = time.perf_counter()
+        try:
+            return await self._pool.acquire(*args, **kwargs)
+        except asyncio.TimeoutError:
+            owner.acquire_timeouts += 1
+            raise
+        finally:
+            owner.waiting -= 1
+            owner.acquire_wait.observe(time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class InstrumentedDatabase(Database):
+    """Database whose asyncpg pool records connection acquire waits."""
+
+    def __init__(self, url, name: str = "primary", **options):
+        super().__init__(url, **options)
+        self.name = name
+        self.acquire_wait = Histogram()
+        self.waiting = 0
+        self.acquire_timeouts = 0
 
-# Render Postgres session mode supports very few concurrent DB connections.
-db = Database(
-    DATABASE_URL,
-    min_size=1,
-    max_size=2  
-)
+    async def connect(self) -> None:
+        await super().connect()
+        # databases awaits backend._pool.acquire() for every connection it hands out
+        pool = getattr(self._backend, "_pool", None)
+        if pool is not None and not isinstance(pool, _TimedPool):
+            self._backend._pool = _TimedPool(pool, self)
+
+    async def _timed(self, method: str, call, query, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await call(query, *args, **kwargs)
+        finally:
+            db_query_seconds.labels(self.name, method, query_label(query)).observe(time.perf_counter() - started)
+
+    async def fetch_all(self, query, values=None):
+        return await self._timed("fetch_all", super().fetch_all, query, values)
+
+    async def fetch_one(self, query, values=None):
+        return await self._timed("fetch_one", super().fetch_one, query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        return await self._timed("fetch_val", super().fetch_val, query, values, column)
+
+    async def execute(self, query, values=None):
+        return await self._timed("execute", super().execute, query, values)
+
+    async def execute_many(self, query, values):
+        return await self._timed("execute_many", super().execute_many, query, values)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        pool = getattr(self._backend, "_pool", None)
+        stats: Dict[str, Any] = {
+            "name": self.name,
+            "connected": self.is_connected,
+            "waiting": self.waiting,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_seconds": self.acquire_wait.snapshot(),
+        }
+        if pool is not None:
+            stats.update({"size": pool.get_size(), "idle": pool.get_idle_size(), "max_size": pool.get_max_size()})
+        return stats
+
+
+db = InstrumentedDatabase(DATABASE_URL, name="primary", **_pool_options(DB_POOL_MAX_SIZE))
+
+# read-only traffic; falls back to the primary when no replica is configured
+db_ro = InstrumentedDatabase(DATABASE_URL_RO, name="replica", **_pool_options(DB_RO_POOL_MAX_SIZE)) if DATABASE_URL_RO else db
 
 engine = create_engine(DATABASE_URL)
 metadata = MetaData()
 
-# Utility convenience wrappers could be added here
+
+async def connect_databases():
+    await db.connect()
+    if db_ro is not db:
+        await db_ro.connect()
+
+
+async def disconnect_databases():
+    if db_ro is not db:
+        await db_ro.disconnect()
+    await db.disconnect()
+
+
+def pool_stats() -> Dict[str, Optional[Dict[str, Any]]]:
+    return {"primary": db.pool_stats(), "replica": db_ro.pool_stats() if db_ro is not db else None}
@@ -0,0 +1,157 @@
+# app/deadline.py
+"""
+Deadlines for requests and jobs, propagated through a contextvar.
+
+- DeadlineMiddleware gives every HTTP request a deadline: REQUEST_TIMEOUT_SECONDS, or
+  PUBLISH_TIMEOUT_SECONDS for the publishing / upload routes. Clients may ask for their own with
+  an "X-Request-Timeout: <seconds>" header (capped at MAX_REQUEST_TIMEOUT_SECONDS). If the handler
+  hasn't started its response by the deadline it is cancelled and the client gets a 504.
+- jobs bound each unit of work with deadline_scope(seconds), e.g. one scheduled post
+- scopes only tighten: a nested scope never extends the deadline it runs under
+- provider helpers size their timeouts with budget(cap) and wrap awaits in with_deadline(aw, cap),
+  so each attempt of a failover chain only gets what is left. Both raise DeadlineExceeded (a
+  TimeoutError) once the deadline has passed; endpoints turn it into 504.
+- SDK calls running in threads can't be interrupted. Their await is cancelled, and the thread
+  finishes only its current HTTP request: instagrapi requests are capped by the remaining budget
+  (app.instagram.client), the YouTube upload loop checks the deadline between chunks.
+
+asyncio.to_thread copies the context, so budget() / check() work inside worker threads too.
+"""
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from app.metrics import deadline_exceeded
+
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))  # 0 disables
+PUBLISH_TIMEOUT_SECONDS = float(os.getenv("PUBLISH_TIMEOUT_SECONDS", "300"))
+MAX_REQUEST_TIMEOUT_SECONDS = float(os.getenv("MAX_REQUEST_TIMEOUT_SECONDS", "600"))
+# how long past the deadline the middleware waits for the handler's own (budget-aware) error
+DEADLINE_GRACE_SECONDS = float(os.getenv("DEADLINE_GRACE_SECONDS", "0.5"))
+
+# routes that upload media get PUBLISH_TIMEOUT_SECONDS by default
+PUBLISH_PATHS = ("/posts/publish-now", "/instagram/publish", "/youtube/upload")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Runs the block with a deadline `seconds` from now, or the current one if that is sooner."""
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds until the current deadline (negative once passed), or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("deadline exceeded")
+
+
+def budget(cap: Optional[float] = None) -> Optional[float]:
+    """Timeout for the next call: `cap` limited to the remaining budget (None = unbounded)."""
+    check()
+    left = remaining()
+    if left is None:
+        return cap
+    return left if cap is None else min(cap, left)
+
+
+async def with_deadline(aw, cap: Optional[float] = None):
+    """Awaits `aw`, cancelling it at the deadline (DeadlineExceeded) or after `cap` seconds (TimeoutError)."""
+    try:
+        timeout = budget(cap)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+    if timeout is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("deadline exceeded") from None
+        raise
+
+
+def _requested_timeout(scope) -> float:
+    default = PUBLISH_TIMEOUT_SECONDS if scope["path"].startswith(PUBLISH_PATHS) else REQUEST_TIMEOUT_SECONDS
+    for key, value in scope.get("headers") or []:
+        if key == b"x-request-timeout":
+            try:
+                asked = float(value.decode("latin-1"))
+            except ValueError:
+                return default
+            return min(asked, MAX_REQUEST_TIMEOUT_SECONDS) if asked > 0 else default
+    return default
+
+
+class DeadlineMiddleware:
+    """Sets the request deadline and answers 504 if no response has started when it passes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        seconds = _requested_timeout(scope)
+        if seconds <= 0:
+            return await self.app(scope, receive, send)
+        started = False
+
+        async def _send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                # background tasks run after the response; they are not bound by the request's deadline
+                _deadline.set(None)
+
+        with deadline_scope(seconds):
+            task = asyncio.ensure_future(self.app(scope, receive, _send))
+        try:
+            await asyncio.wait_for(asyncio.shield(task), seconds + DEADLINE_GRACE_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            if started:
+                # already streaming (or running background tasks): let it finish
+                return await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        deadline_exceeded.labels("request").inc()
+        body = json.dumps({"detail": f"deadline of {seconds:g}s exceeded"}).encode()
+        await send({"type": "http.response.start", "status": 504,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
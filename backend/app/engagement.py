@@ -0,0 +1,190 @@
+# app/engagement.py
+"""
+Cross-platform engagement normalization.
+
+Per-post metrics from every platform are loaded into one columnar EngagementFrame
+(NumPy arrays, one entry per post) and scored in bulk:
+
+- engagement rate: (likes + comments) / audience, where audience is the post's views when the
+  platform reports them (YouTube) and the account's followers otherwise (Instagram)
+- z-score of the rate within its account (how unusual the post is for that account)
+- percentile of the rate within its account (mid-rank, 0-100), comparable across platforms
+
+All per-account statistics are computed with bincount / lexsort over the whole frame,
+so thousands of posts per account score in milliseconds (see app/scripts/bench_engagement.py).
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# most recent mirrored Instagram posts scored per account (app.instagram.instagram_sync)
+INSTAGRAM_ENGAGEMENT_POSTS = 5000
+
+
+class EngagementFrame:
+    """Columnar per-post metrics. `account` holds integer codes into `account_keys`."""
+
+    def __init__(self, account_keys: List[str], account: np.ndarray, post_ids: List[Any], platform: List[str],
+                 likes: np.ndarray, comments: np.ndarray, views: np.ndarray, followers: np.ndarray):
+        self.account_keys = account_keys
+        self.account = account
+        self.post_ids = post_ids
+        self.platform = platform
+        self.likes = likes
+        self.comments = comments
+        self.views = views
+        self.followers = followers
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "EngagementFrame":
+        """
+        records: dicts with account, post_id, platform, likes, comments and optionally
+        views / followers (missing or None -> NaN).
+        """
+        records = list(records)
+        keys: Dict[str, int] = {}
+        account = np.empty(len(records), dtype=np.int64)
+        for i, r in enumerate(records):
+            account[i] = keys.setdefault(str(r["account"]), len(keys))
+
+        def col(name):
+            return np.array([np.nan if r.get(name) is None else float(r[name]) for r in records], dtype=np.float64)
+
+        return cls(
+            account_keys=list(keys),
+            account=account,
+            post_ids=[r["post_id"] for r in records],
+            platform=[r["platform"] for r in records],
+            likes=np.nan_to_num(col("likes")),
+            comments=np.nan_to_num(col("comments")),
+            views=col("views"),
+            followers=col("followers"),
+        )
+
+
+def _group_stats(codes: np.ndarray, values: np.ndarray, n_groups: int):
+    counts = np.bincount(codes, minlength=n_groups)
+    safe = np.maximum(counts, 1)
+    mean = np.bincount(codes, weights=values, minlength=n_groups) / safe
+    sq = np.bincount(codes, weights=values * values, minlength=n_groups) / safe
+    std = np.sqrt(np.maximum(sq - mean * mean, 0.0))
+    return counts, mean, std
+
+
+def _group_percentiles(codes: np.ndarray, values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Mid-rank percentile of each value within its group: 100 * (less + equal / 2) / n."""
+    n = len(values)
+    if n == 0:
+        return np.empty(0)
+    order = np.lexsort((values, codes))
+    c_s, v_s = codes[order], values[order]
+    group_start = np.concatenate(([0], np.cumsum(counts)[:-1]))[c_s]
+
+    # runs of equal (group, value); left/right index of the run each element belongs to
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = (c_s[1:] != c_s[:-1]) | (v_s[1:] != v_s[:-1])
+    idx = np.arange(n)
+    left = np.maximum.accumulate(np.where(new_run, idx, 0))
+    end_run = np.ones(n, dtype=bool)
+    end_run[:-1] = new_run[1:]
+    right = np.minimum.accumulate(np.where(end_run, idx, n - 1)[::-1])[::-1]
+
+    less = left - group_start
+    equal = right - left + 1
+    pct_sorted = 100.0 * (less + equal / 2.0) / counts[c_s]
+    pct = np.empty(n)
+    pct[order] = pct_sorted
+    return pct
+
+
+def score(frame: EngagementFrame) -> Dict[str, np.ndarray]:
+    """Engagement rate, per-account z-score and per-account percentile for every post in the frame."""
+    n_groups = len(frame.account_keys)
+    interactions = frame.likes + frame.comments
+    audience = np.where(np.isnan(frame.views) | (frame.views <= 0), frame.followers, frame.views)
+    valid = ~np.isnan(audience) & (audience > 0)
+    rate = np.where(valid, interactions / np.where(valid, audience, 1.0), 0.0)
+
+    counts, mean, std = _group_stats(frame.account, rate, n_groups)
+    acc_std = std[frame.account]
+    z = np.where(acc_std > 0, (rate - mean[frame.account]) / np.where(acc_std > 0, acc_std, 1.0), 0.0)
+    pct = _group_percentiles(frame.account, rate, counts)
+    return {"rate": rate, "z": z, "percentile": pct, "account_count": counts, "account_mean": mean, "account_std": std}
+
+
+def to_response(frame: EngagementFrame, scores: Dict[str, np.ndarray], top: Optional[int] = None) -> Dict[str, Any]:
+    order = np.argsort(-scores["percentile"], kind="stable")
+    if top:
+        order = order[:top]
+    rate, z, pct = scores["rate"], scores["z"], scores["percentile"]
+    posts = [{
+        "account": frame.account_keys[frame.account[i]],
+        "platform": frame.platform[i],
+        "post_id": frame.post_ids[i],
+        "likes": int(frame.likes[i]),
+        "comments": int(frame.comments[i]),
+        "engagement_rate": round(float(rate[i]), 6),
+        "z_score": round(float(z[i]), 3),
+        "percentile": round(float(pct[i]), 1),
+    } for i in order.tolist()]
+    accounts = [{
+        "account": key,
+        "posts": int(scores["account_count"][g]),
+        "mean_rate": round(float(scores["account_mean"][g]), 6),
+        "std_rate": round(float(scores["account_std"][g]), 6),
+    } for g, key in enumerate(frame.account_keys)]
+    return {"accounts": accounts, "posts": posts}
+
+
+async def load_user_post_metrics(user_id: str) -> Dict[str, Any]:
+    """
+    Per-post metrics for all of a user's platforms. Follower counts come from the latest
+    collected analytics (analytics_fetch_state). A failing platform is reported in "errors".
+    """
+    # imported here so the scoring engine (and its benchmark) doesn't need a database or the platform SDKs
+    from app.db import db_ro
+    from app.youtube.youtube_api import get_upload_stats
+    from app.instagram.instagram_sync import list_mirrored_medias
+
+    rows = await db_ro.fetch_all(
+        """
+        SELECT a.id, a.provider, f.followers
+        FROM social_accounts a LEFT JOIN analytics_fetch_state f ON f.social_account_id = a.id
+        WHERE a.user_id = :uid
+        """,
+        values={"uid": user_id},
+    )
+    accounts = {r["provider"]: r for r in rows}
+    records: List[Dict[str, Any]] = []
+    errors: Dict[str, str] = {}
+
+    if "youtube" in accounts:
+        acc = accounts["youtube"]
+        try:
+            videos = (await get_upload_stats(user_id)).get("videos", [])
+            for v in videos:
+                st = v.get("statistics") or {}
+                records.append({
+                    "account": str(acc["id"]), "platform": "youtube", "post_id": v.get("id"),
+                    "likes": st.get("likeCount"), "comments": st.get("commentCount"),
+                    "views": st.get("viewCount"), "followers": acc["followers"],
+                })
+        except Exception as e:
+            errors["youtube"] = str(getattr(e, "detail", e))
+
+    if "instagram" in accounts:
+        acc = accounts["instagram"]
+        try:
+            for m in await list_mirrored_medias(user_id, limit=INSTAGRAM_ENGAGEMENT_POSTS):
+                records.append({
+                    "account": str(acc["id"]), "platform": "instagram", "post_id": m["media_pk"],
+                    "likes": m["like_count"], "comments": m["comment_count"],
+                    "views": None, "followers": acc["followers"],
+                })
+        except Exception as e:
+            errors["instagram"] = str(getattr(e, "detail", e))
+
+    return {"records": records, "errors": errors}
@@ -0,0 +1,73 @@
+# app/etags.py
+"""
+ETags / conditional GETs for the per-user endpoints the dashboard keeps polling.
+
+- user_stats carries one version counter per resource (posts, schedule, accounts, ai_keys), bumped
+  by triggers on every write that changes what the endpoint returns (migrations/sql_migrations_v2.sql, 13)
+- user_etag() reads them with a single primary-key lookup and hashes them together with the user,
+  the resource names and the query string (pages and filters get their own tags)
+- is_fresh() compares the tag with If-None-Match; the endpoint then answers not_modified()
+  (304, empty body) without running its real query or serializing anything
+- full responses carry the tag plus "Cache-Control: private, no-cache", so browsers store the
+  response and revalidate it on every poll by themselves
+- the versions must be read from the database the data is then read from, and before it: with a
+  lagging replica the data can only be newer than the tag (one extra 200 on the next poll), never older
+"""
+import hashlib
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.db import db
+from app.metrics import http_not_modified
+
+VERSION_COLUMNS = {
+    "posts": "posts_version",
+    "schedule": "schedule_version",
+    "accounts": "accounts_version",
+    "ai_keys": "ai_keys_version",
+}
+# everything /me shows is derived from these
+ALL_RESOURCES = tuple(VERSION_COLUMNS)
+
+CACHE_CONTROL = "private, no-cache"
+
+
+async def user_versions(user_id: str, *resources: str, database=db) -> Dict[str, int]:
+    cols = ", ".join(VERSION_COLUMNS[r] for r in resources)
+    row = await database.fetch_one(f"SELECT {cols} FROM user_stats WHERE user_id = :uid", values={"uid": user_id})
+    # no row yet: nothing was ever written for this user
+    return {r: (row[VERSION_COLUMNS[r]] if row else 0) for r in resources}
+
+
+async def user_etag(request: Request, user_id: str, *resources: str, database=db) -> str:
+    versions = await user_versions(user_id, *resources, database=database)
+    key = "|".join([user_id, request.url.path, request.url.query] + [f"{r}={v}" for r, v in versions.items()])
+    # weak: the body is equivalent, not byte-identical (compression, the "ts" field of /me)
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names `etag` (weak comparison, as RFC 9110 asks for GET)."""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(t) for t in header.split(",")}
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(request: Request, etag: str) -> Response:
+    route = request.scope.get("route")
+    http_not_modified.labels(getattr(route, "path", None) or request.url.path).inc()
+    return Response(status_code=304, headers=etag_headers(etag))
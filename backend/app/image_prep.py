@@ -0,0 +1,182 @@
+# app/image_prep.py
+"""
+Instagram image preparation pipeline.
+
+prepare_image() runs in a process pool (CPU-bound Pillow work stays off the event loop and
+uses all cores) and turns any source image into an upload-ready JPEG:
+
+- EXIF orientation applied, then all metadata (EXIF, GPS, ICC, comments) dropped
+- center-cropped into Instagram's allowed aspect ratios (4:5 portrait .. 1.91:1 landscape)
+- resized to at most INSTAGRAM_MAX_WIDTH px wide (and at least INSTAGRAM_MIN_WIDTH)
+- re-encoded as progressive JPEG at IMAGE_JPEG_QUALITY
+
+Variants are stored in the media cache (variants/, counted against MEDIA_CACHE_MAX_BYTES and
+evicted with the downloaded objects), keyed by the source content hash and the preparation
+settings, so an image shared by many posts is prepared once. Preparation is kicked
+off when a post is scheduled (prepare_scheduled_media); at publish time instagram_variant() is a
+cache hit and only the small, ready file is uploaded.
+"""
+import os
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.log import get_logger, logged_job
+
+INSTAGRAM_MIN_ASPECT = 4 / 5
+INSTAGRAM_MAX_ASPECT = 1.91
+INSTAGRAM_MAX_WIDTH = int(os.getenv("INSTAGRAM_MAX_WIDTH", "1080"))
+INSTAGRAM_MIN_WIDTH = 320
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_PREP_WORKERS = int(os.getenv("IMAGE_PREP_WORKERS", str(os.cpu_count() or 2)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+
+# bump when the output of prepare_image changes so old variants are not reused
+_PREP_VERSION = "ig1"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, asyncio.Future] = {}
+
+log = get_logger(__name__)
+
+
+def _crop_box(width: int, height: int):
+    aspect = width / height
+    if aspect < INSTAGRAM_MIN_ASPECT:
+        new_h = round(width / INSTAGRAM_MIN_ASPECT)
+        top = (height - new_h) // 2
+        return (0, top, width, top + new_h)
+    if aspect > INSTAGRAM_MAX_ASPECT:
+        new_w = round(height * INSTAGRAM_MAX_ASPECT)
+        left = (width - new_w) // 2
+        return (left, 0, left + new_w, height)
+    return None
+
+
+def prepare_image(src: str, dest: str, max_width: int = INSTAGRAM_MAX_WIDTH, quality: int = IMAGE_JPEG_QUALITY) -> Dict[str, Any]:
+    """Runs in a worker process. Writes the prepared JPEG to `dest` atomically."""
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode != "RGB":
+            if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+                # flatten transparency onto white instead of black
+                rgba = im.convert("RGBA")
+                flat = Image.new("RGB", rgba.size, (255, 255, 255))
+                flat.paste(rgba, mask=rgba.split()[-1])
+                im = flat
+            else:
+                im = im.convert("RGB")
+        box = _crop_box(*im.size)
+        if box:
+            im = im.crop(box)
+        width, height = im.size
+        target = min(max(width, INSTAGRAM_MIN_WIDTH), max_width)
+        if target != width:
+            im = im.resize((target, round(height * target / width)), Image.LANCZOS)
+        tmp = dest + f".{os.getpid()}.tmp"
+        # a fresh save without exif/icc_profile arguments writes no metadata
+        im.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, dest)
+        return {"path": dest, "width": im.size[0], "height": im.size[1], "bytes": os.path.getsize(dest)}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_PREP_WORKERS)
+    return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _source_digest(path: str) -> str:
+    # media cache objects are already named by their sha256
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return name
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_image(path_or_url: Optional[str]) -> bool:
+    return bool(path_or_url) and os.path.splitext(path_or_url.split("?")[0])[1].lower() in IMAGE_EXTENSIONS
+
+
+async def _prepare_and_track(path: str, dest: str):
+    from app.media_cache import pinned, track_file
+
+    loop = asyncio.get_running_loop()
+    # the source must survive eviction until the worker has read it
+    with pinned(path):
+        await loop.run_in_executor(_get_pool(), prepare_image, path, dest)
+    await track_file(dest)
+
+
+async def instagram_variant(path: str) -> str:
+    """Prepared variant of a local image (cached by content hash); the input path if it can't be prepared."""
+    from app.media_cache import variant_path
+
+    if not is_image(path) or not os.path.isfile(path):
+        return path
+    digest = await asyncio.to_thread(_source_digest, path)
+    key = f"{digest}-{_PREP_VERSION}-{INSTAGRAM_MAX_WIDTH}-{IMAGE_JPEG_QUALITY}"
+    dest = variant_path(key, ".jpg")
+    if os.path.exists(dest):
+        os.utime(dest)
+        return dest
+    fut = _inflight.get(key)
+    if fut is None:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fut = asyncio.ensure_future(_prepare_and_track(path, dest))
+        _inflight[key] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(key, None))
+    try:
+        await asyncio.shield(fut)
+        return dest
+    except Exception as e:
+        log.warning("image prep failed, uploading original", extra={"path": path, "error": str(e)})
+        return path
+
+
+@logged_job("image_prep")
+async def prepare_scheduled_media(schedule_ids: List[Any]) -> Dict[str, int]:
+    """Background task after scheduling: download + prepare images of Instagram posts among `schedule_ids`."""
+    from app.db import db
+    from app.media_cache import MEDIA_PREFETCH_CONCURRENCY, get_local_media
+
+    if not schedule_ids:
+        return {"images": 0, "prepared": 0}
+    rows = await db.fetch_all(
+        """
+        SELECT DISTINCT s.metadata->>'media_url' AS url
+        FROM scheduled_posts s JOIN social_accounts a ON a.id = s.social_account_id
+        WHERE s.id = ANY(CAST(:ids AS uuid[])) AND a.provider = 'instagram' AND s.metadata->>'media_url' IS NOT NULL
+        """,
+        values={"ids": [str(i) for i in schedule_ids]},
+    )
+    urls = [r["url"] for r in rows if is_image(r["url"])]
+    stats = {"images": len(urls), "prepared": 0}
+    sem = asyncio.Semaphore(MEDIA_PREFETCH_CONCURRENCY)
+
+    async def _one(url):
+        async with sem:
+            try:
+                local = await get_local_media(url)
+                if await instagram_variant(local) != local:
+                    stats["prepared"] += 1
+            except Exception as e:
+                log.warning("image prep error", extra={"url": url, "error": str(e)})
+
+    await asyncio.gather(*(_one(u) for u in urls))
+    return stats
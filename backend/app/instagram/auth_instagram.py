@@ -9,9 +9,10 @@ SECURITY NOTE: Storing credentials is sensitive. We encrypt with FERNET_KEY but
 import os
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from instagrapi import Client
+from app.analytics import invalidate_user_analytics
 from app.auth_supabase import verify_supabase_jwt
 from app.db import db
+from app.instagram import client as ig_client
 from app.utils.crypto import encrypt, decrypt
 
 router = APIRouter()
@@ -27,7 +28,7 @@ async def connect_ig(payload: IGConnectIn, jwt_payload=Depends(verify_supabase_j
     username = payload.username
     password = payload.password
 
-    c = Client()
+    c = ig_client.new_client()
     try:
         c.login(username, password)
     except Exception as e:
@@ -40,6 +41,7 @@ async def connect_ig(payload: IGConnectIn, jwt_payload=Depends(verify_supabase_j
 
     # store in social_accounts table
     await db.execute("INSERT INTO social_accounts (user_id, provider, provider_user_id, access_token, refresh_token, scopes, expires_at, created_at) VALUES (:u, 'instagram', :puid, :at, NULL, NULL, NULL, NOW()) ON CONFLICT (user_id, provider) DO UPDATE SET provider_user_id = EXCLUDED.provider_user_id, access_token = EXCLUDED.access_token", values={"u": user_id, "puid": username, "at": enc})
+    invalidate_user_analytics(user_id)
 
     return {"status": "connected", "provider_user_id": username}
 
@@ -48,4 +50,5 @@ async def connect_ig(payload: IGConnectIn, jwt_payload=Depends(verify_supabase_j
 async def disconnect_ig(jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get('sub')
     await db.execute("DELETE FROM social_accounts WHERE user_id = :u AND provider = 'instagram'", values={"u": user_id})
+    invalidate_user_analytics(user_id)
     return {"status": "disconnected"}
@@ -0,0 +1,44 @@
+# app/instagram/client.py
+"""
+instagrapi client factory.
+
+instagrapi pulls in ~0.2s of imports (pycryptodome, pydantic models for every endpoint), so it
+is imported on the first Instagram call instead of at startup (see app.providers).
+
+Every HTTP request the client makes is bounded by INSTAGRAPI_HTTP_TIMEOUT and by what is left of
+the caller's deadline (app.deadline). instagrapi's own `request_timeout` is a sleep between
+requests, not a network timeout, and its sessions have none by default.
+"""
+import os
+
+from app.deadline import budget
+from app.providers import lazy_import, require_provider
+
+INSTAGRAPI_HTTP_TIMEOUT = float(os.getenv("INSTAGRAPI_HTTP_TIMEOUT", "30"))  # 0 = no cap
+
+
+def _bounded(session):
+    request = session.request
+
+    def bounded_request(method, url, **kwargs):
+        cap = INSTAGRAPI_HTTP_TIMEOUT or None
+        given = kwargs.get("timeout")
+        if isinstance(given, (int, float)):
+            cap = given if cap is None else min(cap, given)
+        # runs in the to_thread worker, which carries the caller's deadline; raises once it has passed
+        timeout = budget(cap)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return request(method, url, **kwargs)
+
+    session.request = bounded_request
+
+
+def new_client():
+    require_provider("instagram")
+    client = lazy_import("instagrapi").Client()
+    for name in ("private", "public"):
+        session = getattr(client, name, None)
+        if session is not None and hasattr(session, "request"):
+            _bounded(session)
+    return client
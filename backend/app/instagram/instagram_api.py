@@ -10,15 +10,43 @@ Provides endpoints to:
 Note: instagrapi must be installed. This file uses Client.import_settings to restore session.
 """
 import os
+import asyncio
+from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException
 from typing import Optional, List
-from instagrapi import Client
+from app.instagram import client as ig_client
 from app.auth_supabase import verify_supabase_jwt
 from app.db import db
+from app.metrics import provider_call
+from app.deadline import DeadlineExceeded, with_deadline
+from app.media_cache import is_cached_path, is_remote_url
 from app.utils.crypto import encrypt, decrypt
+from app.utils.cursor import encode_cursor, decode_cursor
+from app.instagram.instagram_sync import list_mirrored_medias, sync_user
 
 router = APIRouter()
 
+def _restore_client(sess: str):
+    """Blocking (SDK import, session login over HTTP): run in a worker thread."""
+    c = ig_client.new_client()
+    # instagrapi expects dict-like settings; we eval (careful)
+    try:
+        settings = eval(sess)
+    except Exception as e:
+        raise HTTPException(500, f'invalid session blob: {e}')
+    c.set_settings_dict(settings)
+    with provider_call('instagram', 'login'):
+        try:
+            c.login_by_session(settings)
+        except Exception:
+            # fallback: import settings
+            try:
+                c.set_settings_dict(settings)
+                c.relogin()
+            except Exception as e2:
+                raise HTTPException(500, f'failed to restore session: {e2}')
+    return c
+
 async def _load_client_from_user(user_id: str):
     row = await db.fetch_one("SELECT access_token, provider_user_id FROM social_accounts WHERE user_id = :u AND provider = 'instagram'", values={"u": user_id})
     if not row:
@@ -28,23 +56,7 @@ async def _load_client_from_user(user_id: str):
         sess = decrypt(enc)
     except Exception as e:
         raise HTTPException(500, f'session decrypt failed: {e}')
-    c = Client()
-    # instagrapi expects dict-like settings; we eval (careful)
-    try:
-        settings = eval(sess)
-    except Exception as e:
-        raise HTTPException(500, f'invalid session blob: {e}')
-    c.set_settings_dict(settings)
-    try:
-        c.login_by_session(settings)
-    except Exception:
-        # fallback: import settings
-        try:
-            c.set_settings_dict(settings)
-            c.relogin()
-        except Exception as e2:
-            raise HTTPException(500, f'failed to restore session: {e2}')
-    return c
+    return await with_deadline(asyncio.to_thread(_restore_client, sess))
 
 @router.get('/me')
 async def me(jwt_payload=Depends(verify_supabase_jwt)):
@@ -55,36 +67,56 @@ async def me(jwt_payload=Depends(verify_supabase_jwt)):
     return {"provider_user_id": row['provider_user_id']}
 
 @router.get('/posts')
-async def list_posts(jwt_payload=Depends(verify_supabase_jwt)):
+async def list_posts(jwt_payload=Depends(verify_supabase_jwt), limit: int = 50, cursor: Optional[str] = None):
+    # served from the local mirror (instagram_sync); first request for a never-synced account syncs inline
     user_id = jwt_payload.get('sub')
-    c = await _load_client_from_user(user_id)
-    medias = c.user_medias(c.user_id, 50)
+    limit = max(1, min(limit, 200))
+    before = decode_cursor(cursor) if cursor else None
+    rows = await list_mirrored_medias(user_id, limit, before)
+    if not rows and not cursor:
+        synced = await db.fetch_one("SELECT 1 FROM instagram_sync_state s JOIN social_accounts a ON a.id = s.social_account_id WHERE a.user_id = :u AND a.provider = 'instagram'", values={"u": user_id})
+        if not synced and await sync_user(user_id):
+            rows = await list_mirrored_medias(user_id, limit)
     result = []
-    for m in medias:
+    for m in rows:
         result.append({
-            'id': m.pk,
-            'media_type': m.media_type,
-            'caption': m.caption,
-            'like_count': m.like_count,
-            'comment_count': m.comment_count,
-            'taken_at': m.taken_at.isoformat() if m.taken_at else None,
+            'id': m['media_pk'],
+            'media_type': m['media_type'],
+            'caption': m['caption'],
+            'like_count': m['like_count'],
+            'comment_count': m['comment_count'],
+            'taken_at': m['taken_at'].isoformat() if m['taken_at'] else None,
         })
-    return {'posts': result}
+    next_cursor = encode_cursor(rows[-1]['taken_at'], rows[-1]['media_pk']) if len(rows) == limit else None
+    return {'posts': result, 'next_cursor': next_cursor}
+
+@router.post('/sync')
+async def sync_posts(jwt_payload=Depends(verify_supabase_jwt)):
+    user_id = jwt_payload.get('sub')
+    stats = await sync_user(user_id)
+    if stats is None:
+        raise HTTPException(404, 'instagram not connected')
+    return stats
 
 @router.get('/post/{post_id}')
 async def get_post(post_id: int, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get('sub')
     c = await _load_client_from_user(user_id)
-    m = c.media_info(post_id)
-    return {'id': m.pk, 'caption': m.caption, 'comments': [com.dict() for com in c.media_comments(m.pk, 50)]}
+    m = await with_deadline(asyncio.to_thread(c.media_info, post_id))
+    comments = await with_deadline(asyncio.to_thread(c.media_comments, m.pk, 50))
+    return {'id': m.pk, 'caption': m.caption, 'comments': [com.dict() for com in comments]}
 
 @router.post('/publish')
 async def publish_photo(media_url: str, caption: Optional[str] = None, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get('sub')
+    if not is_remote_url(media_url):
+        raise HTTPException(400, 'media_url must be an http(s) URL')
     c = await _load_client_from_user(user_id)
     # download and upload handled by instagrapi via URL
     try:
-        res = c.photo_upload_url(media_url, caption or '')
+        res = await with_deadline(asyncio.to_thread(c.photo_upload_url, media_url, caption or ''))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(500, f'publish failed: {e}')
     # store post
@@ -92,9 +124,10 @@ async def publish_photo(media_url: str, caption: Optional[str] = None, jwt_paylo
     return {'platform_post_id': str(res)}
 
 # internal helper used by main.publish_now and scheduled jobs
-async def publish_now_internal(account_row, content: str, media: Optional[List[str]], access_token_blob: Optional[str] = None):
+async def publish_now_internal(account_row, content: str, media: Optional[List[str]], access_token_blob: Optional[str] = None, local_path: Optional[str] = None):
     # account_row is the full social_accounts row
     # access_token_blob if provided is the encrypted session
+    # local_path: media cache file for media[0], set by the scheduled publisher; media itself is always a URL
     enc = account_row.get('access_token') or access_token_blob
     if not enc:
         raise HTTPException(401, 'no session')
@@ -102,18 +135,32 @@ async def publish_now_internal(account_row, content: str, media: Optional[List[s
         sess = decrypt(enc)
     except Exception as e:
         raise HTTPException(500, f'session decrypt: {e}')
-    c = Client()
+    c = ig_client.new_client()
     settings = eval(sess)
     c.set_settings_dict(settings)
+    # instagrapi is synchronous: run it off the event loop, bounded by the request / job deadline
     try:
-        c.login_by_session(settings)
+        await with_deadline(asyncio.to_thread(c.login_by_session, settings))
+    except DeadlineExceeded:
+        raise
     except Exception:
         try:
-            c.relogin()
+            await with_deadline(asyncio.to_thread(c.relogin))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise HTTPException(500, f'relogin failed: {e}')
     if not media or len(media)==0:
         raise HTTPException(400, 'media required for IG publish')
     media_url = media[0]
-    res = c.photo_upload_url(media_url, content or '')
+    if local_path is not None and not is_cached_path(local_path):
+        raise HTTPException(500, 'local media outside the media cache')
+    if local_path is None and not is_remote_url(media_url):
+        raise HTTPException(400, 'media must be an http(s) URL')
+    with provider_call('instagram', 'upload'):
+        if local_path is not None:
+            # prefetched by app.media_cache: upload straight from disk
+            res = await with_deadline(asyncio.to_thread(c.photo_upload, Path(local_path), content or ''))
+        else:
+            res = await with_deadline(asyncio.to_thread(c.photo_upload_url, media_url, content or ''))
     return {'platform_post_id': str(res)}
@@ -0,0 +1,221 @@
+# app/instagram/instagram_sync.py
+"""
+Incremental Instagram media sync into a local mirror (instagram_media).
+
+Per account, each run:
+- head pass: walks media pages from the newest until it reaches media already mirrored *and*
+  older than the refresh window (INSTAGRAM_REFRESH_DAYS); new media is inserted and like/comment
+  counts of recent media are refreshed on the way
+- if the head pass runs out of pages (INSTAGRAM_SYNC_MAX_PAGES) before reaching the mirrored
+  media, newest_taken_at is not advanced: the cursor is saved as head_cursor and the next run
+  continues from there until the gap is closed
+- backfill pass: continues from the saved end cursor for a few older pages until the account's
+  whole history is mirrored
+
+Progress lives in instagram_sync_state. /instagram/posts reads the mirror instead of calling
+instagrapi on every request. All instagrapi calls run in worker threads.
+"""
+import os
+import asyncio
+import datetime
+from typing import Any, Dict, List, Optional
+
+from app.db import db, db_ro
+from app.log import get_logger, logged_job
+from app.metrics import provider_call
+
+INSTAGRAM_SYNC_MAX_PAGES = int(os.getenv("INSTAGRAM_SYNC_MAX_PAGES", "5"))
+INSTAGRAM_BACKFILL_PAGES = int(os.getenv("INSTAGRAM_BACKFILL_PAGES", "2"))
+INSTAGRAM_REFRESH_DAYS = int(os.getenv("INSTAGRAM_REFRESH_DAYS", "7"))
+INSTAGRAM_SYNC_CONCURRENCY = int(os.getenv("INSTAGRAM_SYNC_CONCURRENCY", "4"))
+
+log = get_logger(__name__)
+
+
+def _media_row(m) -> Dict[str, Any]:
+    return {
+        "pk": str(m.pk),
+        "media_type": m.media_type,
+        "caption": getattr(m, "caption_text", None),
+        "like_count": m.like_count,
+        "comment_count": m.comment_count,
+        "taken_at": m.taken_at,
+    }
+
+
+async def upsert_medias(account_id, user_id, medias: List[Dict[str, Any]]):
+    """One multi-row upsert; existing rows get fresh counts/caption."""
+    if not medias:
+        return
+    placeholders = []
+    values: Dict[str, Any] = {"acc": account_id, "uid": user_id}
+    for i, m in enumerate(medias):
+        placeholders.append(f"(:acc, :uid, :pk{i}, :mt{i}, :cap{i}, :lc{i}, :cc{i}, :ta{i}, NOW(), NOW())")
+        values.update({f"pk{i}": m["pk"], f"mt{i}": m["media_type"], f"cap{i}": m["caption"],
+                       f"lc{i}": m["like_count"], f"cc{i}": m["comment_count"], f"ta{i}": m["taken_at"]})
+    await db.execute(
+        "INSERT INTO instagram_media (social_account_id, user_id, media_pk, media_type, caption, like_count, comment_count, taken_at, synced_at, counts_refreshed_at) VALUES "
+        + ", ".join(placeholders)
+        + """
+        ON CONFLICT (social_account_id, media_pk) DO UPDATE SET
+            caption = EXCLUDED.caption,
+            like_count = EXCLUDED.like_count,
+            comment_count = EXCLUDED.comment_count,
+            counts_refreshed_at = NOW()
+        """,
+        values=values,
+    )
+
+
+async def sync_account(account) -> Dict[str, Any]:
+    """Syncs one social_accounts row (provider = 'instagram')."""
+    from app.instagram.instagram_api import _load_client_from_user
+
+    account_id, user_id = account["id"], account["user_id"]
+    state = await db.fetch_one(
+        "SELECT newest_taken_at, backfill_cursor, backfill_done, head_cursor, head_newest_taken_at FROM instagram_sync_state WHERE social_account_id = :acc",
+        values={"acc": account_id},
+    )
+    newest_known: Optional[datetime.datetime] = state["newest_taken_at"] if state else None
+    backfill_cursor = state["backfill_cursor"] if state else None
+    backfill_done = bool(state["backfill_done"]) if state else False
+    head_cursor = state["head_cursor"] if state else None
+    head_newest = state["head_newest_taken_at"] if state else None
+
+    c = await _load_client_from_user(user_id)
+    refresh_after = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=INSTAGRAM_REFRESH_DAYS)
+    stats = {"account_id": str(account_id), "head_pages": 0, "backfill_pages": 0, "upserted": 0}
+    newest = newest_known
+
+    async def _walk(cursor: str, stop_before: Optional[datetime.datetime]):
+        """Pages from `cursor` until media older than `stop_before` or the end; returns (cursor, newest seen, reached)."""
+        seen = None
+        while stats["head_pages"] < INSTAGRAM_SYNC_MAX_PAGES:
+            with provider_call("instagram", "medias_page"):
+                medias, cursor = await asyncio.to_thread(c.user_medias_chunk, c.user_id, cursor)
+            stats["head_pages"] += 1
+            rows = [_media_row(m) for m in medias]
+            await upsert_medias(account_id, user_id, rows)
+            stats["upserted"] += len(rows)
+            taken = [r["taken_at"] for r in rows if r["taken_at"]]
+            if taken:
+                seen = max([seen] + taken) if seen else max(taken)
+            if not cursor or (stop_before and taken and min(taken) < stop_before):
+                return cursor, seen, True
+        return cursor, seen, False
+
+    if head_cursor and newest_known:
+        # 1a) gap pass: the last head pass stopped early; fill in down to the mirrored media
+        cursor, _, reached = await _walk(head_cursor, newest_known)
+        if reached:
+            newest = max(newest_known, head_newest) if head_newest else newest_known
+            head_cursor, head_newest = None, None
+        else:
+            head_cursor = cursor
+        stats["gap_closed"] = reached
+    else:
+        # 1) head pass: newest first, stop once we're past both the known head and the refresh window
+        cursor, seen, reached = await _walk("", min(newest_known, refresh_after) if newest_known else None)
+        if newest_known is None or reached:
+            if seen:
+                newest = max(newest, seen) if newest else seen
+        else:
+            # media between this pass and newest_known isn't mirrored yet: keep the head marker
+            head_cursor, head_newest = cursor, seen
+            stats["gap_closed"] = False
+        if backfill_cursor is None and not backfill_done:
+            # first sync: older history continues where the head pass stopped
+            backfill_cursor = cursor or None
+            backfill_done = not cursor
+
+    # 2) backfill pass: a few older pages per run
+    pages = 0
+    while backfill_cursor and pages < INSTAGRAM_BACKFILL_PAGES:
+        with provider_call("instagram", "medias_page"):
+            medias, next_cursor = await asyncio.to_thread(c.user_medias_chunk, c.user_id, backfill_cursor)
+        pages += 1
+        rows = [_media_row(m) for m in medias]
+        await upsert_medias(account_id, user_id, rows)
+        stats["upserted"] += len(rows)
+        backfill_cursor = next_cursor or None
+        backfill_done = not next_cursor
+    stats["backfill_pages"] = pages
+    stats["backfill_done"] = backfill_done
+
+    await db.execute(
+        """
+        INSERT INTO instagram_sync_state (social_account_id, newest_taken_at, backfill_cursor, backfill_done, head_cursor, head_newest_taken_at, last_synced_at)
+        VALUES (:acc, :newest, :bc, :bd, :hc, :hn, NOW())
+        ON CONFLICT (social_account_id) DO UPDATE SET
+            newest_taken_at = EXCLUDED.newest_taken_at,
+            backfill_cursor = EXCLUDED.backfill_cursor,
+            backfill_done = EXCLUDED.backfill_done,
+            head_cursor = EXCLUDED.head_cursor,
+            head_newest_taken_at = EXCLUDED.head_newest_taken_at,
+            last_synced_at = NOW()
+        """,
+        values={"acc": account_id, "newest": newest, "bc": backfill_cursor, "bd": backfill_done, "hc": head_cursor, "hn": head_newest},
+    )
+    return stats
+
+
+async def sync_user(user_id: str) -> Optional[Dict[str, Any]]:
+    account = await db.fetch_one("SELECT id, user_id FROM social_accounts WHERE user_id = :u AND provider = 'instagram'", values={"u": user_id})
+    if not account:
+        return None
+    return await sync_account(account)
+
+
+@logged_job("instagram_sync")
+async def sync_all_instagram() -> Dict[str, Any]:
+    """Scheduler job: syncs every Instagram account (keyset pages, bounded concurrency)."""
+    sem = asyncio.Semaphore(INSTAGRAM_SYNC_CONCURRENCY)
+    totals = {"accounts": 0, "errors": 0, "upserted": 0}
+
+    async def _one(account):
+        async with sem:
+            try:
+                st = await sync_account(account)
+                totals["upserted"] += st["upserted"]
+            except Exception as e:
+                totals["errors"] += 1
+                log.warning("instagram sync failed", extra={"account_id": str(account["id"]), "error": str(getattr(e, "detail", e))})
+
+    after = None
+    while True:
+        if after is None:
+            rows = await db.fetch_all("SELECT id, user_id FROM social_accounts WHERE provider = 'instagram' ORDER BY id LIMIT 200")
+        else:
+            rows = await db.fetch_all("SELECT id, user_id FROM social_accounts WHERE provider = 'instagram' AND id > :after ORDER BY id LIMIT 200", values={"after": after})
+        if not rows:
+            break
+        totals["accounts"] += len(rows)
+        await asyncio.gather(*(_one(r) for r in rows))
+        after = rows[-1]["id"]
+    log.info("instagram sync done", extra=totals)
+    return totals
+
+
+async def list_mirrored_medias(user_id: str, limit: int = 50, before: Optional[tuple] = None) -> List[Any]:
+    """Mirror rows newest first; `before` = (taken_at, media_pk) of the last row of the previous page."""
+    if before:
+        return await db_ro.fetch_all(
+            """
+            SELECT media_pk, media_type, caption, like_count, comment_count, taken_at
+            FROM instagram_media
+            WHERE user_id = :u AND (taken_at, media_pk) < (:ts, :pk)
+            ORDER BY taken_at DESC, media_pk DESC
+            LIMIT :lim
+            """,
+            values={"u": user_id, "ts": before[0], "pk": before[1], "lim": limit},
+        )
+    return await db_ro.fetch_all(
+        """
+        SELECT media_pk, media_type, caption, like_count, comment_count, taken_at
+        FROM instagram_media
+        WHERE user_id = :u
+        ORDER BY taken_at DESC, media_pk DESC
+        LIMIT :lim
+        """,
+        values={"u": user_id, "lim": limit},
+    )
@@ -0,0 +1,270 @@
+# app/key_rotation.py
+"""
+Re-encrypts stored secrets with the newest Fernet key (see app/utils/crypto.py for the keyring).
+
+Targets: social_accounts.access_token and user_api_keys.encrypted_api_key. Progress lives in
+key_rotation_progress (migrations/sql_migrations_v2.sql, one row per target):
+
+- start_rotation() (POST /admin/keys/rotate or app/scripts/rotate_keys.py) opens a run for the
+  current primary key; a run for the same key that is already open or done is left as is
+- workers (this instance right away, every instance through the KEY_ROTATION_POLL_SECONDS job)
+  claim a target with a lease, walk it in keyset batches of KEY_ROTATION_BATCH_SIZE rows and
+  checkpoint the last key after each batch, so a restarted or killed worker resumes where it stopped
+- only instances whose primary key is the run's key claim it, so an instance still running the
+  previous keyring during a rolling deploy can't rotate rows back
+- rows already on the primary key are skipped without decrypting; rows no key can read (e.g.
+  plaintext tokens) are counted as unreadable and left untouched
+- each row is written with compare-and-swap on the old ciphertext, so a token the app rewrites
+  concurrently (re-login, new API key) is never overwritten
+- throttled to KEY_ROTATION_ROWS_PER_SECOND, and a batch is delayed while requests are waiting for
+  a pool connection, so the job stays out of the way of production traffic
+"""
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.fernet import InvalidToken
+
+from app.db import db
+from app.analytics_shards import default_worker_id
+from app.log import get_logger, logged_job
+from app.utils.crypto import fernet, is_current, PRIMARY_KEY_ID, KEY_IDS
+
+KEY_ROTATION_BATCH_SIZE = int(os.getenv("KEY_ROTATION_BATCH_SIZE", "200"))
+# upper bound for rows read per second (0 = unthrottled)
+KEY_ROTATION_ROWS_PER_SECOND = float(os.getenv("KEY_ROTATION_ROWS_PER_SECOND", "200"))
+# must comfortably exceed the time needed for one batch
+KEY_ROTATION_LEASE_SECONDS = int(os.getenv("KEY_ROTATION_LEASE_SECONDS", "120"))
+# pause before the next batch while requests queue for a DB connection
+KEY_ROTATION_BACKOFF_SECONDS = float(os.getenv("KEY_ROTATION_BACKOFF_SECONDS", "1"))
+
+log = get_logger(__name__)
+
+# target -> table, encrypted column, keyset columns with their SQL types
+TARGETS = {
+    "social_accounts.access_token": {
+        "table": "social_accounts", "column": "access_token", "key": [("id", "uuid")],
+    },
+    "user_api_keys.encrypted_api_key": {
+        "table": "user_api_keys", "column": "encrypted_api_key", "key": [("user_id", "uuid"), ("provider", "text")],
+    },
+}
+
+
+class RotationLeaseLost(RuntimeError):
+    pass
+
+
+async def start_rotation(force: bool = False) -> Dict[str, Any]:
+    """Opens a run for the current primary key on every target. force=True restarts finished runs from the beginning."""
+    for target in TARGETS:
+        await db.execute(
+            """
+            INSERT INTO key_rotation_progress (target, key_id, status, started_at, updated_at)
+            VALUES (:target, :key_id, 'running', NOW(), NOW())
+            ON CONFLICT (target) DO UPDATE SET
+                key_id = EXCLUDED.key_id, status = 'running', owner = NULL, lease_until = NULL, checkpoint = NULL,
+                rows_scanned = 0, rows_rotated = 0, rows_current = 0, rows_unreadable = 0,
+                started_at = NOW(), updated_at = NOW(), finished_at = NULL
+            WHERE key_rotation_progress.key_id <> EXCLUDED.key_id OR CAST(:force AS boolean)
+            """,
+            values={"target": target, "key_id": PRIMARY_KEY_ID, "force": force},
+        )
+    return await rotation_progress()
+
+
+async def claim_target(owner: str) -> Optional[Any]:
+    """Claims an open target of the current key whose lease is free. Returns None if nothing is claimable."""
+    return await db.fetch_one(
+        """
+        UPDATE key_rotation_progress p
+        SET owner = :owner, lease_until = NOW() + CAST(:lease AS integer) * INTERVAL '1 second', updated_at = NOW()
+        FROM (
+            SELECT target FROM key_rotation_progress
+            WHERE status = 'running' AND key_id = :key_id AND (lease_until IS NULL OR lease_until < NOW())
+            ORDER BY target
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ) c
+        WHERE p.target = c.target
+        RETURNING p.target, p.checkpoint
+        """,
+        values={"owner": owner, "lease": KEY_ROTATION_LEASE_SECONDS, "key_id": PRIMARY_KEY_ID},
+    )
+
+
+async def _checkpoint(target: str, owner: str, cursor: Optional[list], counts: Dict[str, int], finish: bool = False):
+    row = await db.fetch_one(
+        """
+        UPDATE key_rotation_progress
+        SET checkpoint = COALESCE(CAST(:cursor AS jsonb), checkpoint),
+            rows_scanned = rows_scanned + :scanned, rows_rotated = rows_rotated + :rotated,
+            rows_current = rows_current + :current, rows_unreadable = rows_unreadable + :unreadable,
+            lease_until = CASE WHEN :finish THEN NULL ELSE NOW() + CAST(:lease AS integer) * INTERVAL '1 second' END,
+            status = CASE WHEN :finish THEN 'done' ELSE status END,
+            finished_at = CASE WHEN :finish THEN NOW() ELSE finished_at END,
+            updated_at = NOW()
+        WHERE target = :target AND owner = :owner AND key_id = :key_id AND status = 'running'
+        RETURNING target
+        """,
+        values={
+            "cursor": json.dumps(cursor) if cursor is not None else None, "lease": KEY_ROTATION_LEASE_SECONDS,
+            "finish": finish, "target": target, "owner": owner, "key_id": PRIMARY_KEY_ID, **counts,
+        },
+    )
+    if not row:
+        raise RotationLeaseLost(f"{target} was taken over by another worker or restarted")
+
+
+async def _release(target: str, owner: str):
+    # lets the next poll (on any instance) resume right away instead of waiting for the lease to expire
+    await db.execute(
+        "UPDATE key_rotation_progress SET lease_until = NULL WHERE target = :target AND owner = :owner AND status = 'running'",
+        values={"target": target, "owner": owner},
+    )
+
+
+async def _fetch_batch(spec: Dict[str, Any], cursor: Optional[list]):
+    keys = spec["key"]
+    cols = ", ".join(name for name, _ in keys)
+    values: Dict[str, Any] = {"limit": KEY_ROTATION_BATCH_SIZE}
+    after = ""
+    if cursor:
+        params = []
+        for i, ((_, sql_type), value) in enumerate(zip(keys, cursor)):
+            values[f"k{i}"] = value
+            params.append(f"CAST(:k{i} AS {sql_type})")
+        after = f"AND ({cols}) > ({', '.join(params)})"
+    return await db.fetch_all(
+        f"SELECT {cols}, {spec['column']} AS token FROM {spec['table']} "
+        f"WHERE {spec['column']} IS NOT NULL {after} ORDER BY {cols} LIMIT :limit",
+        values=values,
+    )
+
+
+def _reencrypt(rows, key_names: List[str]) -> Tuple[List[tuple], int, int]:
+    """(key values..., old token, new token) for rows that need rotating, plus current / unreadable counts."""
+    updates, current, unreadable = [], 0, 0
+    for row in rows:
+        token = row["token"]
+        if is_current(token):
+            current += 1
+            continue
+        try:
+            new_token = fernet.rotate(token.encode()).decode()
+        except InvalidToken:
+            unreadable += 1
+            continue
+        updates.append(tuple(str(row[k]) for k in key_names) + (token, new_token))
+    return updates, current, unreadable
+
+
+async def _apply(spec: Dict[str, Any], updates: List[tuple]) -> int:
+    """Writes a batch in one statement; only rows still holding the old ciphertext are changed."""
+    keys = spec["key"]
+    values: Dict[str, Any] = {}
+    columns, match = [], []
+    for i, (name, sql_type) in enumerate(keys):
+        values[f"k{i}"] = [u[i] for u in updates]
+        columns.append(f"CAST(:k{i} AS {sql_type}[])")
+        match.append(f"t.{name} = v.{name}")
+    values["old"] = [u[-2] for u in updates]
+    values["new"] = [u[-1] for u in updates]
+    names = ", ".join(name for name, _ in keys)
+    return await db.fetch_val(
+        f"""
+        WITH changed AS (
+            UPDATE {spec['table']} t SET {spec['column']} = v.new_token
+            FROM unnest({', '.join(columns)}, CAST(:old AS text[]), CAST(:new AS text[])) AS v({names}, old_token, new_token)
+            WHERE {' AND '.join(match)} AND t.{spec['column']} = v.old_token
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM changed
+        """,
+        values=values,
+    )
+
+
+async def _throttle(rows: int, started: float):
+    delay = rows / KEY_ROTATION_ROWS_PER_SECOND - (time.monotonic() - started) if KEY_ROTATION_ROWS_PER_SECOND > 0 else 0
+    if delay > 0:
+        await asyncio.sleep(delay)
+    # requests are queueing for a connection: yield until the pool drains
+    waited = 0.0
+    while db.waiting > 0 and waited < KEY_ROTATION_LEASE_SECONDS / 2:
+        await asyncio.sleep(KEY_ROTATION_BACKOFF_SECONDS)
+        waited += KEY_ROTATION_BACKOFF_SECONDS
+
+
+async def rotate_target(claim, owner: str) -> Dict[str, Any]:
+    """Re-encrypts one claimed target from its checkpoint onwards, checkpointing after every batch."""
+    target = claim["target"]
+    spec = TARGETS[target]
+    key_names = [name for name, _ in spec["key"]]
+    cursor = json.loads(claim["checkpoint"]) if claim["checkpoint"] else None
+    totals = {"scanned": 0, "rotated": 0, "current": 0, "unreadable": 0}
+    started = time.monotonic()
+    while True:
+        batch_started = time.monotonic()
+        rows = await _fetch_batch(spec, cursor)
+        if not rows:
+            break
+        updates, current, unreadable = _reencrypt(rows, key_names)
+        rotated = await _apply(spec, updates) if updates else 0
+        cursor = [str(rows[-1][k]) for k in key_names]
+        counts = {"scanned": len(rows), "rotated": rotated, "current": current, "unreadable": unreadable}
+        await _checkpoint(target, owner, cursor, counts)
+        for k, v in counts.items():
+            totals[k] += v
+        if len(rows) < KEY_ROTATION_BATCH_SIZE:
+            break
+        await _throttle(len(rows), batch_started)
+    await _checkpoint(target, owner, None, {"scanned": 0, "rotated": 0, "current": 0, "unreadable": 0}, finish=True)
+    totals.update({"target": target, "key_id": PRIMARY_KEY_ID, "seconds": round(time.monotonic() - started, 2)})
+    return totals
+
+
+@logged_job("key_rotation")
+async def run_rotation(owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Claims and re-encrypts targets until none of the current key's runs are left open."""
+    owner = owner or default_worker_id()
+    results = []
+    while True:
+        claim = await claim_target(owner)
+        if not claim:
+            break
+        try:
+            stats = await rotate_target(claim, owner)
+        except RotationLeaseLost as e:
+            log.warning("key rotation lease lost", extra={"error": str(e)})
+            continue
+        except BaseException:
+            await _release(claim["target"], owner)
+            raise
+        log.info("key rotation done", extra={"stats": stats})
+        results.append(stats)
+    return results
+
+
+async def rotation_progress() -> Dict[str, Any]:
+    rows = await db.fetch_all(
+        "SELECT target, key_id, status, owner, lease_until, checkpoint, rows_scanned, rows_rotated, rows_current, "
+        "rows_unreadable, started_at, updated_at, finished_at FROM key_rotation_progress ORDER BY target"
+    )
+    targets = []
+    for r in rows:
+        item = dict(r)
+        if isinstance(item["checkpoint"], str):
+            item["checkpoint"] = json.loads(item["checkpoint"])
+        spec = TARGETS.get(item["target"])
+        if spec:
+            item["rows_total"] = await db.fetch_val(f"SELECT COUNT(*) FROM {spec['table']} WHERE {spec['column']} IS NOT NULL")
+        targets.append(item)
+    return {
+        "primary_key_id": PRIMARY_KEY_ID,
+        "key_ids": KEY_IDS,
+        "done": all(t["status"] == "done" and t["key_id"] == PRIMARY_KEY_ID for t in targets) and len(targets) == len(TARGETS),
+        "targets": targets,
+    }
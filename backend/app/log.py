@@ -0,0 +1,211 @@
+# app/log.py
+"""
+Structured, non-blocking logging.
+
+- get_logger(__name__) returns a stdlib logger under "app" whose records go through a
+  QueueHandler: the caller formats the message and enqueues it, a background QueueListener
+  thread writes to stdout. A slow or blocked stdout therefore never stalls the event loop.
+- LOG_LEVEL (default INFO); LOG_FORMAT=json (default, one object per line) or text
+- fields passed as extra={...} become top-level keys of the JSON line
+- correlation ids: RequestIdMiddleware takes X-Request-ID from the request (or makes one up) and
+  echoes it on the response; @logged_job(name) gives every scheduler run a job_id. Both live in
+  contextvars, so they follow the request / job across awaits and asyncio.to_thread.
+- sampling: DEBUG records are kept with probability LOG_DEBUG_SAMPLE_RATE (default 1); a
+  high-volume line can set its own rate with extra={"sample": 0.01}
+- the queue is bounded (LOG_QUEUE_SIZE). If the writer falls behind, records are dropped and
+  counted (log_records_dropped_total) instead of blocking the caller.
+
+Measure the per-call cost with `python -m app.scripts.bench_logging`.
+"""
+import os
+import re
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import datetime
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from app.metrics import log_records_dropped
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_job_id: ContextVar[Optional[str]] = ContextVar("job_id", default=None)
+
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+# attributes every LogRecord has; anything else on a record came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "job_id", "sample"}
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the caller's thread / context: applies sampling and stamps the correlation ids."""
+
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        if rate is None:
+            rate = LOG_DEBUG_SAMPLE_RATE if record.levelno <= logging.DEBUG else 1.0
+        if rate < 1.0 and random.random() >= rate:
+            return False
+        record.request_id = _request_id.get()
+        record.job_id = _job_id.get()
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # merge args and render the traceback here: the writer thread must not touch live objects
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+def _extras(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            out["request_id"] = record.request_id
+        if getattr(record, "job_id", None):
+            out["job_id"] = record.job_id
+        out.update(_extras(record))
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        ts = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S.%f")[:-3]
+        ids = getattr(record, "request_id", None) or getattr(record, "job_id", None)
+        parts = [ts, f"{record.levelname:<7}", record.name]
+        if ids:
+            parts.append(f"[{ids}]")
+        parts.append(record.getMessage())
+        parts.extend(f"{k}={v}" for k, v in _extras(record).items())
+        line = " ".join(parts)
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+def configure_logging(stream=None, level: Optional[str] = None, fmt: Optional[str] = None, force: bool = False):
+    """Attaches the queue handler to the "app" logger and starts the writer thread (once)."""
+    global _listener
+    with _lock:
+        if _listener is not None and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+        root = logging.getLogger("app")
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        out = logging.StreamHandler(stream or sys.stdout)
+        out.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+        q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _QueueHandler(q)
+        handler.addFilter(_ContextFilter())
+        root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+        # uvicorn configures the root logger; don't print everything twice
+        root.propagate = False
+        _listener = QueueListener(q, out)
+        _listener.start()
+
+
+def flush_logging():
+    """Stops the writer after it has drained the queue (registered with atexit)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(flush_logging)
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(name if name.startswith("app") else f"app.{name}")
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def job_context(name: str):
+    token = _job_id.set(f"{name}-{uuid.uuid4().hex[:8]}")
+    try:
+        yield _job_id.get()
+    finally:
+        _job_id.reset(token)
+
+
+def logged_job(name: str):
+    """Decorator for async scheduler jobs: every run gets its own job_id."""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with job_context(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class RequestIdMiddleware:
+    """Sets request_id for everything logged while serving a request and returns it as X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for key, value in scope.get("headers") or []:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or not _REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        token = _request_id.set(request_id)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers") or []) + [(b"x-request-id", request_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_id.reset(token)
@@ -10,34 +10,62 @@ Assumptions / notes:
     - app.youtube.youtube_upload.upload_from_url_internal(account_row, url, title)
   The code attempts to import these helpers; if missing the endpoints will raise a helpful error.
 - APScheduler (AsyncIOScheduler) is used as an in-process scheduler (you chose APScheduler).
-- Fernet key must be set in FERNET_KEY env var.
+- Fernet keys must be set in FERNET_KEYS (newest first) and/or FERNET_KEY; see app/utils/crypto.py.
 - Keep this file as the single source of truth for routes and scheduler wiring.
 """
 
 import os
+import json
 import asyncio
 import datetime
 import time
 from typing import Optional, List, Any, Dict
 
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel
-from cryptography.fernet import Fernet
 
 # Scheduler
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 # Core app modules (must exist)
-from app.auth_supabase import verify_supabase_jwt
-from app.db import db
+from app.auth_supabase import verify_supabase_jwt, verify_admin
+from app.db import db, db_ro, connect_databases, disconnect_databases, pool_stats
 from app.ai_adapter import generate_text
+from app.analytics import build_overview, analytics_cache, invalidate_user_analytics
+from app.analytics_collector import collect_analytics
+from app.analytics_shards import create_collection_run, run_shard_worker, collection_progress
+from app.analytics_rollups import query_series
+from app.key_rotation import start_rotation, run_rotation, rotation_progress
+from app.utils.crypto import fernet
+from app.engagement import EngagementFrame, load_user_post_metrics, score, to_response
+from app.user_stats import get_user_stats, check_user_stats
+from app.etags import ALL_RESOURCES, user_etag, is_fresh, etag_headers, not_modified
+from app.media_cache import MEDIA_PREFETCH_MINUTES, prefetch_due_media, resolve_media, cache_stats, is_remote_url, pinned
+from app.image_prep import instagram_variant, prepare_scheduled_media, shutdown_image_pool
+from app.schedule_import import BULK_SCHEDULE_MAX_ROWS, ImportFormatError, parse_import, validate_rows, insert_rows
+from app.metrics import (
+    MetricsMiddleware, render_metrics, publisher_due_backlog, publisher_queue_lag, publisher_posts,
+    publisher_delay_seconds, publisher_tick_seconds, deadline_exceeded,
+)
+from app.providers import ENABLED_PROVIDERS, provider_enabled, require_provider, loaded_sdks, start_preload
+from app.profiling import PROFILE_REQUESTS, ProfilingMiddleware, profiled_job, list_profiles, profile_path, profiling_config
+from app.log import RequestIdMiddleware, get_logger, logged_job
+from app.deadline import PUBLISH_TIMEOUT_SECONDS, DeadlineExceeded, DeadlineMiddleware, deadline_scope
+from app.compression import CompressionMiddleware
+from app.utils.http import close_http_client
+from app.utils.cursor import encode_cursor, decode_cursor
+from app.utils.streaming import ndjson_response
+from app.utils.responses import FastJSONResponse
 
 # Routers (instagram/youtube). Import routers and optionally internal helpers.
 from app.instagram import auth_instagram as instagram_auth_module
 from app.instagram import instagram_api as instagram_api_module
 
+from app.instagram.instagram_sync import sync_all_instagram
+
 from app.youtube import auth_youtube as youtube_auth_module
 from app.youtube import youtube_upload as youtube_upload_module
 from app.youtube import youtube_api as youtube_api_module
@@ -47,7 +75,7 @@ _publish_instagram_internal = getattr(instagram_api_module, "publish_now_interna
 _publish_youtube_internal = getattr(youtube_upload_module, "upload_from_url_internal", None)
 
 # App initialization
-app = FastAPI(title="AI Social Manager - Backend v0.5")
+app = FastAPI(title="AI Social Manager - Backend v0.5", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -56,17 +84,43 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if PROFILE_REQUESTS:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CompressionMiddleware)
+# inside the metrics middleware, so its 504s are counted
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+# outermost, so everything logged while serving a request carries its request_id
+app.add_middleware(RequestIdMiddleware)
+
+log = get_logger(__name__)
 
-# Fernet encryption
-FERNET_KEY = os.getenv("FERNET_KEY")
-if not FERNET_KEY:
-    raise RuntimeError("FERNET_KEY must be set in environment")
 
-fernet = Fernet(FERNET_KEY.encode())
+@app.exception_handler(DeadlineExceeded)
+async def _deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    # raised by budget-aware provider calls before the middleware's own deadline fires
+    deadline_exceeded.labels("handler").inc()
+    return JSONResponse({"detail": "deadline exceeded"}, status_code=504)
+
 
 # Scheduler instance
 scheduler = AsyncIOScheduler()
 
+# How often media of soon-due scheduled posts is prefetched into the local cache, in seconds (0 disables)
+MEDIA_PREFETCH_INTERVAL = int(os.getenv("MEDIA_PREFETCH_INTERVAL", "60"))
+
+# Upper bound for keyset-paginated list endpoints (/posts/history, /schedule)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Instagram media mirror sync interval in seconds (0 disables)
+INSTAGRAM_SYNC_INTERVAL = int(os.getenv("INSTAGRAM_SYNC_INTERVAL", "900"))
+
+# Every instance polls for unclaimed analytics shards this often (0 disables)
+COLLECT_SHARD_POLL_SECONDS = int(os.getenv("COLLECT_SHARD_POLL_SECONDS", "30"))
+
+# Every instance polls for open key rotation runs this often, so an interrupted run resumes (0 disables)
+KEY_ROTATION_POLL_SECONDS = int(os.getenv("KEY_ROTATION_POLL_SECONDS", "300"))
+
 # Pydantic models
 class StoreAIKeyIn(BaseModel):
     provider: str  # "openai" or "gemini"
@@ -87,24 +141,35 @@ class PublishNowIn(BaseModel):
     content: str
     media: Optional[List[str]] = None  # list of media URLs
 
-# Include routers from modules (namespaced)
-app.include_router(instagram_auth_module.router, prefix="/auth/instagram", tags=["instagram"])
-app.include_router(instagram_api_module.router, prefix="/instagram", tags=["instagram"])
+# Include routers from modules (namespaced); provider SDKs load on first use (app.providers)
+if provider_enabled("instagram"):
+    app.include_router(instagram_auth_module.router, prefix="/auth/instagram", tags=["instagram"])
+    app.include_router(instagram_api_module.router, prefix="/instagram", tags=["instagram"])
 
-app.include_router(youtube_auth_module.router, prefix="/auth/youtube", tags=["youtube"])
-app.include_router(youtube_upload_module.router, prefix="/youtube/upload", tags=["youtube"])
-app.include_router(youtube_api_module.router, prefix="/youtube", tags=["youtube"])
+if provider_enabled("youtube"):
+    app.include_router(youtube_auth_module.router, prefix="/auth/youtube", tags=["youtube"])
+    app.include_router(youtube_upload_module.router, prefix="/youtube/upload", tags=["youtube"])
+    app.include_router(youtube_api_module.router, prefix="/youtube", tags=["youtube"])
 
 
 # ---- Startup / Shutdown ----
 @app.on_event("startup")
 async def _startup():
-    await db.connect()
+    await connect_databases()
     # Start scheduler and add job to publish scheduled posts every 60 seconds
     if not scheduler.running:
         scheduler.start()
     # Ensure job exists
     scheduler.add_job(func=run_scheduled_publisher, trigger=IntervalTrigger(seconds=60), id="scheduled_publisher", replace_existing=True)
+    if INSTAGRAM_SYNC_INTERVAL > 0 and provider_enabled("instagram"):
+        scheduler.add_job(func=sync_all_instagram, trigger=IntervalTrigger(seconds=INSTAGRAM_SYNC_INTERVAL), id="instagram_media_sync", replace_existing=True)
+    if MEDIA_PREFETCH_INTERVAL > 0 and MEDIA_PREFETCH_MINUTES > 0:
+        scheduler.add_job(func=prefetch_due_media, trigger=IntervalTrigger(seconds=MEDIA_PREFETCH_INTERVAL), id="media_prefetch", replace_existing=True)
+    if COLLECT_SHARD_POLL_SECONDS > 0:
+        scheduler.add_job(func=run_shard_worker, trigger=IntervalTrigger(seconds=COLLECT_SHARD_POLL_SECONDS), id="analytics_shard_worker", replace_existing=True)
+    if KEY_ROTATION_POLL_SECONDS > 0:
+        scheduler.add_job(func=run_rotation, trigger=IntervalTrigger(seconds=KEY_ROTATION_POLL_SECONDS), id="key_rotation_worker", replace_existing=True)
+    start_preload()
 
 
 @app.on_event("shutdown")
@@ -113,7 +178,22 @@ async def _shutdown():
         scheduler.shutdown(wait=False)
     except Exception:
         pass
-    await db.disconnect()
+    shutdown_image_pool()
+    await close_http_client()
+    await disconnect_databases()
+
+
+# ---- Metrics ----
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Prometheus scrape endpoint; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="unauthorized")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 # ---- Health ----
@@ -143,66 +223,36 @@ async def home():
     }
 
 @app.get("/me")
-async def me(jwt_payload=Depends(verify_supabase_jwt)):
+async def me(request: Request, jwt_payload=Depends(verify_supabase_jwt)):
     """
     Canonical user dashboard endpoint.
     Used by frontend /me route.
+    Conditional: If-None-Match with the last ETag gets a 304 (app/etags.py).
     """
     user_id = jwt_payload.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="unauthenticated")
 
-    # Social accounts summary
-    accounts = await db.fetch_all(
-        """
-        SELECT provider, COUNT(*) as count
-        FROM social_accounts
-        WHERE user_id = :uid
-        GROUP BY provider
-        """,
-        values={"uid": user_id},
-    )
-
-    # Posts summary
-    posts_count = await db.fetch_one(
-        "SELECT COUNT(*) AS cnt FROM posts WHERE user_id = :uid",
-        values={"uid": user_id},
-    )
+    etag = await user_etag(request, user_id, *ALL_RESOURCES)
+    if is_fresh(request, etag):
+        return not_modified(request, etag)
 
-    # Scheduled posts
-    scheduled_count = await db.fetch_one(
-        """
-        SELECT COUNT(*) AS cnt
-        FROM scheduled_posts
-        WHERE user_id = :uid AND status = 'pending'
-        """,
-        values={"uid": user_id},
-    )
+    # one primary-key lookup; counters are kept current by triggers (app/user_stats.py)
+    stats = await get_user_stats(user_id)
 
-    # AI keys
-    ai_keys = await db.fetch_all(
-        "SELECT provider, created_at FROM user_api_keys WHERE user_id = :uid",
-        values={"uid": user_id},
-    )
-
-    return {
+    return FastJSONResponse({
         "user": {
             "id": user_id,
             # you can enrich later from Supabase profile table if needed
         },
-        "stats": {
-            "posts_total": posts_count["cnt"] if posts_count else 0,
-            "scheduled_pending": scheduled_count["cnt"] if scheduled_count else 0,
-            "connected_accounts": {row["provider"]: row["count"] for row in accounts},
-            "ai_keys": [dict(k) for k in ai_keys],
-        },
+        "stats": stats,
         "quick_actions": [
             "generate_post",
             "connect_social_account",
             "schedule_post"
         ],
         "ts": int(time.time()),
-    }
+    }, headers=etag_headers(etag))
 
 # ---- AI keys endpoints ----
 @app.post("/user/ai-key")
@@ -227,10 +277,13 @@ async def store_ai_key(payload: StoreAIKeyIn, jwt_payload=Depends(verify_supabas
 
 
 @app.get("/user/ai-key")
-async def list_ai_keys(jwt_payload=Depends(verify_supabase_jwt)):
+async def list_ai_keys(request: Request, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
+    etag = await user_etag(request, user_id, "ai_keys")
+    if is_fresh(request, etag):
+        return not_modified(request, etag)
     rows = await db.fetch_all("SELECT provider, created_at FROM user_api_keys WHERE user_id = :uid", values={"uid": user_id})
-    return {"keys": [dict(r) for r in rows]}
+    return FastJSONResponse({"keys": [dict(r) for r in rows]}, headers=etag_headers(etag))
 
 
 @app.delete("/user/ai-key/{provider}")
@@ -249,12 +302,12 @@ async def ai_generate(payload: GenerateIn, jwt_payload=Depends(verify_supabase_j
     row_gem = await db.fetch_one("SELECT encrypted_api_key FROM user_api_keys WHERE user_id = :uid AND provider = 'gemini'", values={"uid": user_id})
     openai_key = None
     gemini_key = None
-    if row_open and row_open.get("encrypted_api_key"):
+    if row_open and row_open["encrypted_api_key"]:
         try:
             openai_key = fernet.decrypt(row_open["encrypted_api_key"].encode()).decode()
         except Exception:
             openai_key = None
-    if row_gem and row_gem.get("encrypted_api_key"):
+    if row_gem and row_gem["encrypted_api_key"]:
         try:
             gemini_key = fernet.decrypt(row_gem["encrypted_api_key"].encode()).decode()
         except Exception:
@@ -265,6 +318,8 @@ async def ai_generate(payload: GenerateIn, jwt_payload=Depends(verify_supabase_j
 
     try:
         text = await generate_text(openai_key=openai_key or "", gemini_key=gemini_key or "", prompt=payload.prompt, model=payload.model)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"AI providers failed: {e}")
     return {"result": text}
@@ -272,10 +327,14 @@ async def ai_generate(payload: GenerateIn, jwt_payload=Depends(verify_supabase_j
 
 # ---- Social accounts ----
 @app.get("/social/accounts")
-async def social_accounts_list(jwt_payload=Depends(verify_supabase_jwt)):
+async def social_accounts_list(request: Request, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
-    rows = await db.fetch_all("SELECT id, provider, provider_user_id, scopes, expires_at, created_at FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})
-    return {"accounts": [dict(r) for r in rows]}
+    # versions come from the same replica as the rows, read before them
+    etag = await user_etag(request, user_id, "accounts", database=db_ro)
+    if is_fresh(request, etag):
+        return not_modified(request, etag)
+    rows = await db_ro.fetch_all("SELECT id, provider, provider_user_id, scopes, expires_at, created_at FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})
+    return FastJSONResponse({"accounts": [dict(r) for r in rows]}, headers=etag_headers(etag))
 
 
 @app.get("/social/accounts/{account_id}")
@@ -291,31 +350,100 @@ async def social_account_get(account_id: str, jwt_payload=Depends(verify_supabas
 async def social_account_delete(account_id: str, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
     await db.execute("DELETE FROM social_accounts WHERE id = :id AND user_id = :uid", values={"id": account_id, "uid": user_id})
+    invalidate_user_analytics(user_id)
     return {"status": "deleted", "id": account_id}
 
 
 # ---- Scheduling endpoints ----
+def _require_media_urls(urls: List[Any]):
+    # media references are fetched by the server: never accept local paths or other schemes
+    for url in urls:
+        if not is_remote_url(url):
+            raise HTTPException(status_code=400, detail="media must be http(s) URLs")
+
+
 @app.post("/schedule")
-async def schedule_create(payload: ScheduleIn, jwt_payload=Depends(verify_supabase_jwt)):
+async def schedule_create(payload: ScheduleIn, background_tasks: BackgroundTasks, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
     if not payload.content:
         raise HTTPException(status_code=400, detail="content missing")
     # default immediate if scheduled_at missing
-    scheduled_at = payload.scheduled_at or datetime.datetime.utcnow().isoformat()
+    scheduled_at = _parse_ts(payload.scheduled_at, datetime.datetime.now(datetime.timezone.utc))
+    if (payload.metadata or {}).get("media_url") is not None:
+        _require_media_urls([payload.metadata["media_url"]])
     # insert
     row = await db.fetch_one(
         "INSERT INTO scheduled_posts (user_id, social_account_id, content, metadata, scheduled_at, status, created_at) VALUES (:u,:s,:c,:m,:st,'pending',NOW()) RETURNING id",
-        values={"u": user_id, "s": payload.social_account_id, "c": payload.content, "m": payload.metadata or {}, "st": scheduled_at}
+        values={"u": user_id, "s": payload.social_account_id, "c": payload.content, "m": json.dumps(payload.metadata or {}), "st": scheduled_at}
     )
     inserted_id = row[0] if row else None
+    if inserted_id and (payload.metadata or {}).get("media_url"):
+        # download + prepare Instagram images now rather than at publish time
+        background_tasks.add_task(prepare_scheduled_media, [inserted_id])
     return {"status": "scheduled", "id": inserted_id}
 
 
+@app.post("/schedule/bulk")
+async def schedule_bulk(request: Request, background_tasks: BackgroundTasks, jwt_payload=Depends(verify_supabase_jwt), partial: bool = False):
+    """
+    Bulk import (JSON list or CSV, see app/schedule_import.py). All rows are validated first;
+    by default nothing is inserted if any row fails, with partial=true the valid rows are.
+    """
+    user_id = jwt_payload.get("sub")
+    try:
+        rows = parse_import(await request.body(), request.headers.get("content-type", ""))
+    except (ImportFormatError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="no rows")
+    if len(rows) > BULK_SCHEDULE_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"at most {BULK_SCHEDULE_MAX_ROWS} rows per import")
+
+    valid, errors = await validate_rows(user_id, rows)
+    if errors and not partial:
+        raise HTTPException(status_code=422, detail={"errors": errors, "valid": len(valid), "inserted": 0})
+    inserted = await insert_rows(user_id, valid)
+    ids = list(inserted.values())
+    if any(r["metadata"].get("media_url") for r in valid):
+        background_tasks.add_task(prepare_scheduled_media, ids)
+    # one wake-up for the whole batch instead of waiting for the next tick
+    if valid and min(r["scheduled_at"] for r in valid) <= datetime.datetime.now(datetime.timezone.utc):
+        _wake_publisher()
+    return {
+        "status": "scheduled",
+        "inserted": len(ids),
+        "ids": [{"row": row, "id": i} for row, i in inserted.items()],
+        "errors": errors,
+    }
+
+
 @app.get("/schedule")
-async def schedule_list(jwt_payload=Depends(verify_supabase_jwt)):
+async def schedule_list(request: Request, jwt_payload=Depends(verify_supabase_jwt), limit: int = 100, cursor: Optional[str] = None, format: Optional[str] = None):
+    """
+    Keyset-paginated on (scheduled_at, id): pass the returned next_cursor to get the following page.
+    format=ndjson streams every scheduled post instead (one JSON object per line).
+    """
     user_id = jwt_payload.get("sub")
-    rows = await db.fetch_all("SELECT id, social_account_id, content, metadata, scheduled_at, status, created_at FROM scheduled_posts WHERE user_id = :uid ORDER BY scheduled_at", values={"uid": user_id})
-    return {"schedules": [dict(r) for r in rows]}
+    columns = "id, social_account_id, content, metadata, scheduled_at, status, created_at"
+    if format == "ndjson":
+        return ndjson_response(
+            f"SELECT {columns} FROM scheduled_posts WHERE user_id = :uid ORDER BY scheduled_at, id",
+            {"uid": user_id}, "schedules.ndjson", database=db_ro,
+        )
+    etag = await user_etag(request, user_id, "schedule", database=db_ro)
+    if is_fresh(request, etag):
+        return not_modified(request, etag)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    values = {"uid": user_id, "lim": limit}
+    where = "user_id = :uid"
+    if cursor:
+        ts, last_id = decode_cursor(cursor)
+        where += " AND (scheduled_at, id) > (:ts, CAST(:last_id AS uuid))"
+        values.update({"ts": ts, "last_id": last_id})
+    rows = await db_ro.fetch_all(f"SELECT {columns} FROM scheduled_posts WHERE {where} ORDER BY scheduled_at, id LIMIT :lim", values=values)
+    next_cursor = encode_cursor(rows[-1]["scheduled_at"], rows[-1]["id"]) if len(rows) == limit else None
+    # rendered straight with orjson, skipping jsonable_encoder over every row
+    return FastJSONResponse({"schedules": [dict(r) for r in rows], "next_cursor": next_cursor}, headers=etag_headers(etag))
 
 
 @app.delete("/schedule/{schedule_id}")
@@ -334,8 +462,11 @@ async def publish_now(payload: PublishNowIn, jwt_payload=Depends(verify_supabase
     row = await db.fetch_one("SELECT * FROM social_accounts WHERE id = :id AND user_id = :uid", values={"id": payload.social_account_id, "uid": user_id})
     if not row:
         raise HTTPException(status_code=404, detail="social account not found")
+    row = dict(row)
 
     provider = row.get("provider")
+    require_provider(provider)
+    _require_media_urls(payload.media or [])
     # Attempt to decrypt stored access_token/session if available
     access_blob = None
     if row.get("access_token"):
@@ -361,22 +492,43 @@ async def publish_now(payload: PublishNowIn, jwt_payload=Depends(verify_supabase
 
     # record post in posts table
     await db.execute("INSERT INTO posts (user_id, platform, platform_post_id, content, metadata, created_at) VALUES (:u, :p, :pp, :c, :m, NOW())",
-                     values={"u": user_id, "p": provider, "pp": result.get("platform_post_id"), "c": payload.content, "m": result.get("raw", {})})
+                     values={"u": user_id, "p": provider, "pp": result.get("platform_post_id"), "c": payload.content, "m": json.dumps(result.get("raw", {}), default=str)})
     return {"status": "published", "result": result}
 
 
 # ---- Posts history ----
 @app.get("/posts/history")
-async def posts_history(jwt_payload=Depends(verify_supabase_jwt), limit: int = 50):
+async def posts_history(request: Request, jwt_payload=Depends(verify_supabase_jwt), limit: int = 50, cursor: Optional[str] = None, format: Optional[str] = None):
+    """
+    Newest first, keyset-paginated on (created_at, id): pass the returned next_cursor to get older posts.
+    format=ndjson streams the full history instead (one JSON object per line).
+    """
     user_id = jwt_payload.get("sub")
-    rows = await db.fetch_all("SELECT id, platform, platform_post_id, content, metadata, created_at FROM posts WHERE user_id = :uid ORDER BY created_at DESC LIMIT :lim", values={"uid": user_id, "lim": limit})
-    return {"posts": [dict(r) for r in rows]}
+    columns = "id, platform, platform_post_id, content, metadata, created_at"
+    if format == "ndjson":
+        return ndjson_response(
+            f"SELECT {columns} FROM posts WHERE user_id = :uid ORDER BY created_at DESC, id DESC",
+            {"uid": user_id}, "posts.ndjson", database=db_ro,
+        )
+    etag = await user_etag(request, user_id, "posts", database=db_ro)
+    if is_fresh(request, etag):
+        return not_modified(request, etag)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    values = {"uid": user_id, "lim": limit}
+    where = "user_id = :uid"
+    if cursor:
+        ts, last_id = decode_cursor(cursor)
+        where += " AND (created_at, id) < (:ts, CAST(:last_id AS uuid))"
+        values.update({"ts": ts, "last_id": last_id})
+    rows = await db_ro.fetch_all(f"SELECT {columns} FROM posts WHERE {where} ORDER BY created_at DESC, id DESC LIMIT :lim", values=values)
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return FastJSONResponse({"posts": [dict(r) for r in rows], "next_cursor": next_cursor}, headers=etag_headers(etag))
 
 
 @app.get("/posts/{platform}/{platform_post_id}")
 async def posts_get(platform: str, platform_post_id: str, jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
-    row = await db.fetch_one("SELECT * FROM posts WHERE user_id = :uid AND platform = :p AND platform_post_id = :pp LIMIT 1", values={"uid": user_id, "p": platform, "pp": platform_post_id})
+    row = await db_ro.fetch_one("SELECT * FROM posts WHERE user_id = :uid AND platform = :p AND platform_post_id = :pp LIMIT 1", values={"uid": user_id, "p": platform, "pp": platform_post_id})
     if not row:
         raise HTTPException(status_code=404, detail="post not found")
     return dict(row)
@@ -386,121 +538,231 @@ async def posts_get(platform: str, platform_post_id: str, jwt_payload=Depends(ve
 @app.get("/analytics/overview")
 async def analytics_overview(jwt_payload=Depends(verify_supabase_jwt)):
     user_id = jwt_payload.get("sub")
-    result = {}
-    rows = await db.fetch_all("SELECT id, provider, provider_user_id, access_token FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})
-    import httpx
-    for r in rows:
-        prov = r.get("provider")
-        provider_user_id = r.get("provider_user_id")
-        access_blob = None
-        if r.get("access_token"):
-            try:
-                access_blob = fernet.decrypt(r["access_token"].encode()).decode()
-            except Exception:
-                access_blob = None
-        try:
-            if prov == "youtube" and access_blob:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get("https://www.googleapis.com/youtube/v3/channels", params={"part": "statistics,snippet", "id": provider_user_id, "access_token": access_blob})
-                    if resp.status_code == 200:
-                        result.setdefault("youtube", []).append(resp.json())
-            elif prov == "instagram" and access_blob:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(f"https://graph.facebook.com/v18.0/{provider_user_id}", params={"fields": "username,followers_count,media_count", "access_token": access_blob})
-                    if resp.status_code == 200:
-                        result.setdefault("instagram", []).append(resp.json())
-            else:
-                result.setdefault("other", []).append(prov)
-        except Exception as e:
-            result.setdefault(f"{prov}_errors", []).append(str(e))
+
+    async def _fetch():
+        rows = await db.fetch_all("SELECT id, provider, provider_user_id, access_token FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})
+        # all accounts fetched concurrently (bounded per provider, per-call deadline)
+        return await build_overview(rows)
+
+    # concurrent identical requests share one upstream fetch; partial results are not cached
+    return await analytics_cache.get(("analytics_overview", user_id), _fetch, cacheable=lambda r: not r.get("partial"))
+
+
+def _parse_ts(value: Optional[str], default: datetime.datetime) -> datetime.datetime:
+    if not value:
+        return default
+    try:
+        ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid timestamp: {value}")
+    return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+
+@app.get("/analytics/series")
+async def analytics_series(jwt_payload=Depends(verify_supabase_jwt), metric: str = "followers", start: Optional[str] = None,
+                           end: Optional[str] = None, points: int = 200, account_id: Optional[str] = None):
+    """
+    Downsampled time series from the hourly/daily/weekly rollups.
+    Defaults to the last 30 days; at most `points` points per account.
+    """
+    user_id = jwt_payload.get("sub")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    end_ts = _parse_ts(end, now)
+    start_ts = _parse_ts(start, end_ts - datetime.timedelta(days=30))
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    points = max(1, min(points, 2000))
+    try:
+        return await query_series(user_id, metric, start_ts, end_ts, points=points, account_id=account_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/analytics/engagement")
+async def analytics_engagement(jwt_payload=Depends(verify_supabase_jwt), top: Optional[int] = None):
+    """Engagement rate, per-account z-score and percentile for every recent post across platforms."""
+    user_id = jwt_payload.get("sub")
+    loaded = await load_user_post_metrics(user_id)
+    frame = EngagementFrame.from_records(loaded["records"])
+    result = to_response(frame, score(frame), top=top)
+    if loaded["errors"]:
+        result["errors"] = loaded["errors"]
     return result
 
 
 # ---- Analytics background worker + admin trigger ----
+@logged_job("analytics_worker")
+@profiled_job("analytics_worker")
 async def run_analytics_worker():
-    rows = await db.fetch_all("SELECT id, user_id, provider, provider_user_id, access_token FROM social_accounts")
-    import httpx
-    for r in rows:
-        prov = r.get("provider")
-        user_id = r.get("user_id")
-        access_blob = None
-        if r.get("access_token"):
-            try:
-                access_blob = fernet.decrypt(r["access_token"].encode()).decode()
-            except Exception:
-                access_blob = None
-        try:
-            if prov == "youtube" and access_blob:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get("https://www.googleapis.com/youtube/v3/channels", params={"part": "statistics", "id": r.get("provider_user_id"), "access_token": access_blob})
-                    if resp.status_code == 200:
-                        await db.execute("INSERT INTO analytics_snapshots (user_id, provider, payload, created_at) VALUES (:u, :p, :pl, NOW())", values={"u": user_id, "p": "youtube", "pl": resp.text})
-            elif prov == "instagram" and access_blob:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(f"https://graph.facebook.com/v18.0/{r.get('provider_user_id')}", params={"fields": "username,followers_count,media_count", "access_token": access_blob})
-                    if resp.status_code == 200:
-                        await db.execute("INSERT INTO analytics_snapshots (user_id, provider, payload, created_at) VALUES (:u, :p, :pl, NOW())", values={"u": user_id, "p": "instagram", "pl": resp.text})
-        except Exception as e:
-            print("analytics worker error", e)
+    # streamed accounts -> bounded concurrent fetch -> batched snapshot inserts
+    stats = await collect_analytics()
+    log.info("analytics worker done", extra={"stats": stats})
+    return stats
 
 
 @app.post("/admin/collect-analytics")
-async def admin_collect_analytics(jwt_payload=Depends(verify_supabase_jwt), background_tasks: BackgroundTasks = None):
-    # Consider restricting to admin role in production
+async def admin_collect_analytics(jwt_payload=Depends(verify_admin), background_tasks: BackgroundTasks = None, shards: int = 0):
+    if shards > 0:
+        # sharded run: this instance starts working right away, other instances join on their next poll
+        run_id = await create_collection_run(shards)
+        if background_tasks:
+            background_tasks.add_task(asyncio.create_task, run_shard_worker())
+        return {"status": "started", "run_id": run_id}
     if background_tasks:
         background_tasks.add_task(asyncio.create_task, run_analytics_worker())
         return {"status": "started"}
     else:
         # synchronous fallback
-        await run_analytics_worker()
-        return {"status": "completed"}
+        stats = await run_analytics_worker()
+        return {"status": "completed", "stats": stats}
+
+
+@app.get("/admin/collect-analytics/progress")
+async def admin_collect_analytics_progress(jwt_payload=Depends(verify_admin), run_id: Optional[str] = None):
+    return await collection_progress(run_id)
+
+
+@app.post("/admin/keys/rotate")
+async def admin_rotate_keys(jwt_payload=Depends(verify_admin), background_tasks: BackgroundTasks = None, force: bool = False):
+    # re-encrypt stored tokens / API keys with the newest FERNET_KEYS entry; other instances join on their next poll
+    progress = await start_rotation(force=force)
+    if background_tasks:
+        background_tasks.add_task(asyncio.create_task, run_rotation())
+    return {"status": "started", **progress}
+
+
+@app.get("/admin/keys/rotation")
+async def admin_key_rotation_progress(jwt_payload=Depends(verify_admin)):
+    return await rotation_progress()
+
+
+@app.get("/admin/db/pool")
+async def admin_db_pool(jwt_payload=Depends(verify_admin)):
+    # connection pool size, waiters and acquire-wait histograms (primary + optional replica)
+    return pool_stats()
+
+
+@app.get("/admin/providers")
+async def admin_providers(jwt_payload=Depends(verify_admin)):
+    # enabled providers and the SDKs this worker has imported so far (seconds per import)
+    return {"enabled": sorted(ENABLED_PROVIDERS), "loaded_sdks": loaded_sdks()}
+
+
+@app.get("/admin/media-cache")
+async def admin_media_cache(jwt_payload=Depends(verify_admin)):
+    return cache_stats()
+
+
+@app.post("/admin/user-stats/check")
+async def admin_check_user_stats(jwt_payload=Depends(verify_admin), user_id: Optional[str] = None, fix: bool = False):
+    return await check_user_stats(user_id=user_id, fix=fix)
+
+
+@app.get("/admin/profiles")
+async def admin_list_profiles(jwt_payload=Depends(verify_admin)):
+    # stored request / job profiles, newest first (profile a request with "X-Profile: 1")
+    return {"config": profiling_config(), "profiles": list_profiles()}
+
+
+@app.get("/admin/profiles/{report_id}")
+async def admin_get_profile(report_id: str, jwt_payload=Depends(verify_admin)):
+    path = profile_path(report_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return FileResponse(path, filename=os.path.basename(path))
 
 
 # ---- Scheduled publisher (job) ----
+def _wake_publisher():
+    """Runs the publisher job now (once) instead of at its next interval tick."""
+    try:
+        scheduler.modify_job("scheduled_publisher", next_run_time=datetime.datetime.now(datetime.timezone.utc))
+    except Exception as e:
+        log.warning("could not wake scheduled publisher", extra={"error": repr(e)})
+
+
+@logged_job("scheduled_publisher")
+@profiled_job("scheduled_publisher")
 async def run_scheduled_publisher():
-    rows = await db.fetch_all("SELECT id, user_id, social_account_id, content, metadata FROM scheduled_posts WHERE status = 'pending' AND scheduled_at <= now() ORDER BY scheduled_at LIMIT 20")
+    tick_started = time.perf_counter()
+    due = await db.fetch_one("SELECT COUNT(*) AS n, EXTRACT(EPOCH FROM now() - MIN(scheduled_at)) AS lag FROM scheduled_posts WHERE status = 'pending' AND scheduled_at <= now()")
+    publisher_due_backlog.set(due["n"] if due else 0)
+    publisher_queue_lag.set(float(due["lag"]) if due and due["lag"] is not None else 0)
+    rows = await db.fetch_all("SELECT id, user_id, social_account_id, content, metadata, scheduled_at FROM scheduled_posts WHERE status = 'pending' AND scheduled_at <= now() ORDER BY scheduled_at LIMIT 20")
     for r in rows:
+        r = dict(r)
+        prov = "unknown"
         try:
-            account_row = await db.fetch_one("SELECT * FROM social_accounts WHERE id = :id", values={"id": r.get("social_account_id")})
-            if not account_row:
-                await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
-                continue
-
-            prov = account_row.get("provider")
-            metadata = r.get("metadata") or {}
-            # Decrypt session/access token if present
-            access_blob = None
-            if account_row.get("access_token"):
-                try:
-                    access_blob = fernet.decrypt(account_row["access_token"].encode()).decode()
-                except Exception:
-                    access_blob = None
-
-            if prov == "instagram":
-                if _publish_instagram_internal is None:
-                    raise RuntimeError("instagram publish helper missing")
-                media_url = metadata.get("media_url")
-                media_list = [media_url] if media_url else []
-                res = await _publish_instagram_internal(account_row, r.get("content"), media_list, access_token_blob=access_blob)
-            elif prov == "youtube":
-                if _publish_youtube_internal is None:
-                    raise RuntimeError("youtube upload helper missing")
-                media_url = metadata.get("media_url")
-                res = await _publish_youtube_internal(account_row, media_url, r.get("content"))
-            else:
-                # unsupported provider
-                await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
-                continue
-
-            # record post & update scheduled_posts
-            await db.execute("INSERT INTO posts (user_id, platform, platform_post_id, content, metadata, created_at) VALUES (:u, :p, :pp, :c, :m, NOW())", values={"u": r.get("user_id"), "p": prov, "pp": res.get("platform_post_id"), "c": r.get("content"), "m": res.get("raw", {})})
-            await db.execute("UPDATE scheduled_posts SET status = 'published', provider_post_id = :pp WHERE id = :id", values={"pp": res.get("platform_post_id"), "id": r.get("id")})
+            # one post may not hold up the rest of the tick forever
+            with deadline_scope(PUBLISH_TIMEOUT_SECONDS):
+                account_row = await db.fetch_one("SELECT * FROM social_accounts WHERE id = :id", values={"id": r.get("social_account_id")})
+                if not account_row:
+                    await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
+                    publisher_posts.labels(prov, "failed").inc()
+                    continue
+                account_row = dict(account_row)
+
+                prov = account_row.get("provider")
+                metadata = r.get("metadata") or {}
+                if isinstance(metadata, str):
+                    metadata = json.loads(metadata)
+                # Decrypt session/access token if present
+                access_blob = None
+                if account_row.get("access_token"):
+                    try:
+                        access_blob = fernet.decrypt(account_row["access_token"].encode()).decode()
+                    except Exception:
+                        access_blob = None
+
+                if not provider_enabled(prov):
+                    # disabled on this deployment (ENABLED_PROVIDERS)
+                    await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
+                    publisher_posts.labels(prov, "failed").inc()
+                    continue
+
+                if prov == "instagram":
+                    if _publish_instagram_internal is None:
+                        raise RuntimeError("instagram publish helper missing")
+                    # prefetched into the local media cache and prepared for Instagram ahead of time; uploads from disk
+                    media_url = metadata.get("media_url")
+                    local = await resolve_media(media_url)
+                    # pinned: eviction must not delete the files before they are uploaded
+                    with pinned(local):
+                        variant = await instagram_variant(local) if local else None
+                        with pinned(variant):
+                            media_list = [media_url] if media_url else []
+                            res = await _publish_instagram_internal(account_row, r.get("content"), media_list, access_token_blob=access_blob, local_path=variant)
+                elif prov == "youtube":
+                    if _publish_youtube_internal is None:
+                        raise RuntimeError("youtube upload helper missing")
+                    media_url = metadata.get("media_url")
+                    local = await resolve_media(media_url)
+                    with pinned(local):
+                        res = await _publish_youtube_internal(account_row, media_url, r.get("content"), local_path=local)
+                else:
+                    # unsupported provider
+                    await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
+                    publisher_posts.labels(prov, "failed").inc()
+                    continue
+
+                # record post & update scheduled_posts
+                await db.execute("INSERT INTO posts (user_id, platform, platform_post_id, content, metadata, created_at) VALUES (:u, :p, :pp, :c, :m, NOW())", values={"u": r.get("user_id"), "p": prov, "pp": res.get("platform_post_id"), "c": r.get("content"), "m": json.dumps(res.get("raw", {}), default=str)})
+                await db.execute("UPDATE scheduled_posts SET status = 'published', provider_post_id = :pp WHERE id = :id", values={"pp": res.get("platform_post_id"), "id": r.get("id")})
+                publisher_posts.labels(prov, "published").inc()
+                log.info("scheduled post published", extra={"post_id": str(r.get("id")), "provider": prov, "platform_post_id": res.get("platform_post_id")})
+                if r.get("scheduled_at"):
+                    publisher_delay_seconds.observe(max(0.0, (datetime.datetime.now(datetime.timezone.utc) - r["scheduled_at"]).total_seconds()))
         except Exception as e:
-            print("scheduled publish error", e)
+            if isinstance(e, DeadlineExceeded):
+                deadline_exceeded.labels("job").inc()
+            log.exception("scheduled publish failed", extra={"post_id": str(r.get("id")), "provider": prov})
+            publisher_posts.labels(prov, "failed").inc()
             try:
                 await db.execute("UPDATE scheduled_posts SET status='failed' WHERE id = :id", values={"id": r.get("id")})
             except Exception:
                 pass
+    publisher_tick_seconds.observe(time.perf_counter() - tick_started)
+    log.debug("publisher tick", extra={"due": due["n"] if due else 0, "processed": len(rows), "seconds": round(time.perf_counter() - tick_started, 3)})
 
 
 
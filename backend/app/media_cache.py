@@ -0,0 +1,301 @@
+# app/media_cache.py
+"""
+Local content-addressed media cache with prefetch for scheduled posts.
+
+- objects are stored by the sha256 of their content (objects/ab/abcdef...), so the same media
+  referenced by several posts or URLs is stored once; a small pointer file per URL
+  (urls/<sha256(url)>) maps a URL to its object
+- the cache is bounded by MEDIA_CACHE_MAX_BYTES; least recently used files are evicted first
+  (access time is the file's mtime, refreshed on every hit). Prepared Instagram variants
+  (app.image_prep, variants/) count against the same limit and are evicted the same way.
+- concurrent requests for the same URL share one download; file writes run in worker threads
+- eviction never deletes a pinned file (pinned() around an upload) or one used within the last
+  MEDIA_EVICT_MIN_AGE seconds, so a path handed out by the cache stays valid while it is uploaded
+- prefetch_due_media() (scheduler job) downloads media of posts due in the next
+  MEDIA_PREFETCH_MINUTES, so at publish time the provider helpers upload from local disk
+- only http(s) URLs are accepted, and only paths the cache created itself (under MEDIA_CACHE_DIR)
+  are ever handed out: media URLs are user input, and a local path taken from them would let a
+  user upload any file the server can read to their own account
+"""
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from app.db import db
+from app.log import get_logger, logged_job
+from app.utils.http import get_http_client
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ai-social-media-cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+MEDIA_MAX_FILE_BYTES = int(os.getenv("MEDIA_MAX_FILE_BYTES", str(512 * 1024 ** 2)))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "120"))
+MEDIA_PREFETCH_MINUTES = int(os.getenv("MEDIA_PREFETCH_MINUTES", "30"))
+MEDIA_PREFETCH_CONCURRENCY = int(os.getenv("MEDIA_PREFETCH_CONCURRENCY", "4"))
+# objects used more recently than this are never evicted (covers uploads that didn't pin)
+MEDIA_EVICT_MIN_AGE = float(os.getenv("MEDIA_EVICT_MIN_AGE", "600"))
+
+_OBJECTS = os.path.join(MEDIA_CACHE_DIR, "objects")
+_URLS = os.path.join(MEDIA_CACHE_DIR, "urls")
+_TMP = os.path.join(MEDIA_CACHE_DIR, "tmp")
+_VARIANTS = os.path.join(MEDIA_CACHE_DIR, "variants")
+
+_inflight: Dict[str, asyncio.Future] = {}
+_total_bytes: Optional[int] = None
+# path -> number of uploads currently using it
+_pinned: Dict[str, int] = {}
+
+log = get_logger(__name__)
+
+
+class MediaDownloadError(RuntimeError):
+    pass
+
+
+def _object_path(digest: str, ext: str = "") -> str:
+    return os.path.join(_OBJECTS, digest[:2], digest + ext)
+
+
+def _url_pointer(url: str) -> str:
+    return os.path.join(_URLS, hashlib.sha256(url.encode()).hexdigest())
+
+
+def _extension(url: str) -> str:
+    # providers pick upload handling by extension, so keep the original one
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if ext and len(ext) <= 6 else ""
+
+
+def variant_path(key: str, ext: str) -> str:
+    return os.path.join(_VARIANTS, key[:2], key + ext)
+
+
+def _cached_files():
+    """Every evictable file: downloaded objects and prepared variants (not half-written .tmp files)."""
+    for top in (_OBJECTS, _VARIANTS):
+        for root, _, files in os.walk(top):
+            for f in files:
+                if not f.endswith(".tmp"):
+                    yield os.path.join(root, f)
+
+
+def _scan_total() -> int:
+    total = 0
+    for path in _cached_files():
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def is_remote_url(url: Any) -> bool:
+    return isinstance(url, str) and urlparse(url.strip()).scheme.lower() in ("http", "https")
+
+
+def is_cached_path(path: Optional[str]) -> bool:
+    """True for files inside MEDIA_CACHE_DIR, i.e. ones the cache (or image_prep) wrote."""
+    if not path:
+        return False
+    root = os.path.realpath(MEDIA_CACHE_DIR) + os.sep
+    return os.path.realpath(path).startswith(root)
+
+
+def _lookup(url: str) -> Optional[str]:
+    """Cached object path for `url` (and marks it recently used), or None."""
+    try:
+        with open(_url_pointer(url)) as f:
+            path = f.read().strip()
+        if not is_cached_path(path):
+            return None
+        os.utime(path)
+        return path
+    except OSError:
+        return None
+
+
+@contextmanager
+def pinned(*paths: Optional[str]):
+    """Keeps `paths` (None entries are ignored) out of eviction for the duration of the block."""
+    held = [p for p in paths if p]
+    for p in held:
+        _pinned[p] = _pinned.get(p, 0) + 1
+    try:
+        yield
+    finally:
+        for p in held:
+            if _pinned[p] <= 1:
+                del _pinned[p]
+            else:
+                _pinned[p] -= 1
+
+
+def _evict(keep: str):
+    """Deletes least recently used objects until the cache fits MEDIA_CACHE_MAX_BYTES."""
+    global _total_bytes
+    if _total_bytes is None or _total_bytes <= MEDIA_CACHE_MAX_BYTES:
+        return
+    recent = time.time() - MEDIA_EVICT_MIN_AGE
+    entries = []
+    for path in _cached_files():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    for mtime, size, path in entries:
+        if _total_bytes <= MEDIA_CACHE_MAX_BYTES or mtime >= recent:
+            # sorted by mtime: everything after this one is in use too
+            break
+        if path == keep or path in _pinned:
+            continue
+        try:
+            os.remove(path)
+            _total_bytes -= size
+        except OSError:
+            pass
+    # url pointers to evicted objects are left behind; _lookup treats them as misses
+
+
+def _prepare_dirs() -> str:
+    for d in (_OBJECTS, _URLS, _TMP):
+        os.makedirs(d, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_TMP)
+    os.close(fd)
+    return tmp_path
+
+
+def _store(tmp_path: str, url: str, digest: str) -> bool:
+    """Moves the finished download into objects/ and points `url` at it; False if the content was already cached."""
+    path = _object_path(digest, _extension(url))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    added = not os.path.exists(path)
+    if added:
+        os.replace(tmp_path, path)
+    else:
+        # same content already cached under another URL
+        os.remove(tmp_path)
+        os.utime(path)
+    pointer_tmp = _url_pointer(url) + ".tmp"
+    with open(pointer_tmp, "w") as f:
+        f.write(path)
+    os.replace(pointer_tmp, _url_pointer(url))
+    return added
+
+
+def _discard(tmp_path: str):
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def _download(url: str) -> str:
+    global _total_bytes
+    tmp_path = await asyncio.to_thread(_prepare_dirs)
+    if _total_bytes is None:
+        _total_bytes = await asyncio.to_thread(_scan_total)
+
+    client = get_http_client()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        out = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async with client.stream("GET", url, timeout=MEDIA_DOWNLOAD_TIMEOUT, follow_redirects=True) as resp:
+                if resp.status_code != 200:
+                    raise MediaDownloadError(f"GET {url} returned {resp.status_code}")
+                async for chunk in resp.aiter_bytes(1024 * 1024):
+                    size += len(chunk)
+                    if size > MEDIA_MAX_FILE_BYTES:
+                        raise MediaDownloadError(f"{url} is larger than {MEDIA_MAX_FILE_BYTES} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(out.write, chunk)
+        finally:
+            await asyncio.to_thread(out.close)
+        path = _object_path(digest.hexdigest(), _extension(url))
+        if await asyncio.to_thread(_store, tmp_path, url, digest.hexdigest()):
+            _total_bytes += size
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    await asyncio.to_thread(_evict, path)
+    return path
+
+
+async def track_file(path: str):
+    """Counts a file written into the cache outside _download (image_prep variants) and evicts if over the limit."""
+    global _total_bytes
+    if _total_bytes is None:
+        # the scan already includes `path`
+        _total_bytes = await asyncio.to_thread(_scan_total)
+    else:
+        _total_bytes += await asyncio.to_thread(os.path.getsize, path)
+    await asyncio.to_thread(_evict, path)
+
+
+async def get_local_media(url: str) -> str:
+    """Local path for `url`, downloading it into the cache on a miss. Anything but http(s) is refused."""
+    if not is_remote_url(url):
+        raise MediaDownloadError("media must be an http(s) URL")
+    path = _lookup(url)
+    if path:
+        return path
+    fut = _inflight.get(url)
+    if fut is None:
+        fut = asyncio.ensure_future(_download(url))
+        _inflight[url] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(url, None))
+    return await asyncio.shield(fut)
+
+
+async def resolve_media(url: Optional[str]) -> Optional[str]:
+    """Publish-path helper: cached local file for `url`, or None (publish from the URL) if the download fails."""
+    if not url:
+        return None
+    try:
+        return await get_local_media(url)
+    except Exception as e:
+        log.warning("media cache miss, publishing from URL", extra={"url": url, "error": str(e)})
+        return None
+
+
+@logged_job("media_prefetch")
+async def prefetch_due_media(minutes: int = MEDIA_PREFETCH_MINUTES) -> Dict[str, Any]:
+    """Scheduler job: downloads media of pending posts due within `minutes` (each URL once)."""
+    rows = await db.fetch_all(
+        """
+        SELECT DISTINCT metadata->>'media_url' AS url
+        FROM scheduled_posts
+        WHERE status = 'pending' AND scheduled_at <= NOW() + CAST(:minutes AS integer) * INTERVAL '1 minute'
+          AND metadata->>'media_url' IS NOT NULL
+        """,
+        values={"minutes": minutes},
+    )
+    urls = [r["url"] for r in rows if is_remote_url(r["url"])]
+    sem = asyncio.Semaphore(MEDIA_PREFETCH_CONCURRENCY)
+    stats = {"urls": len(urls), "cached": 0, "downloaded": 0, "errors": 0}
+
+    async def _one(url):
+        async with sem:
+            if _lookup(url):
+                stats["cached"] += 1
+                return
+            try:
+                await get_local_media(url)
+                stats["downloaded"] += 1
+            except Exception as e:
+                stats["errors"] += 1
+                log.warning("media prefetch error", extra={"url": url, "error": str(e)})
+
+    await asyncio.gather(*(_one(u) for u in urls))
+    if stats["downloaded"] or stats["errors"]:
+        log.info("media prefetch done", extra={"stats": stats})
+    return stats
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {"dir": MEDIA_CACHE_DIR, "bytes": _total_bytes, "max_bytes": MEDIA_CACHE_MAX_BYTES, "inflight": len(_inflight), "pinned": len(_pinned)}
@@ -0,0 +1,179 @@
+# app/metrics.py
+"""
+Prometheus metrics, served from GET /metrics.
+
+- MetricsMiddleware: per-route latency histogram (route template, not raw path) and in-flight gauge
+- provider_call(): latency + outcome of every outbound provider call (OpenAI, Gemini, YouTube,
+  Graph API, instagrapi)
+- db_query_seconds: per-query timing, recorded by app.db.InstrumentedDatabase; queries are
+  labelled "<verb> <table>" so label cardinality stays bounded
+- DB pool gauges / acquire-wait histogram are read from app.db at scrape time (PoolCollector)
+- publisher and analytics job metrics: queue lag, backlog, throughput and outcomes
+- password hashing pool (app.auth_local): bcrypt time, pending calls and 503 rejections
+"""
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+http_not_modified = Counter("http_not_modified_total", "Conditional GETs answered with 304 Not Modified", ["route"])
+
+provider_seconds = Histogram(
+    "provider_request_duration_seconds", "Outbound provider call latency", ["provider", "operation", "outcome"], buckets=LATENCY_BUCKETS
+)
+
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Database call latency (includes pool acquire)", ["database", "method", "query"], buckets=DB_BUCKETS
+)
+
+publisher_due_backlog = Gauge("publisher_due_backlog", "Pending scheduled posts that are already due")
+publisher_queue_lag = Gauge("publisher_queue_lag_seconds", "Age of the oldest due, unpublished scheduled post")
+publisher_posts = Counter("publisher_posts_total", "Scheduled posts processed by the publisher", ["provider", "outcome"])
+publisher_delay_seconds = Histogram(
+    "publisher_publish_delay_seconds", "Time from scheduled_at to publish", buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+publisher_tick_seconds = Histogram("publisher_tick_duration_seconds", "Duration of one publisher run", buckets=LATENCY_BUCKETS)
+
+analytics_accounts = Counter("analytics_accounts_total", "Accounts handled by analytics collection", ["outcome"])
+analytics_run_seconds = Histogram(
+    "analytics_collect_duration_seconds", "Duration of one analytics collection run / shard", buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+)
+analytics_throughput = Gauge("analytics_collect_accounts_per_second", "Throughput of the last analytics collection run")
+analytics_queue_depth = Gauge("analytics_queue_depth", "Items waiting in the running collection's pipeline queues", ["queue"])
+analytics_last_run = Gauge("analytics_collect_last_finished_timestamp", "Unix time the last analytics collection run finished")
+
+password_hash_seconds = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash / verify time including pool queueing", ["operation"], buckets=LATENCY_BUCKETS
+)
+password_hash_rejected = Counter("password_hash_rejected_total", "bcrypt calls turned away with 503 (pool saturated)", ["operation"])
+password_hash_pending = Gauge("password_hash_pending", "bcrypt calls queued or running in the hashing pool")
+
+deadline_exceeded = Counter("deadline_exceeded_total", "Requests / jobs stopped because their deadline passed", ["where"])
+log_records_dropped = Counter("log_records_dropped_total", "Log records dropped because the log writer queue was full")
+
+_QUERY_TABLE = re.compile(r"\b(?:from|into|update)\s+([a-z_][a-z0-9_.]*)", re.IGNORECASE)
+
+
+def query_label(query) -> str:
+    """'<verb> <first table>' for a SQL string, e.g. 'select posts', 'insert scheduled_posts'."""
+    text = str(query).lstrip(" \t\r\n(")
+    verb = text.split(None, 1)[0].lower() if text else "?"
+    if verb == "with":
+        verb = "cte"
+    m = _QUERY_TABLE.search(text)
+    return f"{verb} {m.group(1).lower()}" if m else verb
+
+
+@contextmanager
+def provider_call(provider: str, operation: str):
+    """Times the enclosed call; works around awaits and in worker threads alike."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except BaseException as e:
+        outcome = "timeout" if e.__class__.__name__ in ("TimeoutError", "ReadTimeout", "ConnectTimeout", "DeadlineExceeded") else "error"
+        raise
+    finally:
+        provider_seconds.labels(provider, operation, outcome).observe(time.perf_counter() - started)
+
+
+def track_analytics_queues(fetch_q, write_q):
+    """Exports the live depth of a collection run's queues (reset by record_analytics_run)."""
+    analytics_queue_depth.labels("fetch").set_function(fetch_q.qsize)
+    analytics_queue_depth.labels("write").set_function(write_q.qsize)
+
+
+def record_analytics_run(stats):
+    analytics_queue_depth.labels("fetch").set_function(lambda: 0)
+    analytics_queue_depth.labels("write").set_function(lambda: 0)
+    for outcome in ("fetched", "unchanged", "not_modified", "errors", "skipped"):
+        if stats.get(outcome):
+            analytics_accounts.labels(outcome).inc(stats[outcome])
+    if stats.get("elapsed_s") is not None:
+        analytics_run_seconds.observe(stats["elapsed_s"])
+    if stats.get("accounts_per_sec") is not None:
+        analytics_throughput.set(stats["accounts_per_sec"])
+    analytics_last_run.set(time.time())
+
+
+class PoolCollector:
+    """Exports app.db pool state and acquire-wait histograms at scrape time."""
+
+    def describe(self):
+        # lets REGISTRY.register() run without importing app.db (which imports this module)
+        return [
+            GaugeMetricFamily("db_pool_connections", "Open pool connections"),
+            GaugeMetricFamily("db_pool_waiting", "Callers waiting for a pool connection"),
+            HistogramMetricFamily("db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection"),
+        ]
+
+    def collect(self):
+        from app.db import db, db_ro
+
+        size = GaugeMetricFamily("db_pool_connections", "Open pool connections", labels=["database", "state"])
+        waiting = GaugeMetricFamily("db_pool_waiting", "Callers waiting for a pool connection", labels=["database"])
+        wait_hist = HistogramMetricFamily("db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection", labels=["database"])
+        for database in {id(db): db, id(db_ro): db_ro}.values():
+            stats = database.pool_stats()
+            name = stats["name"]
+            if "size" in stats:
+                size.add_metric([name, "open"], stats["size"])
+                size.add_metric([name, "idle"], stats["idle"])
+                size.add_metric([name, "max"], stats["max_size"])
+            waiting.add_metric([name], stats["waiting"])
+            h = database.acquire_wait
+            buckets, total = [], 0
+            for bound, n in zip(h.buckets, h.counts):
+                total += n
+                buckets.append((str(bound), total))
+            buckets.append(("+Inf", h.count))
+            wait_hist.add_metric([name], buckets, h.sum)
+        yield size
+        yield waiting
+        yield wait_hist
+
+
+REGISTRY.register(PoolCollector())
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no BaseHTTPMiddleware overhead, streaming responses untouched)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            # unmatched paths share one label so scanners can't blow up cardinality
+            label = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.labels(scope["method"], label, str(status["code"])).observe(time.perf_counter() - started)
+
+
+def render_metrics():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
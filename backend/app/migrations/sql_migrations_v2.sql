@@ -0,0 +1,418 @@
+-- SQL migrations v2 for AI Social Manager
+-- Run after sql_migrations_v1.sql (Supabase SQL editor or psql). Every statement is idempotent.
+
+-- 1) analytics_collection_shards: one row per (collection run, shard).
+--    Workers claim shards with FOR UPDATE SKIP LOCKED, hold them with a lease and
+--    checkpoint the last social_accounts.id they finished so another worker can resume.
+CREATE TABLE IF NOT EXISTS analytics_collection_shards (
+run_id text NOT NULL,
+shard int NOT NULL,
+shard_count int NOT NULL,
+status varchar(16) DEFAULT 'pending', -- pending | running | done
+owner text,
+lease_until timestamptz,
+checkpoint_id uuid,
+accounts_done int DEFAULT 0,
+started_at timestamptz,
+finished_at timestamptz,
+created_at timestamptz DEFAULT now(),
+PRIMARY KEY (run_id, shard)
+);
+CREATE INDEX IF NOT EXISTS idx_collection_shards_open ON analytics_collection_shards(run_id, shard) WHERE status <> 'done';
+
+-- 2) Change-aware analytics snapshots: a new snapshot row is only written when the
+--    normalized payload hash changes; otherwise last_seen_at is bumped.
+ALTER TABLE analytics_snapshots
+ADD COLUMN IF NOT EXISTS social_account_id uuid,
+ADD COLUMN IF NOT EXISTS payload_hash text,
+ADD COLUMN IF NOT EXISTS last_seen_at timestamptz;
+CREATE INDEX IF NOT EXISTS idx_analytics_account_created ON analytics_snapshots(social_account_id, created_at);
+
+-- 3) analytics_fetch_state: per-account ETag (for If-None-Match) and last stored payload hash
+CREATE TABLE IF NOT EXISTS analytics_fetch_state (
+social_account_id uuid PRIMARY KEY REFERENCES social_accounts(id) ON DELETE CASCADE,
+etag text,
+payload_hash text,
+last_snapshot_id uuid,
+last_seen_at timestamptz DEFAULT now()
+);
+
+-- 4) Typed metrics extracted from snapshot payloads
+ALTER TABLE analytics_snapshots
+ADD COLUMN IF NOT EXISTS followers bigint,
+ADD COLUMN IF NOT EXISTS views bigint,
+ADD COLUMN IF NOT EXISTS media_count bigint;
+ALTER TABLE analytics_fetch_state
+ADD COLUMN IF NOT EXISTS followers bigint,
+ADD COLUMN IF NOT EXISTS views bigint,
+ADD COLUMN IF NOT EXISTS media_count bigint;
+
+-- 5) analytics_rollups: hourly / daily / weekly buckets per account, upserted by the collector
+CREATE TABLE IF NOT EXISTS analytics_rollups (
+social_account_id uuid NOT NULL REFERENCES social_accounts(id) ON DELETE CASCADE,
+granularity varchar(8) NOT NULL, -- hour | day | week
+bucket_start timestamptz NOT NULL,
+user_id uuid,
+provider text,
+samples int DEFAULT 0,
+followers_min bigint,
+followers_max bigint,
+followers_sum bigint DEFAULT 0,
+followers_last bigint,
+views_last bigint,
+media_last bigint,
+last_at timestamptz,
+PRIMARY KEY (social_account_id, granularity, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS idx_rollups_user_range ON analytics_rollups(user_id, granularity, bucket_start);
+
+-- 6) One-time backfill of typed columns + rollups from snapshots stored before v2.
+--    social_accounts is unique on (user_id, provider), so old rows can be attributed to an account.
+UPDATE analytics_snapshots s
+SET social_account_id = a.id
+FROM social_accounts a
+WHERE s.social_account_id IS NULL AND a.user_id = s.user_id AND a.provider = s.provider;
+
+UPDATE analytics_snapshots
+SET followers = COALESCE(payload->>'followers_count', payload#>>'{items,0,statistics,subscriberCount}')::bigint,
+    views = (payload#>>'{items,0,statistics,viewCount}')::bigint,
+    media_count = COALESCE(payload->>'media_count', payload#>>'{items,0,statistics,videoCount}')::bigint
+WHERE followers IS NULL AND views IS NULL AND media_count IS NULL;
+
+INSERT INTO analytics_rollups (social_account_id, granularity, bucket_start, user_id, provider, samples,
+                               followers_min, followers_max, followers_sum, followers_last, views_last, media_last, last_at)
+SELECT DISTINCT ON (s.social_account_id, g.granularity, date_trunc(g.granularity, s.created_at))
+       s.social_account_id, g.granularity, date_trunc(g.granularity, s.created_at), s.user_id, s.provider,
+       COUNT(*) OVER w,
+       MIN(s.followers) OVER w, MAX(s.followers) OVER w, COALESCE(SUM(s.followers) OVER w, 0),
+       s.followers, s.views, s.media_count, s.created_at
+FROM analytics_snapshots s
+CROSS JOIN (VALUES ('hour'), ('day'), ('week')) AS g(granularity)
+WHERE s.social_account_id IS NOT NULL
+WINDOW w AS (PARTITION BY s.social_account_id, g.granularity, date_trunc(g.granularity, s.created_at))
+ORDER BY s.social_account_id, g.granularity, date_trunc(g.granularity, s.created_at), s.created_at DESC
+ON CONFLICT (social_account_id, granularity, bucket_start) DO NOTHING;
+
+-- 7) instagram_media: local mirror of each Instagram account's media (app/instagram/instagram_sync.py)
+CREATE TABLE IF NOT EXISTS instagram_media (
+social_account_id uuid NOT NULL REFERENCES social_accounts(id) ON DELETE CASCADE,
+media_pk text NOT NULL,
+user_id uuid REFERENCES auth.users(id) ON DELETE CASCADE,
+media_type int,
+caption text,
+like_count int,
+comment_count int,
+taken_at timestamptz,
+synced_at timestamptz DEFAULT now(),
+counts_refreshed_at timestamptz,
+PRIMARY KEY (social_account_id, media_pk)
+);
+CREATE INDEX IF NOT EXISTS idx_instagram_media_user_taken ON instagram_media(user_id, taken_at DESC, media_pk DESC);
+
+-- 8) instagram_sync_state: per-account sync cursors
+CREATE TABLE IF NOT EXISTS instagram_sync_state (
+social_account_id uuid PRIMARY KEY REFERENCES social_accounts(id) ON DELETE CASCADE,
+newest_taken_at timestamptz,
+backfill_cursor text,
+backfill_done boolean DEFAULT false,
+last_synced_at timestamptz
+);
+-- head pass that ran out of pages before reaching newest_taken_at: where to resume, and the
+-- newest media it saw (becomes newest_taken_at once the gap is closed)
+ALTER TABLE instagram_sync_state ADD COLUMN IF NOT EXISTS head_cursor text;
+ALTER TABLE instagram_sync_state ADD COLUMN IF NOT EXISTS head_newest_taken_at timestamptz;
+
+-- 9) user_stats: per-user dashboard counters served by /me with a single primary-key lookup.
+--    Maintained by triggers, so every write path (API, scheduler, OAuth callbacks, manual SQL) is covered.
+--    posts / scheduled_posts use statement-level triggers with transition tables, so a bulk insert
+--    updates each user's row once instead of once per inserted row.
+CREATE TABLE IF NOT EXISTS user_stats (
+user_id uuid PRIMARY KEY,
+posts_total bigint NOT NULL DEFAULT 0,
+scheduled_pending bigint NOT NULL DEFAULT 0,
+connected_accounts jsonb NOT NULL DEFAULT '{}'::jsonb, -- {provider: count}
+ai_keys jsonb NOT NULL DEFAULT '[]'::jsonb,            -- [{provider, created_at}]
+updated_at timestamptz DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION user_stats_add(uid uuid, d_posts bigint, d_pending bigint) RETURNS void AS $$
+BEGIN
+  IF uid IS NULL OR (d_posts = 0 AND d_pending = 0) THEN RETURN; END IF;
+  INSERT INTO user_stats (user_id, posts_total, scheduled_pending, updated_at)
+  VALUES (uid, GREATEST(d_posts, 0), GREATEST(d_pending, 0), now())
+  ON CONFLICT (user_id) DO UPDATE SET
+    posts_total = GREATEST(user_stats.posts_total + d_posts, 0),
+    scheduled_pending = GREATEST(user_stats.scheduled_pending + d_pending, 0),
+    updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_posts_ins() RETURNS trigger AS $$
+BEGIN
+  PERFORM user_stats_add(user_id, COUNT(*), 0) FROM new_rows GROUP BY user_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_posts_del() RETURNS trigger AS $$
+BEGIN
+  PERFORM user_stats_add(user_id, -COUNT(*), 0) FROM old_rows GROUP BY user_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_sched_ins() RETURNS trigger AS $$
+BEGIN
+  PERFORM user_stats_add(user_id, 0, COUNT(*)) FROM new_rows WHERE status = 'pending' GROUP BY user_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_sched_del() RETURNS trigger AS $$
+BEGIN
+  PERFORM user_stats_add(user_id, 0, -COUNT(*)) FROM old_rows WHERE status = 'pending' GROUP BY user_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_sched_upd() RETURNS trigger AS $$
+BEGIN
+  PERFORM user_stats_add(user_id, 0, SUM(d)::bigint)
+  FROM (
+    SELECT user_id, 1 AS d FROM new_rows WHERE status = 'pending'
+    UNION ALL
+    SELECT user_id, -1 AS d FROM old_rows WHERE status = 'pending'
+  ) delta
+  GROUP BY user_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- low-volume tables: recompute the affected user's summary from its (indexed) rows
+CREATE OR REPLACE FUNCTION user_stats_refresh_accounts(uid uuid) RETURNS void AS $$
+BEGIN
+  IF uid IS NULL THEN RETURN; END IF;
+  INSERT INTO user_stats (user_id, connected_accounts, updated_at)
+  VALUES (uid, COALESCE((SELECT jsonb_object_agg(provider, cnt) FROM (
+            SELECT provider, COUNT(*) AS cnt FROM social_accounts WHERE user_id = uid GROUP BY provider) a), '{}'::jsonb), now())
+  ON CONFLICT (user_id) DO UPDATE SET connected_accounts = EXCLUDED.connected_accounts, updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_refresh_ai_keys(uid uuid) RETURNS void AS $$
+BEGIN
+  IF uid IS NULL THEN RETURN; END IF;
+  INSERT INTO user_stats (user_id, ai_keys, updated_at)
+  VALUES (uid, COALESCE((SELECT jsonb_agg(jsonb_build_object('provider', provider, 'created_at', created_at) ORDER BY provider)
+            FROM user_api_keys WHERE user_id = uid), '[]'::jsonb), now())
+  ON CONFLICT (user_id) DO UPDATE SET ai_keys = EXCLUDED.ai_keys, updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_accounts_trg() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN PERFORM user_stats_refresh_accounts(OLD.user_id); END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.user_id IS DISTINCT FROM OLD.user_id OR NEW.provider IS DISTINCT FROM OLD.provider) THEN
+    PERFORM user_stats_refresh_accounts(NEW.user_id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_ai_keys_trg() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN PERFORM user_stats_refresh_ai_keys(OLD.user_id); END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+    PERFORM user_stats_refresh_ai_keys(NEW.user_id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_user_stats_posts_ins ON posts;
+CREATE TRIGGER trg_user_stats_posts_ins AFTER INSERT ON posts REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_stats_posts_ins();
+DROP TRIGGER IF EXISTS trg_user_stats_posts_del ON posts;
+CREATE TRIGGER trg_user_stats_posts_del AFTER DELETE ON posts REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_stats_posts_del();
+DROP TRIGGER IF EXISTS trg_user_stats_sched_ins ON scheduled_posts;
+CREATE TRIGGER trg_user_stats_sched_ins AFTER INSERT ON scheduled_posts REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_stats_sched_ins();
+DROP TRIGGER IF EXISTS trg_user_stats_sched_del ON scheduled_posts;
+CREATE TRIGGER trg_user_stats_sched_del AFTER DELETE ON scheduled_posts REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_stats_sched_del();
+DROP TRIGGER IF EXISTS trg_user_stats_sched_upd ON scheduled_posts;
+CREATE TRIGGER trg_user_stats_sched_upd AFTER UPDATE ON scheduled_posts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_stats_sched_upd();
+DROP TRIGGER IF EXISTS trg_user_stats_accounts ON social_accounts;
+CREATE TRIGGER trg_user_stats_accounts AFTER INSERT OR UPDATE OR DELETE ON social_accounts FOR EACH ROW EXECUTE FUNCTION user_stats_accounts_trg();
+DROP TRIGGER IF EXISTS trg_user_stats_ai_keys ON user_api_keys;
+CREATE TRIGGER trg_user_stats_ai_keys AFTER INSERT OR UPDATE OR DELETE ON user_api_keys FOR EACH ROW EXECUTE FUNCTION user_stats_ai_keys_trg();
+
+-- Consistency checker / rebuild. user_stats_expected recomputes the counters from the base tables;
+-- rebuild_user_stats() (one user, or everyone when NULL) writes them back and returns how many rows were wrong.
+CREATE OR REPLACE VIEW user_stats_expected AS
+WITH users AS (
+  SELECT user_id FROM posts
+  UNION SELECT user_id FROM scheduled_posts
+  UNION SELECT user_id FROM social_accounts
+  UNION SELECT user_id FROM user_api_keys
+  UNION SELECT user_id FROM user_stats
+)
+SELECT u.user_id,
+  (SELECT COUNT(*) FROM posts p WHERE p.user_id = u.user_id) AS posts_total,
+  (SELECT COUNT(*) FROM scheduled_posts s WHERE s.user_id = u.user_id AND s.status = 'pending') AS scheduled_pending,
+  COALESCE((SELECT jsonb_object_agg(provider, cnt) FROM (
+    SELECT provider, COUNT(*) AS cnt FROM social_accounts a WHERE a.user_id = u.user_id GROUP BY provider) x), '{}'::jsonb) AS connected_accounts,
+  COALESCE((SELECT jsonb_agg(jsonb_build_object('provider', provider, 'created_at', created_at) ORDER BY provider)
+    FROM user_api_keys k WHERE k.user_id = u.user_id), '[]'::jsonb) AS ai_keys
+FROM users u WHERE u.user_id IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION rebuild_user_stats(uid uuid DEFAULT NULL) RETURNS integer AS $$
+DECLARE fixed integer;
+BEGIN
+  WITH upserted AS (
+    INSERT INTO user_stats AS us (user_id, posts_total, scheduled_pending, connected_accounts, ai_keys, updated_at)
+    SELECT user_id, posts_total, scheduled_pending, connected_accounts, ai_keys, now()
+    FROM user_stats_expected WHERE uid IS NULL OR user_id = uid
+    ON CONFLICT (user_id) DO UPDATE SET
+      posts_total = EXCLUDED.posts_total,
+      scheduled_pending = EXCLUDED.scheduled_pending,
+      connected_accounts = EXCLUDED.connected_accounts,
+      ai_keys = EXCLUDED.ai_keys,
+      updated_at = now()
+    WHERE (us.posts_total, us.scheduled_pending, us.connected_accounts, us.ai_keys)
+          IS DISTINCT FROM (EXCLUDED.posts_total, EXCLUDED.scheduled_pending, EXCLUDED.connected_accounts, EXCLUDED.ai_keys)
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO fixed FROM upserted;
+  RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- initial fill
+SELECT rebuild_user_stats();
+
+-- 10) keyset pagination: composite indexes matching the /posts/history and /schedule sort keys
+CREATE INDEX IF NOT EXISTS idx_posts_user_created_id ON posts(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scheduled_posts_user_sched_id ON scheduled_posts(user_id, scheduled_at, id);
+
+-- 11) hot-path indexes (checked by app/scripts/check_query_plans.py)
+-- publisher / tasks: status = 'pending' AND scheduled_at <= now() ORDER BY scheduled_at LIMIT n
+CREATE INDEX IF NOT EXISTS idx_scheduled_posts_due ON scheduled_posts(scheduled_at) WHERE status = 'pending';
+-- posts_get: user_id + platform + platform_post_id
+CREATE INDEX IF NOT EXISTS idx_posts_user_platform_post ON posts(user_id, platform, platform_post_id);
+-- instagram sync: provider = 'instagram' ORDER BY id (keyset pages over all accounts)
+CREATE INDEX IF NOT EXISTS idx_social_accounts_instagram ON social_accounts(id) WHERE provider = 'instagram';
+-- superseded by the partial / composite indexes above
+DROP INDEX IF EXISTS idx_scheduled_posts_status;
+DROP INDEX IF EXISTS idx_posts_platform;
+
+-- 12) key_rotation_progress: re-encryption of stored secrets with the newest Fernet key (app/key_rotation.py).
+--     One row per "<table>.<column>" target; workers hold it with a lease and checkpoint the last
+--     keyset position they finished, so a run survives restarts.
+CREATE TABLE IF NOT EXISTS key_rotation_progress (
+target text PRIMARY KEY,
+key_id text NOT NULL, -- fingerprint of the primary key rows are moved to
+status varchar(16) DEFAULT 'running', -- running | done
+owner text,
+lease_until timestamptz,
+checkpoint jsonb, -- keyset columns of the last row processed
+rows_scanned bigint NOT NULL DEFAULT 0,
+rows_rotated bigint NOT NULL DEFAULT 0,
+rows_current bigint NOT NULL DEFAULT 0,
+rows_unreadable bigint NOT NULL DEFAULT 0,
+started_at timestamptz,
+updated_at timestamptz,
+finished_at timestamptz
+);
+-- re-encrypting tokens must not recompute user_stats for every row: only fire on the columns the summaries read
+DROP TRIGGER IF EXISTS trg_user_stats_accounts ON social_accounts;
+CREATE TRIGGER trg_user_stats_accounts AFTER INSERT OR DELETE OR UPDATE OF user_id, provider ON social_accounts FOR EACH ROW EXECUTE FUNCTION user_stats_accounts_trg();
+DROP TRIGGER IF EXISTS trg_user_stats_ai_keys ON user_api_keys;
+CREATE TRIGGER trg_user_stats_ai_keys AFTER INSERT OR DELETE OR UPDATE OF user_id, provider, created_at ON user_api_keys FOR EACH ROW EXECUTE FUNCTION user_stats_ai_keys_trg();
+
+-- 13) per-user version stamps for conditional GETs (app/etags.py). Each counter is bumped by a
+--     statement-level trigger whenever a write changes what the matching endpoint returns; the ETag
+--     of /me, /schedule, /posts/history, /social/accounts and /user/ai-key is derived from them.
+--     TG_ARGV[1] lists the columns the endpoint serves: an UPDATE that changes none of them (token
+--     refresh, key rotation re-encrypting secrets) doesn't invalidate anything. Column lists can't be
+--     combined with transition tables, hence the old/new comparison inside the function.
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS posts_version bigint NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS schedule_version bigint NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS accounts_version bigint NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS ai_keys_version bigint NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION user_versions_bump() RETURNS trigger AS $$
+DECLARE
+  col text := TG_ARGV[0];
+  cols text := TG_ARGV[1];
+  changed text;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    changed := 'SELECT user_id FROM new_rows';
+  ELSIF TG_OP = 'DELETE' THEN
+    changed := 'SELECT user_id FROM old_rows';
+  ELSE
+    changed := format(
+      'SELECT user_id FROM ((SELECT user_id, %1$s FROM new_rows EXCEPT SELECT user_id, %1$s FROM old_rows) '
+      'UNION (SELECT user_id, %1$s FROM old_rows EXCEPT SELECT user_id, %1$s FROM new_rows)) d', cols);
+  END IF;
+  EXECUTE format(
+    'INSERT INTO user_stats AS us (user_id, %1$I) SELECT DISTINCT user_id, 1 FROM (%2$s) c WHERE user_id IS NOT NULL '
+    'ON CONFLICT (user_id) DO UPDATE SET %1$I = us.%1$I + 1', col, changed);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_user_versions_posts_ins ON posts;
+CREATE TRIGGER trg_user_versions_posts_ins AFTER INSERT ON posts REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('posts_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_posts_upd ON posts;
+CREATE TRIGGER trg_user_versions_posts_upd AFTER UPDATE ON posts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('posts_version', 'id, platform, platform_post_id, content, metadata, created_at');
+DROP TRIGGER IF EXISTS trg_user_versions_posts_del ON posts;
+CREATE TRIGGER trg_user_versions_posts_del AFTER DELETE ON posts REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('posts_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_sched_ins ON scheduled_posts;
+CREATE TRIGGER trg_user_versions_sched_ins AFTER INSERT ON scheduled_posts REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('schedule_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_sched_upd ON scheduled_posts;
+CREATE TRIGGER trg_user_versions_sched_upd AFTER UPDATE ON scheduled_posts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('schedule_version', 'id, social_account_id, content, metadata, scheduled_at, status, created_at');
+DROP TRIGGER IF EXISTS trg_user_versions_sched_del ON scheduled_posts;
+CREATE TRIGGER trg_user_versions_sched_del AFTER DELETE ON scheduled_posts REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('schedule_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_accounts_ins ON social_accounts;
+CREATE TRIGGER trg_user_versions_accounts_ins AFTER INSERT ON social_accounts REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('accounts_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_accounts_upd ON social_accounts;
+CREATE TRIGGER trg_user_versions_accounts_upd AFTER UPDATE ON social_accounts REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('accounts_version', 'id, provider, provider_user_id, scopes, expires_at, created_at');
+DROP TRIGGER IF EXISTS trg_user_versions_accounts_del ON social_accounts;
+CREATE TRIGGER trg_user_versions_accounts_del AFTER DELETE ON social_accounts REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('accounts_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_ai_keys_ins ON user_api_keys;
+CREATE TRIGGER trg_user_versions_ai_keys_ins AFTER INSERT ON user_api_keys REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('ai_keys_version', '');
+DROP TRIGGER IF EXISTS trg_user_versions_ai_keys_upd ON user_api_keys;
+CREATE TRIGGER trg_user_versions_ai_keys_upd AFTER UPDATE ON user_api_keys REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('ai_keys_version', 'provider, created_at');
+DROP TRIGGER IF EXISTS trg_user_versions_ai_keys_del ON user_api_keys;
+CREATE TRIGGER trg_user_versions_ai_keys_del AFTER DELETE ON user_api_keys REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION user_versions_bump('ai_keys_version', '');
+
+-- drift repair (section 9) changes what /me returns too: bump the version of every counter it
+-- rewrites, or clients holding the old ETag keep getting 304 with the drifted numbers.
+-- A user without a row had all versions at 0, so a new row starts at 1.
+CREATE OR REPLACE FUNCTION rebuild_user_stats(uid uuid DEFAULT NULL) RETURNS integer AS $$
+DECLARE fixed integer;
+BEGIN
+  WITH upserted AS (
+    INSERT INTO user_stats AS us (user_id, posts_total, scheduled_pending, connected_accounts, ai_keys, updated_at,
+                                  posts_version, schedule_version, accounts_version, ai_keys_version)
+    SELECT user_id, posts_total, scheduled_pending, connected_accounts, ai_keys, now(), 1, 1, 1, 1
+    FROM user_stats_expected WHERE uid IS NULL OR user_id = uid
+    ON CONFLICT (user_id) DO UPDATE SET
+      posts_total = EXCLUDED.posts_total,
+      scheduled_pending = EXCLUDED.scheduled_pending,
+      connected_accounts = EXCLUDED.connected_accounts,
+      ai_keys = EXCLUDED.ai_keys,
+      posts_version = us.posts_version + (us.posts_total IS DISTINCT FROM EXCLUDED.posts_total)::int,
+      schedule_version = us.schedule_version + (us.scheduled_pending IS DISTINCT FROM EXCLUDED.scheduled_pending)::int,
+      accounts_version = us.accounts_version + (us.connected_accounts IS DISTINCT FROM EXCLUDED.connected_accounts)::int,
+      ai_keys_version = us.ai_keys_version + (us.ai_keys IS DISTINCT FROM EXCLUDED.ai_keys)::int,
+      updated_at = now()
+    WHERE (us.posts_total, us.scheduled_pending, us.connected_accounts, us.ai_keys)
+          IS DISTINCT FROM (EXCLUDED.posts_total, EXCLUDED.scheduled_pending, EXCLUDED.connected_accounts, EXCLUDED.ai_keys)
+    RETURNING 1
+  )
+  SELECT COUNT(*) INTO fixed FROM upserted;
+  RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- End of migrations
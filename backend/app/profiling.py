@@ -0,0 +1,211 @@
+# app/profiling.py
+"""
+Opt-in profiling of single requests and sampled scheduler ticks.
+
+- PROFILE_REQUESTS=1 installs ProfilingMiddleware; an admin (ADMIN_USER_IDS) then profiles one
+  request by sending "X-Profile: 1" or adding "?_profile=1". The response carries X-Profile-Id.
+- @profiled_job(name) profiles a PROFILE_JOB_SAMPLE_RATE fraction of a job's runs
+- uses pyinstrument when installed (sampling, async-aware, HTML call tree / flame view); otherwise
+  cProfile (.pstats, open with snakeviz or pstats). cProfile is process-wide, so its reports also
+  contain whatever else the event loop ran during the request.
+- only one profile is taken at a time; requests/ticks arriving meanwhile simply run unprofiled
+- reports live in PROFILE_DIR as a ring of the newest PROFILE_MAX_REPORTS files, listed and
+  downloaded through /admin/profiles
+- with PROFILE_REQUESTS off and PROFILE_JOB_SAMPLE_RATE=0 (the defaults) no middleware is installed
+  and jobs are not wrapped, so there is no overhead at all
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import cProfile
+import functools
+import importlib.util
+import tempfile
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+
+from app.auth_supabase import is_admin, verify_supabase_jwt
+from app.log import get_logger
+
+# pyinstrument itself is only imported when a profile is taken
+_HAS_PYINSTRUMENT = importlib.util.find_spec("pyinstrument") is not None
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0").lower() in ("1", "true", "yes")
+PROFILE_JOB_SAMPLE_RATE = float(os.getenv("PROFILE_JOB_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ai-social-media-profiles"))
+PROFILE_MAX_REPORTS = int(os.getenv("PROFILE_MAX_REPORTS", "50"))
+# pyinstrument sampling interval in seconds
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+_REPORT_ID = re.compile(r"[A-Za-z0-9_.-]+")
+_busy = False
+
+log = get_logger(__name__)
+
+
+class _Session:
+    def __init__(self):
+        if _HAS_PYINSTRUMENT:
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+            self.ext = ".html"
+        else:
+            self._profiler = cProfile.Profile()
+            self.ext = ".pstats"
+
+    def start(self):
+        if _HAS_PYINSTRUMENT:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if _HAS_PYINSTRUMENT:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def write(self, path: str):
+        if _HAS_PYINSTRUMENT:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(path)
+
+
+def _new_report_id(kind: str, label: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:60] or "root"
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{kind}-{slug}"
+
+
+def _store(session: _Session, report_id: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp = os.path.join(PROFILE_DIR, f".{report_id}.tmp")
+    session.write(tmp)
+    os.replace(tmp, os.path.join(PROFILE_DIR, report_id + session.ext))
+    # ring: keep the newest PROFILE_MAX_REPORTS reports
+    reports = sorted(_report_files(), key=lambda e: e[1].st_mtime, reverse=True)
+    for name, _ in reports[PROFILE_MAX_REPORTS:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _report_files():
+    try:
+        with os.scandir(PROFILE_DIR) as it:
+            return [(e.name, e.stat()) for e in it if e.is_file() and not e.name.startswith(".")]
+    except FileNotFoundError:
+        return []
+
+
+async def _run_profiled(report_id: str, call):
+    """Awaits call() under a profiler (unless one is already running) and stores the report."""
+    global _busy
+    if _busy:
+        return await call()
+    _busy = True
+    session = _Session()
+    session.start()
+    try:
+        return await call()
+    finally:
+        session.stop()
+        _busy = False
+        try:
+            await asyncio.to_thread(_store, session, report_id)
+        except Exception as e:
+            log.warning("could not store profile", extra={"report_id": report_id, "error": str(e)})
+
+
+def profiled_job(name: str):
+    """Decorator for async scheduler jobs; returns the job unchanged when sampling is off."""
+    def decorate(func):
+        if PROFILE_JOB_SAMPLE_RATE <= 0:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if random.random() >= PROFILE_JOB_SAMPLE_RATE:
+                return await func(*args, **kwargs)
+            return await _run_profiled(_new_report_id("job", name), lambda: func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers") or []:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _wants_profile(scope) -> bool:
+    if (_header(scope, b"x-profile") or "").lower() in ("1", "true", "yes"):
+        return True
+    query = scope.get("query_string") or b""
+    return b"_profile=" in query and parse_qs(query.decode("latin-1")).get("_profile", [""])[0] in ("1", "true", "yes")
+
+
+def _is_admin_request(scope) -> bool:
+    try:
+        return is_admin(verify_supabase_jwt(_header(scope, b"authorization")))
+    except HTTPException:
+        return False
+
+
+class ProfilingMiddleware:
+    """Profiles requests flagged by an admin; everything else passes straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope) or not _is_admin_request(scope):
+            return await self.app(scope, receive, send)
+        if _busy:
+            # another profile is running; this request goes unprofiled (and gets no X-Profile-Id)
+            return await self.app(scope, receive, send)
+        report_id = _new_report_id("request", f"{scope['method']} {scope['path']}")
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers") or []) + [(b"x-profile-id", report_id.encode())]}
+            await send(message)
+
+        return await _run_profiled(report_id, lambda: self.app(scope, receive, _send))
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    reports = sorted(_report_files(), key=lambda e: e[1].st_mtime, reverse=True)
+    return [
+        {"id": os.path.splitext(name)[0], "file": name, "bytes": st.st_size, "created": st.st_mtime}
+        for name, st in reports
+    ]
+
+
+def profile_path(report_id: str) -> Optional[str]:
+    """Path of a stored report, or None (ids are validated so they can't escape PROFILE_DIR)."""
+    if not _REPORT_ID.fullmatch(report_id):
+        return None
+    for ext in (".html", ".pstats"):
+        path = os.path.join(PROFILE_DIR, report_id + ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def profiling_config() -> Dict[str, Any]:
+    return {
+        "requests": PROFILE_REQUESTS,
+        "job_sample_rate": PROFILE_JOB_SAMPLE_RATE,
+        "profiler": "pyinstrument" if _HAS_PYINSTRUMENT else "cProfile",
+        "dir": PROFILE_DIR,
+        "max_reports": PROFILE_MAX_REPORTS,
+    }
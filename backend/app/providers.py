@@ -0,0 +1,85 @@
+# app/providers.py
+"""
+Provider selection and lazy SDK loading.
+
+- ENABLED_PROVIDERS (comma separated, default "instagram,youtube,openai,gemini") selects the
+  providers this deployment serves. Routers of disabled social providers are not registered,
+  publishing to them returns 400, and the AI failover skips disabled AI providers.
+- The provider SDKs (google.genai, googleapiclient, google_auth_oauthlib, instagrapi) are
+  imported on first use through lazy_import() instead of when app.main loads. Routers are still
+  registered up front; only the SDK import is deferred. loaded_sdks() (/admin/providers) shows
+  what a worker has loaded and how long each import took.
+- SDK_PRELOAD=1 imports the SDKs of enabled providers in a background thread right after
+  startup, trading memory for first-request latency.
+
+Measure the effect with `python -m app.scripts.bench_startup`.
+"""
+import os
+import time
+import importlib
+import threading
+from typing import Dict
+
+from fastapi import HTTPException
+
+from app.log import get_logger
+
+ALL_PROVIDERS = ("instagram", "youtube", "openai", "gemini")
+ENABLED_PROVIDERS = {
+    p.strip().lower() for p in os.getenv("ENABLED_PROVIDERS", ",".join(ALL_PROVIDERS)).split(",") if p.strip()
+}
+SDK_PRELOAD = os.getenv("SDK_PRELOAD", "0").lower() in ("1", "true", "yes")
+
+# SDK modules each provider needs; what SDK_PRELOAD warms up
+PROVIDER_SDKS = {
+    "instagram": ("instagrapi",),
+    "youtube": ("googleapiclient.discovery", "googleapiclient.http", "google.oauth2.credentials", "google_auth_oauthlib.flow", "google_auth_httplib2"),
+    "gemini": ("google.genai", "google.genai.types"),
+    "openai": (),
+}
+
+_loaded: Dict[str, float] = {}
+_lock = threading.Lock()
+
+log = get_logger(__name__)
+
+
+def provider_enabled(provider: str) -> bool:
+    return (provider or "").lower() in ENABLED_PROVIDERS
+
+
+def require_provider(provider: str):
+    if not provider_enabled(provider):
+        raise HTTPException(status_code=400, detail=f"provider '{provider}' is not enabled on this server")
+
+
+def lazy_import(module: str):
+    """importlib.import_module that records how long the first import of each SDK took."""
+    if module in _loaded:
+        return importlib.import_module(module)
+    # serialized so two threads importing the same SDK don't both pay for (and race on) it
+    with _lock:
+        if module not in _loaded:
+            started = time.perf_counter()
+            importlib.import_module(module)
+            _loaded[module] = time.perf_counter() - started
+            log.info("sdk loaded", extra={"sdk": module, "ms": round(_loaded[module] * 1000)})
+    return importlib.import_module(module)
+
+
+def loaded_sdks() -> Dict[str, float]:
+    return {m: round(s, 4) for m, s in _loaded.items()}
+
+
+def preload_sdks():
+    for provider in sorted(ENABLED_PROVIDERS):
+        for module in PROVIDER_SDKS.get(provider, ()):
+            try:
+                lazy_import(module)
+            except Exception as e:
+                log.warning("sdk preload failed", extra={"sdk": module, "error": str(e)})
+
+
+def start_preload():
+    if SDK_PRELOAD:
+        threading.Thread(target=preload_sdks, name="sdk-preload", daemon=True).start()
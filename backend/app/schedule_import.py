@@ -0,0 +1,136 @@
+# app/schedule_import.py
+"""
+Bulk scheduling import (POST /schedule/bulk).
+
+- accepts a JSON list (or {"posts": [...]}) or a CSV with a header row; columns:
+  social_account_id, content, scheduled_at (ISO 8601, UTC when no offset; empty = now), metadata (JSON object)
+- every row is validated up front (account ownership is checked with one query for the whole batch)
+  and errors are reported per row
+- valid rows are inserted with one INSERT ... SELECT FROM unnest(...) statement, so a month of posts
+  for dozens of accounts is a single round trip regardless of row count
+"""
+import os
+import csv
+import io
+import json
+import datetime
+from typing import Any, Dict, List, Tuple
+
+from app.db import db
+from app.media_cache import is_remote_url
+
+BULK_SCHEDULE_MAX_ROWS = int(os.getenv("BULK_SCHEDULE_MAX_ROWS", "5000"))
+MAX_CONTENT_LENGTH = 10000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_import(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """Raw rows from a CSV or JSON request body."""
+    text = body.decode("utf-8-sig")
+    if "csv" in (content_type or ""):
+        try:
+            return [dict(r) for r in csv.DictReader(io.StringIO(text))]
+        except csv.Error as e:
+            raise ImportFormatError(f"invalid CSV: {e}")
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ImportFormatError(f"invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("posts")
+    if not isinstance(data, list):
+        raise ImportFormatError("expected a JSON list of posts or {\"posts\": [...]}")
+    return data
+
+
+def _parse_scheduled_at(value: Any, now: datetime.datetime) -> datetime.datetime:
+    if value in (None, ""):
+        return now
+    ts = datetime.datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+
+def _parse_metadata(value: Any) -> Dict[str, Any]:
+    if value in (None, ""):
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError("metadata must be a JSON object")
+    return value
+
+
+async def validate_rows(user_id: str, rows: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Returns (valid rows, errors); each carries its 0-based input `row` index."""
+    owned = {str(r["id"]) for r in await db.fetch_all("SELECT id FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})}
+    now = datetime.datetime.now(datetime.timezone.utc)
+    valid, errors = [], []
+    for i, raw in enumerate(rows):
+        if not isinstance(raw, dict):
+            errors.append({"row": i, "error": "row must be an object"})
+            continue
+        account_id = str(raw.get("social_account_id") or "").strip()
+        content = raw.get("content")
+        if not account_id:
+            errors.append({"row": i, "error": "social_account_id missing"})
+            continue
+        if account_id not in owned:
+            errors.append({"row": i, "error": "social account not found"})
+            continue
+        if not isinstance(content, str) or not content.strip():
+            errors.append({"row": i, "error": "content missing"})
+            continue
+        if len(content) > MAX_CONTENT_LENGTH:
+            errors.append({"row": i, "error": f"content longer than {MAX_CONTENT_LENGTH} characters"})
+            continue
+        try:
+            scheduled_at = _parse_scheduled_at(raw.get("scheduled_at"), now)
+        except ValueError:
+            errors.append({"row": i, "error": "scheduled_at is not an ISO 8601 timestamp"})
+            continue
+        try:
+            metadata = _parse_metadata(raw.get("metadata"))
+        except ValueError:
+            errors.append({"row": i, "error": "metadata must be a JSON object"})
+            continue
+        if metadata.get("media_url") is not None and not is_remote_url(metadata["media_url"]):
+            errors.append({"row": i, "error": "metadata.media_url must be an http(s) URL"})
+            continue
+        valid.append({"row": i, "social_account_id": account_id, "content": content,
+                      "scheduled_at": scheduled_at, "metadata": metadata})
+    return valid, errors
+
+
+async def insert_rows(user_id: str, rows: List[Dict[str, Any]]) -> Dict[int, Any]:
+    """One statement for the whole batch; returns {input `row` index: new id}."""
+    if not rows:
+        return {}
+    # RETURNING order is not guaranteed to follow the SELECT order, so the ids are generated up
+    # front and come back next to the ordinal of the row they were inserted for
+    result = await db.fetch_all(
+        """
+        WITH r AS (
+            SELECT gen_random_uuid() AS id, account_id, content, metadata, scheduled_at, ord
+            FROM unnest(CAST(:accounts AS uuid[]), CAST(:contents AS text[]), CAST(:metadata AS text[]), CAST(:scheduled AS timestamptz[]))
+                 WITH ORDINALITY AS u(account_id, content, metadata, scheduled_at, ord)
+        ), ins AS (
+            INSERT INTO scheduled_posts (id, user_id, social_account_id, content, metadata, scheduled_at, status, created_at)
+            SELECT r.id, :uid, r.account_id, r.content, r.metadata::jsonb, r.scheduled_at, 'pending', NOW()
+            FROM r
+            RETURNING id
+        )
+        SELECT ins.id, r.ord FROM ins JOIN r ON r.id = ins.id
+        ORDER BY r.ord
+        """,
+        values={
+            "uid": user_id,
+            "accounts": [r["social_account_id"] for r in rows],
+            "contents": [r["content"] for r in rows],
+            "metadata": [json.dumps(r["metadata"]) for r in rows],
+            "scheduled": [r["scheduled_at"] for r in rows],
+        },
+    )
+    return {rows[r["ord"] - 1]["row"]: r["id"] for r in result}
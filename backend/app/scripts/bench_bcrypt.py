@@ -0,0 +1,173 @@
+# app/scripts/bench_bcrypt.py
+"""
+Login benchmark: bcrypt on the event loop vs in the bounded hashing pool (app.auth_local).
+
+For each mode a small app (the auth_local router plus a trivial GET /ping) is started in its own
+process; --concurrency clients then log in for --duration seconds while one client keeps calling
+/ping. The report shows login throughput / 503s and how much the logins slow down the cheap endpoint.
+
+    cd backend
+    python -m app.scripts.bench_bcrypt --concurrency 32 --duration 10
+    BCRYPT_ROUNDS=10 python -m app.scripts.bench_bcrypt --modes pool --seed-rounds 12   # also exercises rehash
+
+Modes: inline (BCRYPT_WORKERS=0, the old behaviour) and pool (BCRYPT_WORKERS / BCRYPT_MAX_PENDING
+from the environment). Needs DATABASE_URL and a `users` table (id, email, password_hash), like
+auth_local itself; the bench user is removed afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app.scripts.bench_load import BACKEND_DIR, summarize, _wait_ready
+
+BENCH_EMAIL = "bench-bcrypt@example.com"
+BENCH_PASSWORD = "bench-password-123"
+MODES = {"inline": {"BCRYPT_WORKERS": "0"}, "pool": {}}
+
+
+def build_app():
+    from fastapi import FastAPI
+    from app.db import db
+    from app.auth_local import router
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.on_event("startup")
+    async def _connect():
+        await db.connect()
+
+    @app.on_event("shutdown")
+    async def _disconnect():
+        await db.disconnect()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def _seed(rounds: int):
+    import bcrypt
+    from app.db import db
+
+    await db.connect()
+    try:
+        await db.execute("DELETE FROM users WHERE email = :email", values={"email": BENCH_EMAIL})
+        hashed = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+        await db.execute("INSERT INTO users (email, password_hash) VALUES (:email, :ph)", values={"email": BENCH_EMAIL, "ph": hashed})
+    finally:
+        await db.disconnect()
+
+
+async def _stored_cost() -> int:
+    from app.db import db
+
+    await db.connect()
+    try:
+        hashed = await db.fetch_val("SELECT password_hash FROM users WHERE email = :email", values={"email": BENCH_EMAIL})
+        await db.execute("DELETE FROM users WHERE email = :email", values={"email": BENCH_EMAIL})
+        return int(hashed.split("$")[2])
+    finally:
+        await db.disconnect()
+
+
+async def _run_mode(mode: str, port: int, args) -> Dict[str, Any]:
+    env = {**os.environ, **MODES[mode]}
+    log = open(args.log, "ab")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.scripts.bench_bcrypt", "serve", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        await _wait_ready(f"{base}/ping", proc)
+        limits = httpx.Limits(max_connections=args.concurrency + 2)
+        async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+            body = {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+            deadline = time.perf_counter() + args.duration
+            login_lat: List[float] = []
+            login_status: Dict[str, int] = {}
+            ping_lat: List[float] = []
+            ping_status: Dict[str, int] = {}
+
+            async def call(method, path, lat, statuses, **kw):
+                started = time.perf_counter()
+                try:
+                    code = str((await client.request(method, path, **kw)).status_code)
+                except httpx.HTTPError as e:
+                    code = e.__class__.__name__
+                lat.append(time.perf_counter() - started)
+                statuses[code] = statuses.get(code, 0) + 1
+                return code
+
+            async def login_worker():
+                while time.perf_counter() < deadline:
+                    if await call("POST", "/auth/login", login_lat, login_status, json=body) == "503":
+                        # a well-behaved client backs off instead of hammering a saturated server
+                        await asyncio.sleep(args.backoff)
+
+            async def ping_worker():
+                while time.perf_counter() < deadline:
+                    await call("GET", "/ping", ping_lat, ping_status)
+                    await asyncio.sleep(0.01)
+
+            started = time.perf_counter()
+            await asyncio.gather(ping_worker(), *(login_worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+        return {
+            "mode": mode,
+            "env": MODES[mode] or {k: os.environ[k] for k in ("BCRYPT_WORKERS", "BCRYPT_MAX_PENDING") if k in os.environ},
+            "login": summarize("login", login_lat, login_status, elapsed, args.concurrency),
+            "logins_ok_per_s": round(login_status.get("200", 0) / elapsed, 2),
+            "ping": summarize("ping", ping_lat, ping_status, elapsed, 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        log.close()
+
+
+async def _main(args):
+    from app.auth_local import BCRYPT_ROUNDS
+
+    report = {"bcrypt_rounds": BCRYPT_ROUNDS, "concurrency": args.concurrency, "duration_s": args.duration, "cpus": os.cpu_count(), "modes": []}
+    for i, mode in enumerate(args.modes.split(",")):
+        # every mode starts from the same stored hash
+        await _seed(args.seed_rounds or BCRYPT_ROUNDS)
+        report["modes"].append(await _run_mode(mode, args.port + i, args))
+        report["modes"][-1]["stored_cost_after"] = await _stored_cost()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput with bcrypt inline vs in the hashing pool")
+    parser.add_argument("command", nargs="?", choices=["run", "serve"], default="run")
+    parser.add_argument("--port", type=int, default=9300)
+    parser.add_argument("--modes", default="inline,pool")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--backoff", type=float, default=0.25, help="seconds a client waits after a 503")
+    parser.add_argument("--seed-rounds", type=int, default=0, help="cost of the seeded hash (default BCRYPT_ROUNDS)")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "bench_bcrypt.log"), help="server output")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import uvicorn
+
+        uvicorn.run(build_app(), host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+        return
+    print(json.dumps(asyncio.run(_main(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
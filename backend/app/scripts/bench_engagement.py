@@ -0,0 +1,63 @@
+# app/scripts/bench_engagement.py
+"""
+Benchmark for app.engagement: scores synthetic per-post metrics and reports timings as JSON.
+
+    cd backend
+    python -m app.scripts.bench_engagement --accounts 50 --posts 5000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.engagement import EngagementFrame, score
+
+
+def synthetic_frame(accounts: int, posts: int, seed: int = 0) -> EngagementFrame:
+    rng = np.random.default_rng(seed)
+    n = accounts * posts
+    account = np.repeat(np.arange(accounts, dtype=np.int64), posts)
+    is_youtube = (account % 2) == 0
+    followers = rng.integers(1_000, 1_000_000, accounts).astype(np.float64)[account]
+    views = np.where(is_youtube, rng.integers(100, 500_000, n), np.nan).astype(np.float64)
+    audience = np.where(is_youtube, views, followers)
+    likes = np.floor(audience * rng.uniform(0.001, 0.08, n))
+    comments = np.floor(likes * rng.uniform(0.01, 0.2, n))
+    return EngagementFrame(
+        account_keys=[f"acct-{i}" for i in range(accounts)],
+        account=account,
+        post_ids=list(range(n)),
+        platform=["youtube" if y else "instagram" for y in is_youtube],
+        likes=likes, comments=comments, views=views, followers=followers,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Engagement normalization benchmark")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=5000, help="posts per account")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    frame = synthetic_frame(args.accounts, args.posts)
+    score(frame)  # warm-up
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        score(frame)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(json.dumps({
+        "accounts": args.accounts,
+        "posts_per_account": args.posts,
+        "posts_total": len(frame),
+        "score_ms_best": round(best * 1000, 2),
+        "score_ms_median": round(sorted(timings)[len(timings) // 2] * 1000, 2),
+        "ms_per_account": round(best * 1000 / args.accounts, 3),
+        "posts_per_sec": int(len(frame) / best),
+    }))
+
+
+if __name__ == "__main__":
+    main()
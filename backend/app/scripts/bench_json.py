@@ -0,0 +1,187 @@
+# app/scripts/bench_json.py
+"""
+Serialization time and bytes on the wire for large listing responses.
+
+    cd backend
+    python -m app.scripts.bench_json --sizes 1000,5000,10000
+
+For --sizes items shaped like /posts/history rows (UUIDs, timestamps, the jsonb metadata column),
+/schedule rows and /youtube/analytics videos.list items, it times:
+
+- stdlib: jsonable_encoder + json.dumps, FastAPI's default JSONResponse path before
+- orjson_encoded: jsonable_encoder + orjson, what a plain `return {...}` costs with
+  FastJSONResponse as the default response class
+- orjson_direct: `return FastJSONResponse({...})`, as the listing endpoints now do
+
+and the response size identity / gzip / brotli (when installed) with the time to compress. "same"
+says whether orjson_direct decodes to exactly the same JSON as the stdlib path. The "wire"
+section sends real requests through CompressionMiddleware (in process, no network).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import httpx
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import compression
+from app.compression import CompressionMiddleware, compress
+from app.utils.responses import FastJSONResponse
+
+
+def _ts(i: int) -> datetime.datetime:
+    return datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(minutes=7 * i, microseconds=i)
+
+
+def posts(n: int) -> Dict[str, Any]:
+    rows = [{
+        "id": uuid.uuid4(),
+        "platform": "instagram" if i % 2 else "youtube",
+        "platform_post_id": str(1790000000000000 + i),
+        "content": f"Post number {i} about our summer launch #launch #summer — with ünïcode",
+        # jsonb comes back from asyncpg as a JSON string
+        "metadata": json.dumps({"media_url": f"https://cdn.example.com/media/{i}.jpg", "likes": i * 3, "tags": ["a", "b"]}),
+        "created_at": _ts(i),
+    } for i in range(n)]
+    return {"posts": rows, "next_cursor": "MjAyNC0wMS0wMVQwMDowMDowMCswMDowMHw0Mg"}
+
+
+def schedules(n: int) -> Dict[str, Any]:
+    rows = [{
+        "id": uuid.uuid4(),
+        "social_account_id": uuid.uuid4(),
+        "content": f"Scheduled caption {i}",
+        "metadata": json.dumps({"media_url": f"https://cdn.example.com/media/{i}.mp4"}),
+        "scheduled_at": _ts(i),
+        "status": "pending",
+        "created_at": _ts(i - 100),
+    } for i in range(n)]
+    return {"schedules": rows, "next_cursor": None}
+
+
+def videos(n: int) -> Dict[str, Any]:
+    items = [{
+        "kind": "youtube#video",
+        "etag": f"etag-{i}",
+        "id": f"vid{i:08d}",
+        "snippet": {
+            "publishedAt": _ts(i).isoformat().replace("+00:00", "Z"),
+            "channelId": "UC1234567890",
+            "title": f"Video {i}",
+            "description": "A longer description of the video that repeats across uploads. " * 3,
+            "thumbnails": {k: {"url": f"https://i.ytimg.com/vi/vid{i:08d}/{k}.jpg", "width": w, "height": h}
+                           for k, w, h in (("default", 120, 90), ("medium", 320, 180), ("high", 480, 360))},
+            "tags": ["launch", "summer", "product"],
+        },
+        "statistics": {"viewCount": str(i * 17), "likeCount": str(i), "commentCount": str(i % 13)},
+    } for i in range(n)]
+    return {"videos": items}
+
+
+SHAPES: Dict[str, Callable[[int], Dict[str, Any]]] = {"posts": posts, "schedules": schedules, "videos": videos}
+
+
+def _stdlib(payload) -> bytes:
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def _orjson_encoded(payload) -> bytes:
+    return FastJSONResponse(jsonable_encoder(payload)).body
+
+
+def _orjson_direct(payload) -> bytes:
+    return FastJSONResponse(payload).body
+
+
+SERIALIZERS = {"stdlib": _stdlib, "orjson_encoded": _orjson_encoded, "orjson_direct": _orjson_direct}
+
+
+def _time_ms(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return round(statistics.median(runs) * 1000, 2)
+
+
+def measure(shape: str, n: int, repeat: int) -> Dict[str, Any]:
+    payload = SHAPES[shape](n)
+    out: Dict[str, Any] = {"shape": shape, "items": n, "serialize_ms": {}}
+    for name, fn in SERIALIZERS.items():
+        out["serialize_ms"][name] = _time_ms(lambda: fn(payload), repeat)
+    body = _orjson_direct(payload)
+    out["same"] = json.loads(body) == json.loads(_stdlib(payload))
+    sizes = {"identity": len(body)}
+    compress_ms = {}
+    for encoding in (["br"] if compression._HAS_BROTLI else []) + ["gzip"]:
+        sizes[encoding] = len(compress(encoding, body))
+        compress_ms[encoding] = _time_ms(lambda: compress(encoding, body), repeat)
+    out["bytes"] = sizes
+    out["compress_ms"] = compress_ms
+    return out
+
+
+def _wire_app(payload) -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/direct")
+    async def direct():
+        return FastJSONResponse(payload)
+
+    @app.get("/encoded")
+    async def encoded():
+        return payload
+
+    return app
+
+
+async def wire(shape: str, n: int, repeat: int) -> List[Dict[str, Any]]:
+    app = _wire_app(SHAPES[shape](n))
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for path in ("/encoded", "/direct"):
+            for accept in ("identity", "gzip", "br, gzip"):
+                runs = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    r = await client.get(path, headers={"Accept-Encoding": accept})
+                    runs.append(time.perf_counter() - started)
+                results.append({
+                    "path": path, "accept_encoding": accept,
+                    "content_encoding": r.headers.get("content-encoding", "identity"),
+                    "wire_bytes": int(r.headers["content-length"]),
+                    "ms": round(statistics.median(runs) * 1000, 2),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON serialization and compression of large listing responses")
+    parser.add_argument("--sizes", default="1000,5000,10000")
+    parser.add_argument("--shapes", default=",".join(SHAPES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--wire-items", type=int, default=5000, help="items per response for the wire section (0 skips it)")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "brotli": compression._HAS_BROTLI,
+        "gzip_level": compression.COMPRESS_GZIP_LEVEL,
+        "brotli_quality": compression.COMPRESS_BROTLI_QUALITY,
+        "results": [measure(shape, int(n), args.repeat) for shape in args.shapes.split(",") for n in args.sizes.split(",")],
+    }
+    if args.wire_items:
+        report["wire"] = {"shape": "posts", "items": args.wire_items, "requests": asyncio.run(wire("posts", args.wire_items, args.repeat))}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+# app/scripts/bench_load.py
+"""
+Offline load test: runs the app against local Postgres with every external service stubbed
+(app.scripts.bench_stubs) and reports throughput and latency percentiles as JSON.
+
+    cd backend
+    DATABASE_URL=postgresql://postgres@127.0.0.1:5432/dev python -m app.scripts.bench_load \\
+        --concurrency 16 --duration 10 --out bench.json
+    # later, fail (exit 1) when a scenario got >20% slower or lost >20% throughput:
+    python -m app.scripts.bench_load --baseline bench.json --max-regression 0.2
+
+Scenarios (--scenarios, comma separated):
+- ai_generate         POST /ai/generate (OpenAI stub, Gemini failover on errors)
+- publish_now         POST /posts/publish-now, alternating Instagram and YouTube accounts
+- schedule_create     POST /schedule (Instagram posts also queue media download + image prep)
+- schedule_list       GET /schedule
+- analytics_overview  GET /analytics/overview (YouTube + Graph API stubs; see ANALYTICS_CACHE_TTL)
+- publisher_tick      seeds --tick-batch due posts, then runs one publisher tick; ticks run one at
+                      a time like the scheduled job, so its concurrency is always 1
+
+Each HTTP scenario runs --concurrency workers for --duration seconds after --warmup requests.
+Stub latency / error rates come from --latency-ms, --jitter-ms, --error-rate or the
+BENCH_STUB_* env (see bench_stubs). Any other app setting (pool sizes, cache TTLs, ...) is taken
+from the environment as usual. Seeded bench users are removed before and after the run.
+Needs DATABASE_URL, SUPABASE_JWT_SECRET and FERNET_KEY, like the app itself.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import jwt
+
+BENCH_NAMESPACE = uuid.UUID("6f0c3a52-6a7e-4a8e-9a57-bb0e5c0d8b43")
+SCENARIOS = ["ai_generate", "publish_now", "schedule_create", "schedule_list", "analytics_overview", "publisher_tick"]
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def bench_user_ids(n: int) -> List[str]:
+    return [str(uuid.uuid5(BENCH_NAMESPACE, f"user-{i}")) for i in range(n)]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    n = len(sorted_values)
+    # q * n first: q / 100 * n picks up float error (7 / 100 * 100 = 7.000000000000001)
+    rank = min(max(math.ceil(q * n / 100), 1), n)
+    return sorted_values[rank - 1]
+
+
+def summarize(name: str, latencies: List[float], statuses: Dict[str, int], elapsed: float, concurrency: int) -> Dict[str, Any]:
+    lat = sorted(latencies)
+    ok = sum(n for code, n in statuses.items() if code.startswith("2"))
+
+    def ms(v):
+        return round(v * 1000, 2) if v is not None else None
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(lat),
+        "errors": len(lat) - ok,
+        "error_rate": round((len(lat) - ok) / len(lat), 4) if lat else None,
+        "statuses": dict(sorted(statuses.items())),
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(lat) / elapsed, 2) if elapsed else None,
+        "p50_ms": ms(percentile(lat, 50)),
+        "p95_ms": ms(percentile(lat, 95)),
+        "p99_ms": ms(percentile(lat, 99)),
+        "max_ms": ms(lat[-1] if lat else None),
+        "mean_ms": ms(sum(lat) / len(lat) if lat else None),
+    }
+
+
+# ---- data ----
+
+async def cleanup(db, user_ids: List[str]):
+    await db.execute("DELETE FROM user_api_keys WHERE user_id = ANY(CAST(:ids AS uuid[]))", values={"ids": user_ids})
+    await db.execute("DELETE FROM auth.users WHERE id = ANY(CAST(:ids AS uuid[]))", values={"ids": user_ids})
+    await db.execute("DELETE FROM user_stats WHERE user_id = ANY(CAST(:ids AS uuid[]))", values={"ids": user_ids})
+
+
+async def seed(db, user_ids: List[str]) -> List[Dict[str, Any]]:
+    """Bench users with stored AI keys and one Instagram + one YouTube account each."""
+    from app.utils.crypto import encrypt
+
+    await cleanup(db, user_ids)
+    await db.execute("INSERT INTO auth.users (id) SELECT unnest(CAST(:ids AS uuid[]))", values={"ids": user_ids})
+    await db.execute(
+        "INSERT INTO user_api_keys (user_id, provider, encrypted_api_key, created_at) "
+        "SELECT u, p, :enc, NOW() FROM unnest(CAST(:ids AS uuid[])) u CROSS JOIN (VALUES ('openai'), ('gemini')) v(p)",
+        values={"ids": user_ids, "enc": encrypt("sk-bench")},
+    )
+    # the Instagram session blob is a dict literal (instagram_api evals it)
+    await db.execute(
+        "INSERT INTO social_accounts (user_id, provider, provider_user_id, access_token, created_at) "
+        "SELECT u, p, md5(u::text || p), CASE p WHEN 'instagram' THEN :ig ELSE :yt END, NOW() "
+        "FROM unnest(CAST(:ids AS uuid[])) u CROSS JOIN (VALUES ('instagram'), ('youtube')) v(p)",
+        values={"ids": user_ids, "ig": encrypt(repr({"uuids": {}, "authorization_data": {}})), "yt": encrypt("ya29.bench")},
+    )
+    rows = await db.fetch_all(
+        "SELECT user_id, provider, id FROM social_accounts WHERE user_id = ANY(CAST(:ids AS uuid[]))", values={"ids": user_ids}
+    )
+    accounts: Dict[str, Dict[str, str]] = {}
+    for r in rows:
+        accounts.setdefault(str(r["user_id"]), {})[r["provider"]] = str(r["id"])
+    secret = os.environ["SUPABASE_JWT_SECRET"]
+    exp = int(time.time()) + 24 * 3600
+    return [
+        {"id": uid, "accounts": accounts[uid],
+         "headers": {"Authorization": "Bearer " + jwt.encode({"sub": uid, "role": "authenticated", "exp": exp}, secret, algorithm="HS256")}}
+        for uid in user_ids
+    ]
+
+
+async def seed_due_posts(db, users: List[Dict[str, Any]], n: int, media_base: str, tick: int):
+    rows = []
+    for i in range(n):
+        user = users[(tick * n + i) % len(users)]
+        provider = "instagram" if i % 2 == 0 else "youtube"
+        ext = "jpg" if provider == "instagram" else "mp4"
+        rows.append((user["id"], user["accounts"][provider], json.dumps({"media_url": f"{media_base}/bench-{i % 10}.{ext}"})))
+    await db.execute(
+        "INSERT INTO scheduled_posts (user_id, social_account_id, content, metadata, scheduled_at, status, created_at) "
+        "SELECT u, a, 'bench tick post', m::jsonb, NOW() - INTERVAL '1 second', 'pending', NOW() "
+        "FROM unnest(CAST(:u AS uuid[]), CAST(:a AS uuid[]), CAST(:m AS text[])) AS r(u, a, m)",
+        values={"u": [r[0] for r in rows], "a": [r[1] for r in rows], "m": [r[2] for r in rows]},
+    )
+
+
+# ---- load ----
+
+def make_request(name: str, users: List[Dict[str, Any]], media_base: str) -> Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]:
+    tomorrow = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).isoformat()
+
+    async def ai_generate(client, i):
+        user = users[i % len(users)]
+        return await client.post("/ai/generate", json={"prompt": f"Write a caption for post {i}"}, headers=user["headers"])
+
+    async def publish_now(client, i):
+        user = users[i % len(users)]
+        if i % 2 == 0:
+            body = {"social_account_id": user["accounts"]["instagram"], "content": f"bench {i}", "media": [f"{media_base}/now-{i % 10}.jpg"]}
+        else:
+            body = {"social_account_id": user["accounts"]["youtube"], "content": f"bench {i}", "media": [f"{media_base}/now-{i % 10}.mp4"]}
+        return await client.post("/posts/publish-now", json=body, headers=user["headers"])
+
+    async def schedule_create(client, i):
+        user = users[i % len(users)]
+        provider = "instagram" if i % 2 == 0 else "youtube"
+        ext = "jpg" if provider == "instagram" else "mp4"
+        body = {"social_account_id": user["accounts"][provider], "content": f"bench scheduled {i}", "scheduled_at": tomorrow,
+                "metadata": {"media_url": f"{media_base}/sched-{i % 10}.{ext}"}}
+        return await client.post("/schedule", json=body, headers=user["headers"])
+
+    async def schedule_list(client, i):
+        return await client.get("/schedule", headers=users[i % len(users)]["headers"])
+
+    async def analytics_overview(client, i):
+        return await client.get("/analytics/overview", headers=users[i % len(users)]["headers"])
+
+    return {
+        "ai_generate": ai_generate,
+        "publish_now": publish_now,
+        "schedule_create": schedule_create,
+        "schedule_list": schedule_list,
+        "analytics_overview": analytics_overview,
+    }[name]
+
+
+async def run_http_scenario(client: httpx.AsyncClient, name: str, request, concurrency: int, duration: float, warmup: int) -> Dict[str, Any]:
+    for i in range(warmup):
+        try:
+            await request(client, i)
+        except httpx.HTTPError:
+            pass
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(warmup, 10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            started = time.perf_counter()
+            try:
+                resp = await request(client, i)
+                code = str(resp.status_code)
+            except httpx.HTTPError as e:
+                code = e.__class__.__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, statuses, time.perf_counter() - started, concurrency)
+
+
+async def run_publisher_ticks(client: httpx.AsyncClient, db, users, ticks: int, batch: int, media_base: str) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    busy = 0.0
+    for tick in range(ticks):
+        await seed_due_posts(db, users, batch, media_base, tick)
+        started = time.perf_counter()
+        resp = await client.post("/__bench/publisher-tick")
+        took = time.perf_counter() - started
+        busy += took
+        latencies.append(took)
+        statuses[str(resp.status_code)] = statuses.get(str(resp.status_code), 0) + 1
+    result = summarize("publisher_tick", latencies, statuses, busy, 1)
+    counts = await db.fetch_all(
+        "SELECT status, COUNT(*) AS n FROM scheduled_posts WHERE content = 'bench tick post' AND user_id = ANY(CAST(:ids AS uuid[])) GROUP BY status",
+        values={"ids": [u["id"] for u in users]},
+    )
+    result["posts"] = {r["status"]: r["n"] for r in counts}
+    result["posts_per_s"] = round(result["posts"].get("published", 0) / busy, 2) if busy else None
+    return result
+
+
+# ---- processes ----
+
+def _spawn(mode: str, port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    # the app logs with print(); keep that out of the report
+    log = open(log_path, "ab")
+    return subprocess.Popen([sys.executable, "-m", "app.scripts.bench_stubs", mode, "--port", str(port)],
+                            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit(f"{url} exited with code {proc.returncode} during startup")
+            try:
+                if (await client.get(url, timeout=1)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not become ready within {timeout}s")
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human readable regressions of `results` against a previous report."""
+    previous = {r["scenario"]: r for r in baseline.get("scenarios", [])}
+    regressions = []
+    for r in results:
+        base = previous.get(r["scenario"])
+        if not base:
+            continue
+        if base.get("p95_ms") and r.get("p95_ms") and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p95 {base['p95_ms']}ms -> {r['p95_ms']}ms")
+        if base.get("rps") and r.get("rps") is not None and r["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: rps {base['rps']} -> {r['rps']}")
+        if (r.get("error_rate") or 0) > (base.get("error_rate") or 0) + 0.01:
+            regressions.append(f"{r['scenario']}: error rate {base.get('error_rate')} -> {r['error_rate']}")
+    return regressions
+
+
+async def _main(args) -> int:
+    from databases import Database
+
+    from app.scripts.bench_stubs import SERVICES, stub_env, stub_settings
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    env = dict(os.environ)
+    for name, value in (("LATENCY_MS", args.latency_ms), ("JITTER_MS", args.jitter_ms), ("ERROR_RATE", args.error_rate)):
+        if value is not None:
+            env[f"BENCH_STUB_{name}"] = str(value)
+    stub_base = f"http://127.0.0.1:{args.stub_port}"
+    env.update(stub_env(stub_base))
+    env.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="bench-media-"))
+    os.environ.update({k: v for k, v in env.items() if k.startswith("BENCH_STUB_")})
+    media_base = f"{stub_base}/media"
+
+    db = Database(os.environ["DATABASE_URL"])
+    await db.connect()
+    user_ids = bench_user_ids(args.users)
+    procs: List[subprocess.Popen] = []
+    results: List[Dict[str, Any]] = []
+    try:
+        users = await seed(db, user_ids)
+        procs.append(_spawn("stubs", args.stub_port, env, args.log))
+        procs.append(_spawn("app", args.port, env, args.log))
+        await _wait_ready(f"{stub_base}/health", procs[0])
+        await _wait_ready(f"http://127.0.0.1:{args.port}/health", procs[1])
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=args.timeout) as client:
+            for name in scenarios:
+                if name == "publisher_tick":
+                    result = await run_publisher_ticks(client, db, users, args.ticks, args.tick_batch, media_base)
+                else:
+                    result = await run_http_scenario(client, name, make_request(name, users, media_base),
+                                                     args.concurrency, args.duration, args.warmup)
+                print(f"{name}: {result['rps']} rps, p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, "
+                      f"p99 {result['p99_ms']}ms, errors {result['errors']}", file=sys.stderr)
+                results.append(result)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if not args.keep_data:
+            await cleanup(db, user_ids)
+        await db.disconnect()
+
+    report = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency, "duration_s": args.duration, "warmup": args.warmup, "users": args.users,
+            "ticks": args.ticks, "tick_batch": args.tick_batch,
+            "stubs": {s: dict(zip(("latency_s", "jitter_s", "error_rate"), stub_settings(s))) for s in SERVICES},
+        },
+        "scenarios": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against stubbed external services")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per HTTP scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each HTTP scenario")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--tick-batch", type=int, default=20, help="due posts seeded before each tick (the publisher takes 20)")
+    parser.add_argument("--latency-ms", type=float, help="stub latency for every service (BENCH_STUB_LATENCY_MS)")
+    parser.add_argument("--jitter-ms", type=float, help="uniform +/- jitter (BENCH_STUB_JITTER_MS)")
+    parser.add_argument("--error-rate", type=float, help="fraction of stub calls that fail (BENCH_STUB_ERROR_RATE)")
+    parser.add_argument("--port", type=int, default=9000, help="app port")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--out", help="also write the JSON report here")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "bench_load.log"), help="app and stub server output")
+    parser.add_argument("--baseline", help="previous report; exit 1 on regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 / rps change vs the baseline")
+    parser.add_argument("--keep-data", action="store_true", help="leave the bench users and their posts in the database")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# app/scripts/bench_logging.py
+"""
+Caller-side cost of one log line: print() vs a synchronous logging handler vs app.log's queue logger.
+
+    cd backend
+    python -m app.scripts.bench_logging --calls 50000
+    python -m app.scripts.bench_logging --calls 2000 --sink-latency-ms 1   # stdout that blocks (full pipe, slow collector)
+
+- print: print(..., flush=True), i.e. stdout with PYTHONUNBUFFERED=1 or a tty, as in our containers
+- sync: stdlib StreamHandler with the same JSON formatter, written in the calling thread
+- queue: app.log (QueueHandler + writer thread); "drain_s" is how long the writer needed afterwards
+- queue_disabled: a DEBUG line while LOG_LEVEL=INFO
+- queue_sampled: a DEBUG line with extra={"sample": 0.01}
+
+The caller-side time is what the event loop pays. "overhead_at_rate" multiplies it by
+--rps x --lines-per-request: the fraction of one core spent logging at that request rate.
+"""
+import argparse
+import io
+import json
+import logging
+import time
+
+from app.log import JsonFormatter, configure_logging, flush_logging, get_logger
+from app.metrics import log_records_dropped
+
+EXTRA = {"provider": "openai", "operation": "chat", "role": "primary"}
+
+
+class Sink(io.TextIOBase):
+    """Discards output, optionally sleeping on every write like a blocked pipe would."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lines = 0
+
+    def write(self, s):
+        if self.latency:
+            time.sleep(self.latency)
+        self.lines += s.count("\n")
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+def _per_call(calls: int, fn) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - started) / calls
+
+
+def _dropped() -> float:
+    return log_records_dropped._value.get()
+
+
+def run(calls: int, latency: float):
+    results = {}
+
+    sink = Sink(latency)
+    results["print"] = {"us_per_call": _per_call(calls, lambda i: print(f"Adapter: Attempting OpenAI (Primary)... {i}", file=sink, flush=True))}
+
+    sink = Sink(latency)
+    sync = logging.getLogger("bench.sync")
+    sync.propagate = False
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter())
+    sync.addHandler(handler)
+    sync.setLevel(logging.INFO)
+    results["sync"] = {"us_per_call": _per_call(calls, lambda i: sync.info("ai attempt %d", i, extra=EXTRA))}
+
+    for name, level, call in (
+        ("queue", "INFO", lambda log, i: log.info("ai attempt %d", i, extra=EXTRA)),
+        ("queue_disabled", "INFO", lambda log, i: log.debug("ai attempt %d", i, extra=EXTRA)),
+        ("queue_sampled", "DEBUG", lambda log, i: log.debug("ai attempt %d", i, extra={**EXTRA, "sample": 0.01})),
+    ):
+        sink = Sink(latency)
+        configure_logging(stream=sink, level=level, fmt="json", force=True)
+        log = get_logger("app.bench")
+        dropped = _dropped()
+        per_call = _per_call(calls, lambda i: call(log, i))
+        started = time.perf_counter()
+        flush_logging()
+        results[name] = {
+            "us_per_call": per_call,
+            "drain_s": round(time.perf_counter() - started, 3),
+            "written": sink.lines,
+            "dropped": int(_dropped() - dropped),
+        }
+    for r in results.values():
+        r["us_per_call"] = round(r["us_per_call"] * 1e6, 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call cost of print vs sync logging vs the queue logger")
+    parser.add_argument("--calls", type=int, default=50000)
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0, help="delay of every write to the output")
+    parser.add_argument("--rps", type=float, default=50, help="request rate to express the overhead at")
+    parser.add_argument("--lines-per-request", type=float, default=4)
+    args = parser.parse_args()
+
+    results = run(args.calls, args.sink_latency_ms / 1000)
+    lines_per_s = args.rps * args.lines_per_request
+    for r in results.values():
+        r["overhead_at_rate"] = round(r["us_per_call"] * lines_per_s / 1e6, 5)
+    print(json.dumps({
+        "calls": args.calls,
+        "sink_latency_ms": args.sink_latency_ms,
+        "rps": args.rps,
+        "lines_per_request": args.lines_per_request,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# app/scripts/bench_startup.py
+"""
+Startup benchmark: import time and resident memory of app.main in fresh interpreters.
+
+- eager: every provider SDK imported up front (how app.main used to load)
+- lazy:  app.main as it loads now; SDKs are imported on first use (app.providers)
+- first use: per provider, the extra time / RSS a lazy worker pays when it first needs the SDK
+
+    cd backend
+    python -m app.scripts.bench_startup --runs 5
+
+Needs the same env as the app (DATABASE_URL, SUPABASE_JWT_SECRET, FERNET_KEY); nothing connects.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from app.providers import PROVIDER_SDKS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# runs in a fresh interpreter; prints one JSON line
+_PROBE = r"""
+import importlib, json, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+preload, touch = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+base = rss_mb()
+started = time.perf_counter()
+for m in preload:
+    importlib.import_module(m)
+import app.main
+result = {"import_s": time.perf_counter() - started, "rss_mb": rss_mb(), "rss_delta_mb": rss_mb() - base}
+if touch:
+    started = time.perf_counter()
+    for m in touch:
+        importlib.import_module(m)
+    result["touch_s"] = time.perf_counter() - started
+    result["touch_rss_mb"] = rss_mb() - result["rss_mb"]
+print(json.dumps(result))
+"""
+
+
+def probe(preload, touch=()) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, json.dumps(list(preload)), json.dumps(list(touch))],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs, key):
+    return round(statistics.median(r[key] for r in runs), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time / RSS of app.main with eager vs lazy provider SDKs")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    all_sdks = [m for modules in PROVIDER_SDKS.values() for m in modules]
+    eager = [probe(all_sdks) for _ in range(args.runs)]
+    lazy = [probe(()) for _ in range(args.runs)]
+    first_use = {}
+    for provider, modules in PROVIDER_SDKS.items():
+        if not modules:
+            continue
+        runs = [probe((), modules) for _ in range(args.runs)]
+        first_use[provider] = {"import_s": median_of(runs, "touch_s"), "rss_mb": round(median_of(runs, "touch_rss_mb"), 1)}
+
+    report = {
+        "runs": args.runs,
+        "eager": {"import_s": median_of(eager, "import_s"), "rss_mb": round(median_of(eager, "rss_mb"), 1)},
+        "lazy": {"import_s": median_of(lazy, "import_s"), "rss_mb": round(median_of(lazy, "rss_mb"), 1)},
+        "first_use": first_use,
+    }
+    report["saved"] = {
+        "import_s": round(report["eager"]["import_s"] - report["lazy"]["import_s"], 4),
+        "rss_mb": round(report["eager"]["rss_mb"] - report["lazy"]["rss_mb"], 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# app/scripts/bench_stubs.py
+"""
+Local stand-ins for every external service, used by app.scripts.bench_load.
+
+Two processes are started from here:
+
+    python -m app.scripts.bench_stubs stubs --port 9100   # HTTP stubs
+    python -m app.scripts.bench_stubs app --port 9000     # the real app with SDK fakes
+
+- `stubs` serves OpenAI (/openai/v1/...), Gemini (/gemini/v1beta/models/...), YouTube Data
+  (/youtube/v3/channels), Graph API (/graph/v18.0/<id>) and downloadable media (/media/<name>).
+  The app reaches them through OPENAI_BASE_URL, GEMINI_BASE_URL, YOUTUBE_CHANNELS_URL and
+  GRAPH_API_URL.
+- `app` runs app.main with instagrapi's Client and the YouTube resumable upload replaced by fakes
+  (neither SDK lets us point it at a plain-HTTP endpoint). The fakes block their calling thread
+  exactly like the real SDK calls do. The APScheduler jobs are paused; the harness triggers
+  publisher ticks through POST /__bench/publisher-tick instead.
+
+Latency and failures are configured per service through env (defaults in brackets):
+BENCH_STUB_LATENCY_MS [50], BENCH_STUB_JITTER_MS [20], BENCH_STUB_ERROR_RATE [0] and per-service
+overrides such as BENCH_STUB_OPENAI_LATENCY_MS or BENCH_STUB_INSTAGRAPI_ERROR_RATE (services:
+openai, gemini, youtube, graph, instagrapi, youtube_upload, media).
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import time
+import uuid
+from typing import Tuple
+
+SERVICES = ("openai", "gemini", "youtube", "graph", "instagrapi", "youtube_upload", "media")
+MEDIA_BYTES = int(os.getenv("BENCH_STUB_MEDIA_BYTES", str(256 * 1024)))
+
+
+def stub_settings(service: str) -> Tuple[float, float, float]:
+    """(latency s, jitter s, error rate) for one stubbed service."""
+    def _get(name, default):
+        return float(os.getenv(f"BENCH_STUB_{service.upper()}_{name}", os.getenv(f"BENCH_STUB_{name}", default)))
+    return _get("LATENCY_MS", "50") / 1000, _get("JITTER_MS", "20") / 1000, _get("ERROR_RATE", "0")
+
+
+def _delay(service: str) -> Tuple[float, bool]:
+    latency, jitter, error_rate = stub_settings(service)
+    return max(0.0, latency + random.uniform(-jitter, jitter)), random.random() < error_rate
+
+
+class StubServiceError(RuntimeError):
+    pass
+
+
+# ---- HTTP stubs ----
+
+def build_stub_app():
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+
+    async def simulate(service: str):
+        delay, fail = _delay(service)
+        await asyncio.sleep(delay)
+        if fail:
+            return JSONResponse({"error": {"message": f"{service} stub error", "code": 503}}, status_code=503)
+        return None
+
+    async def health(request):
+        return JSONResponse({"ok": True})
+
+    async def openai_chat(request):
+        body = await request.json()
+        err = await simulate("openai")
+        if err is not None:
+            return err
+        prompt = body["messages"][-1]["content"]
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"[stub] {prompt[:200]}"}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 50, "total_tokens": len(prompt) // 4 + 50},
+        })
+
+    async def openai_embeddings(request):
+        err = await simulate("openai")
+        if err is not None:
+            return err
+        return JSONResponse({"object": "list", "data": [{"object": "embedding", "index": 0, "embedding": [0.01] * 1536}]})
+
+    async def gemini(request):
+        action = request.path_params["model_action"].rsplit(":", 1)[-1]
+        body = await request.json()
+        err = await simulate("gemini")
+        if err is not None:
+            return err
+        if action == "embedContent":
+            return JSONResponse({"embedding": {"values": [0.01] * 768}})
+        parts = (body.get("contents") or [{}])[-1].get("parts") or [{}]
+        prompt = parts[-1].get("text", "")
+        return JSONResponse({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": f"[stub] {prompt[:200]}"}]},
+                            "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": 50},
+        })
+
+    async def youtube_channels(request):
+        err = await simulate("youtube")
+        if err is not None:
+            return err
+        channel = request.query_params.get("id", "")
+        etag = f'"{channel[:16]}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304)
+        return JSONResponse({"items": [{
+            "id": channel,
+            "snippet": {"title": f"channel {channel[:8]}"},
+            "statistics": {"viewCount": "120000", "subscriberCount": "3400", "videoCount": "87"},
+        }]}, headers={"ETag": etag})
+
+    async def graph_profile(request):
+        err = await simulate("graph")
+        if err is not None:
+            return err
+        uid = request.path_params["object_id"]
+        return JSONResponse({"id": uid, "username": f"user_{uid[:8]}", "followers_count": 5400, "media_count": 210})
+
+    jpeg = _sample_jpeg()
+    blob = os.urandom(MEDIA_BYTES)
+
+    async def media(request):
+        err = await simulate("media")
+        if err is not None:
+            return err
+        name = request.path_params["name"]
+        if name.lower().endswith((".jpg", ".jpeg")):
+            return Response(jpeg, media_type="image/jpeg")
+        return Response(blob, media_type="application/octet-stream")
+
+    return Starlette(routes=[
+        Route("/health", health),
+        Route("/openai/v1/chat/completions", openai_chat, methods=["POST"]),
+        Route("/openai/v1/embeddings", openai_embeddings, methods=["POST"]),
+        Route("/gemini/{version}/models/{model_action}", gemini, methods=["POST"]),
+        Route("/youtube/v3/channels", youtube_channels),
+        Route("/graph/{version}/{object_id}", graph_profile),
+        Route("/media/{name}", media),
+    ])
+
+
+def _sample_jpeg() -> bytes:
+    # a camera-sized landscape photo, so Instagram image prep has real work to do
+    try:
+        from PIL import Image
+    except ImportError:
+        return os.urandom(MEDIA_BYTES)
+    im = Image.linear_gradient("L").resize((2400, 1200)).convert("RGB")
+    out = io.BytesIO()
+    im.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def stub_env(base_url: str) -> dict:
+    """Env that points the app at a stub server running at `base_url`."""
+    base_url = base_url.rstrip("/")
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "GEMINI_BASE_URL": f"{base_url}/gemini/",
+        "YOUTUBE_CHANNELS_URL": f"{base_url}/youtube/v3/channels",
+        "GRAPH_API_URL": f"{base_url}/graph/v18.0",
+    }
+
+
+# ---- SDK fakes (installed inside the app process) ----
+
+def _blocking_call(service: str):
+    delay, fail = _delay(service)
+    time.sleep(delay)
+    if fail:
+        raise StubServiceError(f"{service} stub error")
+
+
+class FakeInstagrapiClient:
+    """The subset of instagrapi.Client the app uses."""
+
+    def set_settings_dict(self, settings):
+        self.settings = settings
+
+    def login_by_session(self, settings):
+        _blocking_call("instagrapi")
+
+    def relogin(self):
+        _blocking_call("instagrapi")
+
+    def photo_upload(self, path, caption=""):
+        _blocking_call("instagrapi")
+        return f"bench_{uuid.uuid4().hex[:16]}"
+
+    def photo_upload_url(self, url, caption=""):
+        _blocking_call("instagrapi")
+        return f"bench_{uuid.uuid4().hex[:16]}"
+
+
+def fake_youtube_upload(row, path, title, description=""):
+    _blocking_call("youtube_upload")
+    return {"id": f"bench_{uuid.uuid4().hex[:11]}", "snippet": {"title": title}}
+
+
+def install_sdk_fakes():
+    from app.instagram import client as ig_client
+    from app.youtube import youtube_upload
+
+    ig_client.new_client = FakeInstagrapiClient
+    youtube_upload._upload_file = fake_youtube_upload
+
+
+def build_bench_app():
+    install_sdk_fakes()
+    from app.main import app, run_scheduled_publisher, scheduler
+
+    @app.on_event("startup")
+    async def _pause_jobs():
+        # ticks are driven by the harness so they can be timed and don't race the other scenarios
+        scheduler.pause()
+
+    @app.post("/__bench/publisher-tick", include_in_schema=False)
+    async def _publisher_tick():
+        started = time.perf_counter()
+        await run_scheduled_publisher()
+        return {"seconds": time.perf_counter() - started}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stand-ins for external services")
+    parser.add_argument("mode", choices=["stubs", "app"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    target = build_stub_app() if args.mode == "stubs" else build_bench_app()
+    uvicorn.run(target, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# app/scripts/check_engagement.py
+"""
+Check that a connected YouTube account actually produces engagement rows.
+
+Seeds a throwaway user with a YouTube account stored the way the OAuth callback stores it (access
+token encrypted with the shared keyring), stubs the googleapiclient service with three canned
+uploads and runs app.engagement.load_user_post_metrics. Fails (exit code 1) unless:
+
+- three YouTube records come back and "errors" is empty
+- the credentials handed to googleapiclient carry the decrypted token, not the ciphertext
+
+The seeded rows are deleted afterwards. Manual / CI check, needs DATABASE_URL with the migrations applied:
+
+    cd backend
+    python -m app.scripts.check_engagement
+"""
+import asyncio
+import json
+import sys
+import uuid
+from typing import Any, Dict, List
+
+ACCESS_TOKEN = "ya29.check-engagement"
+VIDEOS = [{"id": f"vid{i}", "statistics": {"viewCount": str(1000 * i), "likeCount": str(10 * i), "commentCount": str(i)}} for i in (1, 2, 3)]
+
+
+class _Call:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        return self._result
+
+
+class FakeYouTubeService:
+    """Just enough of the youtube v3 service for youtube_api._fetch_upload_stats."""
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def channels(self):
+        return self
+
+    def playlistItems(self):
+        return self
+
+    def videos(self):
+        return self
+
+    def list(self, part, **kwargs):
+        if "mine" in kwargs:
+            return _Call({"items": [{"contentDetails": {"relatedPlaylists": {"uploads": "UU-check"}}}]})
+        if "playlistId" in kwargs:
+            return _Call({"items": [{"contentDetails": {"videoId": v["id"]}} for v in VIDEOS]})
+        return _Call({"items": VIDEOS})
+
+
+async def run() -> Dict[str, Any]:
+    from app.db import db
+    from app.engagement import load_user_post_metrics
+    from app.providers import lazy_import
+    from app.utils.crypto import encrypt
+
+    tokens: List[str] = []
+    discovery = lazy_import("googleapiclient.discovery")
+    original_build = discovery.build
+
+    def fake_build(service, version, credentials=None, **kwargs):
+        tokens.append(credentials.token)
+        return FakeYouTubeService(credentials)
+
+    user_id = str(uuid.uuid4())
+    await db.connect()
+    discovery.build = fake_build
+    try:
+        await db.execute("INSERT INTO auth.users (id) VALUES (:uid)", values={"uid": user_id})
+        await db.execute(
+            "INSERT INTO social_accounts (user_id, provider, provider_user_id, access_token, refresh_token, created_at) "
+            "VALUES (:uid, 'youtube', 'UC-check', :at, 'refresh-check', NOW())",
+            values={"uid": user_id, "at": encrypt(ACCESS_TOKEN)},
+        )
+        result = await load_user_post_metrics(user_id)
+    finally:
+        discovery.build = original_build
+        await db.execute("DELETE FROM social_accounts WHERE user_id = :uid", values={"uid": user_id})
+        await db.execute("DELETE FROM user_stats WHERE user_id = :uid", values={"uid": user_id})
+        await db.execute("DELETE FROM auth.users WHERE id = :uid", values={"uid": user_id})
+        await db.disconnect()
+
+    youtube = [r for r in result["records"] if r["platform"] == "youtube"]
+    failures = []
+    if len(youtube) != len(VIDEOS):
+        failures.append(f"expected {len(VIDEOS)} youtube records, got {len(youtube)}")
+    if result["errors"]:
+        failures.append(f"errors: {result['errors']}")
+    if tokens != [ACCESS_TOKEN]:
+        failures.append(f"credentials carried {tokens!r} instead of the decrypted token")
+    return {"youtube_records": len(youtube), "errors": result["errors"], "failures": failures}
+
+
+def main():
+    report = asyncio.run(run())
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# app/scripts/check_query_plans.py
+"""
+Query-plan regression check for the hot queries.
+
+Runs EXPLAIN on every query in HOT_QUERIES and fails (exit code 1) if any of them plans a
+sequential scan on one of the app's tables. With --seed, a realistic data set is generated first
+inside a transaction (ANALYZE included) that is rolled back at the end, so the check can run
+against a fresh local Postgres with the v1 + v2 migrations applied and leaves nothing behind:
+
+    cd backend
+    DATABASE_URL=postgresql://postgres@127.0.0.1:5432/dev python -m app.scripts.check_query_plans --seed
+
+Manual / CI check: the repo has no test suite, so nothing runs this automatically. Run it
+before merging a change to a hot query or an index, or as a CI step with a Postgres service and
+DATABASE_URL set; without DATABASE_URL it has nothing to connect to.
+
+Add a query here whenever a new endpoint or job gets a query that runs per request or per tick.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List
+
+# (name, sql); :uid / :pid / :ts / :pkey / :aid are filled from a sampled row of existing data
+HOT_QUERIES = [
+    ("publisher_due",
+     "SELECT id, user_id, social_account_id, content, metadata FROM scheduled_posts "
+     "WHERE status = 'pending' AND scheduled_at <= now() ORDER BY scheduled_at LIMIT 20"),
+    ("posts_get",
+     "SELECT * FROM posts WHERE user_id = :uid AND platform = 'youtube' AND platform_post_id = :pid LIMIT 1"),
+    ("posts_history",
+     "SELECT id, platform, platform_post_id, content, metadata, created_at FROM posts "
+     "WHERE user_id = :uid ORDER BY created_at DESC, id DESC LIMIT 50"),
+    ("posts_history_page",
+     "SELECT id, platform, platform_post_id, content, metadata, created_at FROM posts "
+     "WHERE user_id = :uid AND (created_at, id) < (:ts, CAST(:pkey AS uuid)) ORDER BY created_at DESC, id DESC LIMIT 50"),
+    ("schedule_list",
+     "SELECT id, social_account_id, content, metadata, scheduled_at, status, created_at FROM scheduled_posts "
+     "WHERE user_id = :uid ORDER BY scheduled_at, id LIMIT 100"),
+    ("schedule_list_page",
+     "SELECT id, social_account_id, content, metadata, scheduled_at, status, created_at FROM scheduled_posts "
+     "WHERE user_id = :uid AND (scheduled_at, id) > (:ts, CAST(:pkey AS uuid)) ORDER BY scheduled_at, id LIMIT 100"),
+    ("me_stats",
+     "SELECT posts_total, scheduled_pending, connected_accounts, ai_keys FROM user_stats WHERE user_id = :uid"),
+    ("social_accounts_user",
+     "SELECT id, provider, provider_user_id, scopes, expires_at, created_at FROM social_accounts WHERE user_id = :uid"),
+    ("social_account_by_id",
+     "SELECT * FROM social_accounts WHERE id = :aid"),
+    ("instagram_accounts_page",
+     "SELECT id, user_id FROM social_accounts WHERE provider = 'instagram' AND id > :aid ORDER BY id LIMIT 200"),
+    ("instagram_media_list",
+     "SELECT media_pk, media_type, caption, like_count, comment_count, taken_at FROM instagram_media "
+     "WHERE user_id = :uid ORDER BY taken_at DESC, media_pk DESC LIMIT 50"),
+    ("analytics_series",
+     "SELECT social_account_id, provider, bucket_start, followers_last FROM analytics_rollups "
+     "WHERE user_id = :uid AND granularity = 'day' AND bucket_start >= now() - interval '90 days' AND bucket_start < now() "
+     "ORDER BY social_account_id, bucket_start"),
+]
+
+SEED_SQL = [
+    "INSERT INTO auth.users (id) SELECT gen_random_uuid() FROM generate_series(1, :users)",
+    "CREATE TEMP TABLE seed_users ON COMMIT DROP AS SELECT id FROM auth.users ORDER BY id DESC LIMIT :users",
+    "INSERT INTO social_accounts (user_id, provider, provider_user_id) "
+    "SELECT u.id, p, md5(u.id::text || p) FROM seed_users u CROSS JOIN (VALUES ('youtube'), ('instagram')) v(p) "
+    "ON CONFLICT DO NOTHING",
+    "INSERT INTO posts (user_id, platform, platform_post_id, content, created_at) "
+    "SELECT u.id, CASE WHEN g % 2 = 0 THEN 'youtube' ELSE 'instagram' END, md5(u.id::text || g), 'seed', "
+    "now() - g * interval '37 minutes' FROM seed_users u CROSS JOIN generate_series(1, :posts) g",
+    "INSERT INTO scheduled_posts (user_id, social_account_id, content, scheduled_at, status) "
+    "SELECT a.user_id, a.id, 'seed', now() + (g - :scheduled / 2) * interval '1 hour', "
+    "CASE WHEN g % 20 = 0 THEN 'pending' WHEN g % 7 = 0 THEN 'failed' ELSE 'published' END "
+    "FROM social_accounts a JOIN seed_users u ON u.id = a.user_id CROSS JOIN generate_series(1, :scheduled) g "
+    "WHERE a.provider = 'youtube'",
+    "INSERT INTO instagram_media (social_account_id, user_id, media_pk, media_type, like_count, comment_count, taken_at) "
+    "SELECT a.id, a.user_id, g::text, 1, g, g, now() - g * interval '1 day' "
+    "FROM social_accounts a JOIN seed_users u ON u.id = a.user_id CROSS JOIN generate_series(1, :posts) g "
+    "WHERE a.provider = 'instagram'",
+    "INSERT INTO analytics_rollups (social_account_id, granularity, bucket_start, user_id, provider, samples, followers_last) "
+    "SELECT a.id, gr, date_trunc(gr, now() - g * interval '1 day'), a.user_id, a.provider, 1, g "
+    "FROM social_accounts a JOIN seed_users u ON u.id = a.user_id CROSS JOIN generate_series(1, 120) g "
+    "CROSS JOIN (VALUES ('day'), ('week')) v(gr) ON CONFLICT DO NOTHING",
+    "ANALYZE",
+]
+
+# tables whose sequential scans mean a missing or unusable index
+CHECKED_TABLES = {"posts", "scheduled_posts", "social_accounts", "user_stats", "instagram_media",
+                  "analytics_rollups", "analytics_snapshots", "user_api_keys"}
+
+
+def seq_scans(plan: Dict[str, Any]) -> List[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def _sample_params(db) -> Dict[str, Any]:
+    row = await db.fetch_one(
+        "SELECT p.user_id, p.platform_post_id, p.created_at, p.id, a.id AS aid FROM posts p "
+        "JOIN social_accounts a ON a.user_id = p.user_id WHERE p.platform = 'youtube' "
+        "ORDER BY p.created_at DESC LIMIT 1 OFFSET 10"
+    )
+    if not row:
+        raise SystemExit("no data to explain against; run with --seed")
+    return {"uid": row["user_id"], "pid": row["platform_post_id"], "ts": row["created_at"],
+            "pkey": str(row["id"]), "aid": row["aid"]}
+
+
+async def check(db, verbose: bool = False) -> List[Dict[str, Any]]:
+    params = await _sample_params(db)
+    results = []
+    for name, sql in HOT_QUERIES:
+        values = {k: v for k, v in params.items() if f":{k}" in sql}
+        raw = await db.fetch_val("EXPLAIN (FORMAT JSON) " + sql, values=values)
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+        result = {"query": name, "seq_scans": seq_scans(plan), "total_cost": plan.get("Total Cost")}
+        if verbose:
+            result["plan"] = plan
+        results.append(result)
+    return results
+
+
+async def _main(args) -> int:
+    from app.db import db
+
+    await db.connect()
+    tx = None
+    try:
+        if args.seed:
+            tx = await db.transaction()
+            seed_values = {"users": args.users, "posts": args.posts, "scheduled": args.scheduled}
+            for sql in SEED_SQL:
+                await db.execute(sql, values={k: v for k, v in seed_values.items() if f":{k}" in sql})
+        results = await check(db, verbose=args.verbose)
+    finally:
+        if tx is not None:
+            await tx.rollback()
+        await db.disconnect()
+
+    failed = [r for r in results if r["seq_scans"]]
+    for r in results:
+        status = "SEQ SCAN on " + ", ".join(r["seq_scans"]) if r["seq_scans"] else "ok"
+        print(f"{r['query']:<26} {status}")
+        if args.verbose:
+            print(json.dumps(r["plan"], indent=2, default=str))
+    print(f"{len(results) - len(failed)}/{len(results)} hot queries use indexes")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a hot query plans a sequential scan")
+    parser.add_argument("--seed", action="store_true", help="generate data in a rolled-back transaction first (local databases only)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--posts", type=int, default=40, help="posts and instagram media per user")
+    parser.add_argument("--scheduled", type=int, default=20, help="scheduled posts per user")
+    parser.add_argument("--verbose", action="store_true", help="print full plans")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
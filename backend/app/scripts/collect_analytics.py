@@ -0,0 +1,96 @@
+# app/scripts/collect_analytics.py
+"""
+Run sharded analytics collection from the command line.
+
+Spawns --workers processes; each connects to DATABASE_URL and claims shards until the run is done.
+Useful to exercise sharding locally against one Postgres, and to add capacity on another node.
+
+    cd backend
+    python -m app.scripts.collect_analytics --shards 16 --workers 4
+    python -m app.scripts.collect_analytics --workers 2 --join     # help with an existing run only
+
+Kill a worker mid-run and start another one: it resumes the abandoned shard from its checkpoint
+once the lease (COLLECT_SHARD_LEASE_SECONDS) expires.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+
+async def _worker_main(index: int):
+    from app.db import db
+    from app.analytics_shards import run_shard_worker, default_worker_id
+    from app.utils.http import close_http_client
+
+    await db.connect()
+    try:
+        results = await run_shard_worker(owner=f"{default_worker_id()}#{index}")
+    finally:
+        await close_http_client()
+        await db.disconnect()
+    accounts = sum(r["accounts"] for r in results)
+    print(json.dumps({"worker": index, "shards": [r["shard"] for r in results], "accounts": accounts}))
+
+
+def _worker(index: int):
+    asyncio.run(_worker_main(index))
+
+
+async def _create_run(shards: int) -> str:
+    from app.db import db
+    from app.analytics_shards import create_collection_run
+
+    await db.connect()
+    try:
+        return await create_collection_run(shards)
+    finally:
+        await db.disconnect()
+
+
+async def _progress(run_id: str):
+    from app.db import db
+    from app.analytics_shards import collection_progress
+
+    await db.connect()
+    try:
+        return await collection_progress(run_id)
+    finally:
+        await db.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded analytics collection")
+    parser.add_argument("--shards", type=int, default=None, help="shard count for a new run (default COLLECT_SHARDS)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--join", action="store_true", help="don't create a run, only work on unfinished shards")
+    args = parser.parse_args()
+
+    run_id = None
+    if not args.join:
+        from app.analytics_shards import COLLECT_SHARDS
+        run_id = asyncio.run(_create_run(args.shards or COLLECT_SHARDS))
+        print(f"run {run_id}")
+
+    started = time.monotonic()
+    procs = [multiprocessing.Process(target=_worker, args=(i,)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    elapsed = time.monotonic() - started
+
+    progress = asyncio.run(_progress(run_id)) if run_id else {}
+    print(json.dumps({
+        "run_id": run_id,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 2),
+        "shards_done": progress.get("done"),
+        "shards_total": progress.get("total"),
+        "accounts_done": progress.get("accounts_done"),
+    }))
+
+
+if __name__ == "__main__":
+    main()
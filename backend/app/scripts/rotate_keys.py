@@ -0,0 +1,43 @@
+# app/scripts/rotate_keys.py
+"""
+Re-encrypt stored secrets with the newest Fernet key from the command line.
+
+    cd backend
+    FERNET_KEYS=<new>,<old> python -m app.scripts.rotate_keys            # open a run (if needed) and work on it
+    python -m app.scripts.rotate_keys --status                           # progress only
+    python -m app.scripts.rotate_keys --force                            # restart a finished run from the start
+
+Running instances work on the same run through their KEY_ROTATION_POLL_SECONDS job; this process
+just adds one more worker. Interrupt it at any time: the next worker resumes from the last checkpoint.
+Remove the old key from FERNET_KEYS once the run is done and rows_unreadable is what you expect.
+"""
+import argparse
+import asyncio
+import json
+
+
+async def _main(status_only: bool, force: bool):
+    from app.db import db
+    from app.key_rotation import start_rotation, run_rotation, rotation_progress
+
+    await db.connect()
+    try:
+        if not status_only:
+            await start_rotation(force=force)
+            for stats in await run_rotation():
+                print(json.dumps(stats))
+        return await rotation_progress()
+    finally:
+        await db.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt stored secrets with the newest Fernet key")
+    parser.add_argument("--status", action="store_true", help="only print progress")
+    parser.add_argument("--force", action="store_true", help="restart a finished run for the current key")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_main(args.status, args.force)), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# app/user_stats.py
+"""
+Per-user dashboard counters (user_stats, see migrations/sql_migrations_v2.sql).
+
+- counters are maintained by database triggers on posts, scheduled_posts, social_accounts
+  and user_api_keys, so every write path keeps them current without application code
+- get_user_stats() is the single primary-key lookup behind /me
+- check_user_stats() compares stored counters with the base tables (user_stats_expected)
+  and, with fix=True, rebuilds the drifted rows via rebuild_user_stats()
+"""
+import json
+from typing import Any, Dict, Optional
+
+from app.db import db
+
+EMPTY_STATS = {"posts_total": 0, "scheduled_pending": 0, "connected_accounts": {}, "ai_keys": []}
+
+
+def _row_to_stats(row) -> Dict[str, Any]:
+    return {
+        "posts_total": row["posts_total"],
+        "scheduled_pending": row["scheduled_pending"],
+        "connected_accounts": json.loads(row["connected_accounts"]),
+        "ai_keys": json.loads(row["ai_keys"]),
+    }
+
+
+async def get_user_stats(user_id: str) -> Dict[str, Any]:
+    row = await db.fetch_one(
+        """
+        SELECT posts_total, scheduled_pending, connected_accounts::text AS connected_accounts, ai_keys::text AS ai_keys
+        FROM user_stats WHERE user_id = :uid
+        """,
+        values={"uid": user_id},
+    )
+    # no row yet: the user has never written anything the triggers count
+    return _row_to_stats(row) if row else dict(EMPTY_STATS)
+
+
+async def check_user_stats(user_id: Optional[str] = None, fix: bool = False, limit: int = 100) -> Dict[str, Any]:
+    """Reports users whose stored counters differ from the base tables; rebuilds them when `fix`."""
+    query = """
+        SELECT e.user_id,
+               s.posts_total AS stored_posts, e.posts_total AS expected_posts,
+               s.scheduled_pending AS stored_pending, e.scheduled_pending AS expected_pending,
+               s.connected_accounts IS DISTINCT FROM e.connected_accounts AS accounts_differ,
+               s.ai_keys IS DISTINCT FROM e.ai_keys AS ai_keys_differ
+        FROM user_stats_expected e
+        LEFT JOIN user_stats s ON s.user_id = e.user_id
+        WHERE (s.posts_total, s.scheduled_pending, s.connected_accounts, s.ai_keys)
+              IS DISTINCT FROM (e.posts_total, e.scheduled_pending, e.connected_accounts, e.ai_keys)
+    """
+    values: Dict[str, Any] = {"lim": limit}
+    if user_id:
+        query += " AND e.user_id = :uid"
+        values["uid"] = user_id
+    query += " ORDER BY e.user_id LIMIT :lim"
+    drifted = [dict(r) for r in await db.fetch_all(query, values=values)]
+
+    result: Dict[str, Any] = {"drifted": len(drifted), "users": drifted}
+    if fix and drifted:
+        if user_id:
+            fixed = await db.fetch_val("SELECT rebuild_user_stats(CAST(:uid AS uuid))", values={"uid": user_id})
+        else:
+            fixed = await db.fetch_val("SELECT rebuild_user_stats()")
+        result["fixed"] = fixed
+    return result
@@ -1,25 +1,60 @@
 # backend/app/utils/crypto.py
 
 import os
-from cryptography.fernet import Fernet
+import hashlib
+from typing import List
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from fastapi import HTTPException
 
+from app.log import get_logger
+
 # --- Initialization ---
 
-# 1. Load the Fernet encryption key from the environment
-# NOTE: The key must be a 32-byte URL-safe base64 encoded string.
+# 1. Load the Fernet keyring from the environment
+# NOTE: Each key must be a 32-byte URL-safe base64 encoded string.
+# FERNET_KEYS is a comma separated list, newest first: new data is encrypted with the first key,
+# and data encrypted with any of the listed keys can still be decrypted. FERNET_KEY (the original
+# single key) keeps working and is appended as the oldest key when it isn't listed in FERNET_KEYS.
+#
+# Rotating: put the new key in front of FERNET_KEYS, deploy, run the re-encryption job
+# (app/key_rotation.py) and remove the old key once the job reports done.
+FERNET_KEYS = [k.strip() for k in os.getenv("FERNET_KEYS", "").split(",") if k.strip()]
 FERNET_KEY = os.getenv("FERNET_KEY")
+if FERNET_KEY and FERNET_KEY.strip() not in FERNET_KEYS:
+    FERNET_KEYS.append(FERNET_KEY.strip())
 
-if not FERNET_KEY:
+if not FERNET_KEYS:
     # This ensures the application fails fast if the key is missing on startup
-    raise RuntimeError("FERNET_KEY environment variable must be set for encryption utilities.")
+    raise RuntimeError("FERNET_KEYS (or FERNET_KEY) environment variable must be set for encryption utilities.")
 
 try:
-    # 2. Initialize the Fernet cipher object
-    fernet = Fernet(FERNET_KEY.encode())
+    # 2. Initialize the keyring; `fernet` encrypts with the newest key and decrypts with any of them
+    _keys = [Fernet(k.encode()) for k in FERNET_KEYS]
+    fernet = MultiFernet(_keys)
+    primary_fernet = _keys[0]
 except Exception as e:
     raise RuntimeError(f"Failed to initialize Fernet cipher: {e}")
 
+
+def key_id(key: str) -> str:
+    """Short, non-secret fingerprint of a key, safe to log and store."""
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+PRIMARY_KEY_ID = key_id(FERNET_KEYS[0])
+KEY_IDS: List[str] = [key_id(k) for k in FERNET_KEYS]
+
+log = get_logger(__name__)
+
+
+def is_current(token: str) -> bool:
+    """True if `token` was encrypted with the newest key (only verifies the HMAC, doesn't decrypt)."""
+    try:
+        primary_fernet.extract_timestamp(token.encode())
+        return True
+    except InvalidToken:
+        return False
+
 # --- Encryption/Decryption Functions ---
 
 def encrypt(data: str) -> str:
@@ -29,7 +64,7 @@ def encrypt(data: str) -> str:
         return fernet.encrypt(data.encode()).decode()
     except Exception as e:
         # Log the actual error, but raise a generic one
-        print(f"Encryption failed: {e}")
+        log.error("encryption failed", extra={"error": repr(e)})
         raise HTTPException(status_code=500, detail="Failed to encrypt data.")
 
 def decrypt(data: str) -> str:
@@ -39,7 +74,7 @@ def decrypt(data: str) -> str:
         return fernet.decrypt(data.encode()).decode()
     except Exception as e:
         # Log the actual error, which might be a bad key or corrupted token
-        print(f"Decryption failed: {e}")
+        log.error("decryption failed", extra={"error": repr(e)})
         raise HTTPException(status_code=500, detail="Failed to decrypt data.")
 
-# --- End of backend/app/utils/crypto.py ---
\ No newline at end of file
+# --- End of backend/app/utils/crypto.py ---
@@ -0,0 +1,28 @@
+# backend/app/utils/cursor.py
+"""
+Opaque keyset-pagination cursors.
+
+A cursor encodes the sort key of the last row a client has seen, e.g. (created_at, id),
+as url-safe base64 JSON. The next page is `WHERE (ts, id) < (:ts, :id)` (or `>` for ascending
+order) instead of OFFSET, so deep pages cost the same as the first one.
+"""
+import base64
+import datetime
+import json
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(ts: Optional[datetime.datetime], key: Any) -> str:
+    raw = json.dumps([ts.isoformat() if ts else None, str(key)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime.datetime], str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.datetime.fromisoformat(ts) if ts else None), key
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
@@ -0,0 +1,56 @@
+# backend/app/utils/metrics.py
+"""
+Small in-process latency histograms.
+
+Fixed upper bounds (seconds), cumulative counts like Prometheus histograms, plus sum / count /
+max, so a snapshot can be served as JSON or rendered in the Prometheus text format.
+Observations are plain integer increments on the event loop thread; no locking needed.
+"""
+import bisect
+from typing import Any, Dict, Optional, Sequence
+
+# 100us .. 10s; pool waits and queries both land in the low buckets when healthy
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Optional[Sequence[float]] = None):
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty or in +Inf)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, total = {}, 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            cumulative[str(bound)] = total
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
@@ -0,0 +1,44 @@
+# backend/app/utils/responses.py
+"""
+orjson-backed JSON responses.
+
+- FastJSONResponse is the app's default_response_class, so every dict an endpoint returns is
+  written with orjson instead of json.dumps
+- FastAPI still runs jsonable_encoder over a returned dict before rendering it, which costs more
+  than the dumps itself on big lists. Listing endpoints therefore return FastJSONResponse(payload)
+  directly: orjson serializes datetime / date / UUID natively, in the same ISO format
+  jsonable_encoder produces
+- types orjson doesn't know (Decimal, asyncpg's Record / Range, ...) go through _default, matching
+  what jsonable_encoder did for them
+
+Measure with `python -m app.scripts.bench_json`.
+"""
+import decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# naive datetimes stay naive (no "+00:00" added), like jsonable_encoder; dict keys may be non-str
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any):
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, "keys"):
+        return dict(obj)
+    return str(obj)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,87 @@
+# backend/app/utils/singleflight.py
+"""
+Single-flight request coalescing with a short-TTL, stale-while-revalidate cache.
+
+- Concurrent callers asking for the same key share one in-flight fetch
+- Fresh results (age < ttl) are served straight from memory
+- Stale results (ttl <= age < ttl + stale_ttl) are served immediately while one
+  background refresh runs; after that window the caller waits for a new fetch
+- Failed fetches are never cached; every waiting caller sees the exception
+- invalidate() drops the entry and detaches a fetch already in flight, so a result read before
+  the change can't be stored after it
+
+The cache is per-process and bounded (LRU), which is enough for dashboards opened in
+several tabs or accounts shared by a team on the same worker.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlightCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # simple counters, handy when checking how much upstream traffic was saved
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "fetches": 0}
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], cacheable: Optional[Callable[[Any], bool]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+
+        async def _run():
+            me = asyncio.current_task()
+            try:
+                value = await fetch()
+                # not stored if the key was invalidated while fetching
+                if self._inflight.get(key) is me and (cacheable is None or cacheable(value)):
+                    self._store(key, value)
+                return value
+            finally:
+                if self._inflight.get(key) is me:
+                    del self._inflight[key]
+
+        self.stats["fetches"] += 1
+        task = asyncio.ensure_future(_run())
+        # a background refresh nobody awaits must not log "exception never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return task
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached value for `key`, or run `fetch()` (once, shared by all concurrent callers).
+        `cacheable(value)` can veto storing a result (e.g. partial responses).
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._start_fetch(key, fetch, cacheable)
+                return entry[1]
+
+        self.stats["misses"] += 1
+        task = self._start_fetch(key, fetch, cacheable)
+        # shield: a caller that disconnects must not cancel the fetch other callers are waiting on
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
@@ -0,0 +1,34 @@
+# backend/app/utils/streaming.py
+"""
+NDJSON streaming exports.
+
+Rows are read with a server-side cursor (db.iterate) and written to the client one JSON line
+at a time, so exporting tens of thousands of rows never builds the whole result in memory.
+An export holds a pool connection for its whole duration; EXPORT_CONCURRENCY bounds how many
+run at once so exports can't starve regular requests of connections.
+"""
+import os
+import json
+import asyncio
+from typing import Any, Dict
+
+from fastapi.responses import StreamingResponse
+
+from app.db import db
+
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "1"))
+_export_slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+
+async def _ndjson_lines(database, query: str, values: Dict[str, Any]):
+    async with _export_slots:
+        async for row in database.iterate(query, values=values):
+            yield json.dumps(dict(row), default=str, separators=(",", ":")) + "\n"
+
+
+def ndjson_response(query: str, values: Dict[str, Any], filename: str, database=db) -> StreamingResponse:
+    return StreamingResponse(
+        _ndjson_lines(database, query, values),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,11 +1,13 @@
 import os
+import datetime
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import RedirectResponse
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
 
+from app.analytics import invalidate_user_analytics
 from app.auth_supabase import verify_supabase_jwt
 from app.db import db
+from app.utils.crypto import encrypt
+from app.providers import lazy_import
 
 router = APIRouter()
 
@@ -21,6 +23,8 @@ SCOPES = [
 ]
 
 def get_flow():
+    # google_auth_oauthlib is only needed for the OAuth round trip; loaded on first use
+    Flow = lazy_import("google_auth_oauthlib.flow").Flow
     return Flow(
         client_type="web",
         client_config={
@@ -67,20 +71,22 @@ async def youtube_callback(request: Request, jwt=Depends(verify_supabase_jwt)):
 
     creds = flow.credentials
 
-    # Store or update YouTube tokens
+    # Store or update YouTube tokens; the access token is encrypted like every other provider's
     await db.execute("""
-        INSERT INTO social_accounts (user_id, platform, access_token, refresh_token, meta)
-        VALUES (:uid, 'youtube', :access, :refresh, :meta)
-        ON CONFLICT (user_id, platform)
+        INSERT INTO social_accounts (user_id, provider, access_token, refresh_token, expires_at, created_at)
+        VALUES (:uid, 'youtube', :access, :refresh, :expires, NOW())
+        ON CONFLICT (user_id, provider)
         DO UPDATE SET
             access_token = EXCLUDED.access_token,
-            refresh_token = EXCLUDED.refresh_token,
-            meta = EXCLUDED.meta
+            refresh_token = COALESCE(EXCLUDED.refresh_token, social_accounts.refresh_token),
+            expires_at = EXCLUDED.expires_at
     """, {
         "uid": user_id,
-        "access": creds.token,
+        "access": encrypt(creds.token),
         "refresh": creds.refresh_token,
-        "meta": {"expires_in": creds.expiry.isoformat() if creds.expiry else None}
+        # google-auth keeps expiry as naive UTC
+        "expires": creds.expiry.replace(tzinfo=datetime.timezone.utc) if creds.expiry else None,
     })
+    invalidate_user_analytics(user_id)
 
     return RedirectResponse("/connected?platform=youtube")
@@ -1,17 +1,22 @@
 import os
+import asyncio
 from fastapi import APIRouter, HTTPException, Depends
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 
 from app.auth_supabase import verify_supabase_jwt
 from app.db import db
+from app.metrics import provider_call
+from app.providers import lazy_import
+from app.analytics import analytics_cache, decrypt_access_token
+from app.utils.responses import FastJSONResponse
 
 router = APIRouter()
 
 
 def get_creds(row):
+    Credentials = lazy_import("google.oauth2.credentials").Credentials
+    # access_token is stored encrypted with the shared keyring; without it google-auth refreshes first
     return Credentials(
-        token=row["access_token"],
+        token=decrypt_access_token(row),
         refresh_token=row["refresh_token"],
         token_uri="https://oauth2.googleapis.com/token",
         client_id=os.getenv("YOUTUBE_CLIENT_ID"),
@@ -23,21 +28,10 @@ def get_creds(row):
     )
 
 
-@router.get("/analytics")
-async def youtube_analytics(jwt=Depends(verify_supabase_jwt)):
-    user_id = jwt.get("sub")
-
-    row = await db.fetch_one("""
-        SELECT access_token, refresh_token
-        FROM social_accounts
-        WHERE user_id = :uid AND platform = 'youtube'
-    """, {"uid": user_id})
-
-    if not row:
-        raise HTTPException(404, "No YouTube account connected")
-
+def _fetch_upload_stats(row):
+    """Blocking googleapiclient calls; run in a worker thread."""
     creds = get_creds(row)
-    service = build("youtube", "v3", credentials=creds)
+    service = lazy_import("googleapiclient.discovery").build("youtube", "v3", credentials=creds)
 
     # Fetch uploads playlist
     channel = service.channels().list(
@@ -64,3 +58,29 @@ async def youtube_analytics(jwt=Depends(verify_supabase_jwt)):
     ).execute()
 
     return {"videos": stats["items"]}
+
+
+async def get_upload_stats(user_id: str):
+    """videos.list items for the user's latest uploads, through the shared single-flight cache."""
+    async def _fetch():
+        row = await db.fetch_one("""
+            SELECT access_token, refresh_token
+            FROM social_accounts
+            WHERE user_id = :uid AND provider = 'youtube'
+        """, {"uid": user_id})
+
+        if not row:
+            raise HTTPException(404, "No YouTube account connected")
+
+        with provider_call("youtube", "upload_stats"):
+            return await asyncio.to_thread(_fetch_upload_stats, row)
+
+    # concurrent tabs for the same user share one upstream fetch (short TTL, stale-while-revalidate)
+    return await analytics_cache.get(("youtube_analytics", user_id), _fetch)
+
+
+@router.get("/analytics")
+async def youtube_analytics(jwt=Depends(verify_supabase_jwt)):
+    user_id = jwt.get("sub")
+    # raw videos.list items: plain JSON already, no need for jsonable_encoder
+    return FastJSONResponse(await get_upload_stats(user_id))
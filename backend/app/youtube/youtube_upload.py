@@ -1,19 +1,27 @@
 import os
-import googleapiclient.http
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-
+from app.analytics import decrypt_access_token
 from app.auth_supabase import verify_supabase_jwt
 from app.db import db
+from app.deadline import budget, check, with_deadline
+from app.media_cache import MediaDownloadError, get_local_media, is_cached_path, pinned
+from app.metrics import provider_call
+from app.providers import lazy_import
 
 router = APIRouter()
 
+# socket timeout for each request to the YouTube API (one upload chunk at most)
+YOUTUBE_HTTP_TIMEOUT = float(os.getenv("YOUTUBE_HTTP_TIMEOUT", "60"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def get_creds(row):
+    # googleapiclient / google-auth are imported on the first YouTube call (app.providers)
+    Credentials = lazy_import("google.oauth2.credentials").Credentials
     return Credentials(
-        token=row["access_token"],
+        token=decrypt_access_token(row),
         refresh_token=row["refresh_token"],
         token_uri="https://oauth2.googleapis.com/token",
         client_id=os.getenv("YOUTUBE_CLIENT_ID"),
@@ -24,6 +32,28 @@ def get_creds(row):
     )
 
 
+def _service(row):
+    # the default httplib2 transport has no timeout; bound it by what is left of the deadline too
+    Http = lazy_import("httplib2").Http
+    AuthorizedHttp = lazy_import("google_auth_httplib2").AuthorizedHttp
+    http = AuthorizedHttp(get_creds(row), http=Http(timeout=budget(YOUTUBE_HTTP_TIMEOUT)))
+    return lazy_import("googleapiclient.discovery").build("youtube", "v3", http=http)
+
+
+def _insert_video(row, media, title, description):
+    """Resumable upload, chunk by chunk; stops between chunks once the deadline has passed."""
+    body = {
+        "snippet": {"title": title, "description": description},
+        "status": {"privacyStatus": "public"},
+    }
+    request = _service(row).videos().insert(part="snippet,status", body=body, media_body=media)
+    response = None
+    while response is None:
+        check()
+        _, response = request.next_chunk()
+    return response
+
+
 @router.post("/upload")
 async def youtube_upload(
     title: str = Form(...),
@@ -36,31 +66,46 @@ async def youtube_upload(
     row = await db.fetch_one("""
         SELECT access_token, refresh_token
         FROM social_accounts
-        WHERE user_id = :uid AND platform = 'youtube'
+        WHERE user_id = :uid AND provider = 'youtube'
     """, {"uid": user_id})
 
     if not row:
         raise HTTPException(404, "No YouTube account connected")
 
-    creds = get_creds(row)
-    service = build("youtube", "v3", credentials=creds)
-
-    body = {
-        "snippet": {"title": title, "description": description},
-        "status": {"privacyStatus": "public"},
-    }
-
-    media = googleapiclient.http.MediaIoBaseUpload(
+    media = lazy_import("googleapiclient.http").MediaIoBaseUpload(
         file.file,
         mimetype=file.content_type,
-        chunksize=1024 * 1024,
+        chunksize=UPLOAD_CHUNK_SIZE,
         resumable=True
     )
 
-    upload = service.videos().insert(
-        part="snippet,status",
-        body=body,
-        media_body=media
-    ).execute()
+    with provider_call("youtube", "upload"):
+        upload = await with_deadline(asyncio.to_thread(_insert_video, row, media, title, description))
 
     return {"status": "uploaded", "video": upload}
+
+
+def _upload_file(row, path, title, description=""):
+    media = lazy_import("googleapiclient.http").MediaFileUpload(path, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    return _insert_video(row, media, title, description)
+
+
+# internal helper used by main.publish_now and the scheduled publisher
+async def upload_from_url_internal(account_row, url, title, local_path=None):
+    if not url:
+        raise HTTPException(400, "video url required")
+    if local_path is not None:
+        # media cache file the scheduled publisher already resolved for `url`
+        if not is_cached_path(local_path):
+            raise HTTPException(500, "local media outside the media cache")
+        path = local_path
+    else:
+        # downloaded into the cache now; only http(s) URLs are accepted
+        try:
+            path = await get_local_media(url)
+        except MediaDownloadError as e:
+            raise HTTPException(400, str(e))
+    # YouTube titles are limited to 100 characters; the full text goes into the description
+    with pinned(path), provider_call("youtube", "upload"):
+        video = await with_deadline(asyncio.to_thread(_upload_file, account_row, path, (title or "Untitled")[:100], title or ""))
+    return {"platform_post_id": video.get("id"), "raw": video}